@@ -0,0 +1,169 @@
+"""Benchmark : agrégation de GET /chantiers, jointure unique vs agrégats par table
+
+Compare, sur un jeu de données généré dans un schéma dédié (`bench_chantiers`,
+supprimé à la fin) :
+- l'ancienne requête : planifications, soldes et verrous joints ensemble puis
+  un seul GROUP BY (planifs x soldes x verrous lignes par chantier) ;
+- la requête actuelle du registre (`prepared_queries.sql("chantiers_liste")`) :
+  chaque table enfant agrégée séparément avant la jointure.
+
+Pour chaque requête : lignes intermédiaires produites par la jointure (EXPLAIN
+ANALYZE), puis latence d'exécution complète (résultat rapatrié). L'ancienne
+requête est bornée par statement_timeout : sur le jeu par défaut elle produit
+plusieurs centaines de millions de lignes.
+
+Usage :
+    DATABASE_URL=postgresql://... python benchmarks/bench_chantiers_aggregation.py \\
+        [chantiers=5000] [semaines=104] [verrous=20] [timeout_s=60]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import psycopg
+
+import prepared_queries
+
+
+SCHEMA = "bench_chantiers"
+
+ANCIENNE_REQUETE = """
+    SELECT
+        c.id,
+        c.label,
+        c.status,
+        c.prepTime,
+        c.endDate,
+        c.preparateur_nom,
+        c.ChargeRestante,
+        COALESCE(
+            json_object_agg(p.semaine, p.minutes) FILTER (WHERE p.semaine IS NOT NULL),
+            '{}'::json
+        ) as planification,
+        COALESCE(
+            json_object_agg(s.semaine, s.minutes) FILTER (WHERE s.semaine IS NOT NULL),
+            '{}'::json
+        ) as soldes,
+        COALESCE(
+            json_object_agg(
+                v.semaine,
+                json_build_object('preparateur', v.preparateur_nom, 'minutes', v.minutes)
+            ) FILTER (WHERE v.semaine IS NOT NULL),
+            '{}'::json
+        ) as forcedPlanningLock
+    FROM chantiers c
+    LEFT JOIN planifications p ON c.id = p.chantier_id
+    LEFT JOIN soldes s ON c.id = s.chantier_id
+    LEFT JOIN verrous_planification v ON c.id = v.chantier_id
+    GROUP BY c.id, c.label, c.status, c.prepTime, c.endDate, c.preparateur_nom, c.ChargeRestante
+    ORDER BY c.id
+"""
+
+
+def generer_donnees(conn, chantiers, semaines, verrous):
+    """Schéma dédié : tables de main (sans clés étrangères) et données synthétiques"""
+    conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    conn.execute(f"SET search_path TO {SCHEMA}")
+    conn.execute("""
+        CREATE TABLE chantiers (
+            id VARCHAR(255) PRIMARY KEY, label VARCHAR(500) NOT NULL, status VARCHAR(100) DEFAULT 'Nouveau',
+            prepTime INTEGER DEFAULT 0, endDate VARCHAR(50), preparateur_nom VARCHAR(255),
+            ChargeRestante INTEGER DEFAULT 0
+        )
+    """)
+    for table, extra in (("planifications", ""), ("soldes", ""),
+                         ("verrous_planification", "preparateur_nom VARCHAR(255) NOT NULL,")):
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                id SERIAL PRIMARY KEY, chantier_id VARCHAR(255) NOT NULL, semaine VARCHAR(50) NOT NULL,
+                {extra} minutes INTEGER NOT NULL DEFAULT 0, UNIQUE (chantier_id, semaine)
+            )
+        """)
+
+    conn.execute("""
+        INSERT INTO chantiers (id, label, prepTime, endDate, preparateur_nom, ChargeRestante)
+        SELECT 'CH' || lpad(i::text, 6, '0'), 'Chantier ' || i, 600, '2026-12-31', 'Prep ' || (i %% 20), 300
+        FROM generate_series(1, %s) AS i
+    """, (chantiers,))
+    # Semaines ISO consécutives sur `semaines` semaines à partir de 2025-W01
+    semaines_sql = """
+        SELECT to_char(date '2024-12-30' + 7 * w, 'IYYY-"W"IW') AS semaine, w
+        FROM generate_series(0, %s - 1) AS w
+    """
+    for table in ("planifications", "soldes"):
+        conn.execute(f"""
+            INSERT INTO {table} (chantier_id, semaine, minutes)
+            SELECT c.id, s.semaine, 60 + s.w FROM chantiers c CROSS JOIN ({semaines_sql}) s
+        """, (semaines,))
+    conn.execute(f"""
+        INSERT INTO verrous_planification (chantier_id, semaine, preparateur_nom, minutes)
+        SELECT c.id, s.semaine, c.preparateur_nom, 120 FROM chantiers c CROSS JOIN ({semaines_sql}) s
+        WHERE s.w < %s
+    """, (semaines, verrous))
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def lignes_jointure(plan):
+    """Lignes produites par le nœud de jointure le plus volumineux du plan"""
+    maximum = 0
+    if "Join" in plan["Node Type"] or plan["Node Type"] == "Nested Loop":
+        maximum = plan["Actual Rows"] * plan.get("Actual Loops", 1)
+    for enfant in plan.get("Plans", []):
+        maximum = max(maximum, lignes_jointure(enfant))
+    return maximum
+
+
+def mesurer(conn, nom, requete, iterations, timeout_s):
+    """EXPLAIN ANALYZE (lignes intermédiaires) puis latence de bout en bout"""
+    conn.execute(f"SET statement_timeout = {int(timeout_s * 1000)}")
+    try:
+        plan = conn.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {requete}").fetchone()[0][0]["Plan"]
+        durees = []
+        for _ in range(iterations):
+            debut = time.perf_counter()
+            lignes = conn.execute(requete).fetchall()
+            durees.append((time.perf_counter() - debut) * 1000)
+    except psycopg.errors.QueryCanceled:
+        print(f"{nom:<26} > {timeout_s:g} s (annulée par statement_timeout)")
+        return None
+    finally:
+        conn.rollback()  # search_path reste celui validé par generer_donnees()
+    print(f"{nom:<26} jointure={lignes_jointure(plan):>12,} lignes  résultat={len(lignes):,} lignes  "
+          f"médiane={statistics.median(durees):9.1f} ms  min={min(durees):9.1f} ms")
+    return statistics.median(durees)
+
+
+def main_bench():
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL non définie")
+        sys.exit(1)
+
+    args = [float(a) for a in sys.argv[1:]]
+    chantiers, semaines, verrous = (int(v) for v in (args + [5000, 104, 20][len(args):])[:3])
+    timeout_s = args[3] if len(args) > 3 else 60
+    sslmode = os.environ.get("DATABASE_SSLMODE", "require")
+
+    with psycopg.connect(database_url, sslmode=sslmode) as conn:
+        print(f"🏗️  {chantiers:,} chantiers x {semaines} semaines de planifications et soldes, {verrous} verrous / chantier")
+        generer_donnees(conn, chantiers, semaines, verrous)
+        theorique = chantiers * semaines * semaines * max(verrous, 1)
+        print(f"   lignes intermédiaires attendues avec l'ancienne jointure : {theorique:,}\n")
+        try:
+            ancienne = mesurer(conn, "Jointure + GROUP BY", ANCIENNE_REQUETE, 1, timeout_s)
+            nouvelle = mesurer(conn, "Agrégats par table", prepared_queries.sql("chantiers_liste"), 5, timeout_s)
+            if ancienne and nouvelle:
+                print(f"\n⚡ Gain : x{ancienne / nouvelle:.1f}")
+        finally:
+            conn.rollback()
+            conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,113 @@
+"""Benchmark : sérialisation JSON des grosses réponses, FastAPI par défaut vs classe configurée
+
+Compare, sur des contenus générés au format des réponses de `/chantiers` et
+`/etiquettes-grille` (pas de base de données nécessaire) :
+- le chemin FastAPI par défaut : jsonable_encoder puis JSONResponse ;
+- jsonable_encoder puis la classe de réponse configurée (main.JSON_RESPONSE_CLASS,
+  classe par défaut de tous les routers) ;
+- main.reponse_contenu() : sérialisation directe par la classe configurée,
+  sans jsonable_encoder (chemins des grosses listes) ;
+- la même sérialisation directe par le json standard (repli sans orjson).
+
+Chaque sortie est comparée octet pour octet à celle de FastAPI.
+
+Usage :
+    python benchmarks/bench_json_serializers.py [chantiers=2000] [semaines=104] [etiquettes=5000] [iterations=5]
+"""
+import os
+import sys
+import time
+import statistics
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import main
+
+
+def semaines_iso(nombre):
+    """Semaines ISO consécutives à partir de 2025-W01"""
+    debut = datetime(2024, 12, 30)
+    return [(debut + timedelta(weeks=w)).strftime("%G-W%V") for w in range(nombre)]
+
+
+def contenu_chantiers(chantiers, semaines):
+    """Dictionnaire {id: chantier} de GET /chantiers (planifications, soldes, 20 verrous)"""
+    liste_semaines = semaines_iso(semaines)
+    return {
+        f"CH{i:06d}": {
+            "id": f"CH{i:06d}",
+            "label": f"Chantier {i} - Poste «Sud»",
+            "status": "En cours",
+            "prepTime": 600,
+            "endDate": "2026-12-31",
+            "preparateur": f"Préparateur {i % 20}",
+            "ChargeRestante": 300,
+            "planification": {s: 60 + w for w, s in enumerate(liste_semaines)},
+            "soldes": {s: 30 for s in liste_semaines},
+            "forcedPlanningLock": {s: {"preparateur": f"Préparateur {i % 20}", "minutes": 120}
+                                   for s in liste_semaines[:20]}
+        }
+        for i in range(chantiers)
+    }
+
+
+def contenu_etiquettes(etiquettes):
+    """Réponse de GET /etiquettes-grille (5 planifications par étiquette, dates en isoformat())"""
+    creation = datetime(2025, 1, 6, 8, 30, 12, 123456, tzinfo=timezone.utc)
+    liste = []
+    for i in range(etiquettes):
+        liste.append({
+            "id": i,
+            "type_activite": "Formation",
+            "description": f"Session {i} : sécurité électrique",
+            "group_id": f"grp-{i // 5}",
+            "texte": "",
+            "created_at": (creation + timedelta(minutes=i)).isoformat(),
+            "updated_at": (creation + timedelta(minutes=i)).isoformat(),
+            "planifications": [
+                {"id": i * 5 + j, "date_jour": f"2025-03-{j + 1:02d}", "heure_debut": "08:00:00",
+                 "heure_fin": "12:00:00", "preparateurs": "Alice,Bob"}
+                for j in range(5)
+            ]
+        })
+    return {"status": "✅ Étiquettes récupérées", "count": len(liste), "etiquettes": liste}
+
+
+def mesurer(nom, iterations, serialiser, reference):
+    """Médiane de `serialiser()` (ms) et comparaison octet pour octet à la référence"""
+    durees = []
+    for _ in range(iterations):
+        debut = time.perf_counter()
+        corps = serialiser()
+        durees.append((time.perf_counter() - debut) * 1000)
+    identique = "identique" if reference is None or corps == reference else "DIFFÉRENT"
+    print(f"  {nom:<38} médiane={statistics.median(durees):9.1f} ms  {identique}")
+    return corps
+
+
+def comparer(titre, contenu, iterations):
+    classe = main.JSON_RESPONSE_CLASS.__name__
+    reference = JSONResponse(jsonable_encoder(contenu)).body
+    print(f"\n📦 {titre} : {len(reference) / 1e6:.1f} Mo (classe configurée : {classe})")
+    mesurer("jsonable_encoder + JSONResponse", iterations, lambda: JSONResponse(jsonable_encoder(contenu)).body, reference)
+    mesurer(f"jsonable_encoder + {classe}", iterations,
+            lambda: main.JSON_RESPONSE_CLASS(jsonable_encoder(contenu)).body, reference)
+    mesurer("reponse_contenu()", iterations, lambda: main.reponse_contenu(Response(), contenu).body, reference)
+    mesurer("ReponseJSONStandard directe", iterations, lambda: main.ReponseJSONStandard(contenu).body, reference)
+
+
+def main_bench():
+    args = [int(a) for a in sys.argv[1:]]
+    chantiers, semaines, etiquettes, iterations = (args + [2000, 104, 5000, 5][len(args):])[:4]
+    comparer(f"/chantiers ({chantiers:,} chantiers x {semaines} semaines)",
+             contenu_chantiers(chantiers, semaines), iterations)
+    comparer(f"/etiquettes-grille ({etiquettes:,} étiquettes)", contenu_etiquettes(etiquettes), iterations)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,159 @@
+"""Benchmark : WAL produit par PUT /planification, purge + réinsertion vs écriture différentielle
+
+Compare, sur un jeu de données généré dans un schéma dédié (`bench_planification`,
+supprimé à la fin), pour des éditions qui ne modifient que quelques semaines
+d'une planification :
+- l'ancienne écriture : suppression de toutes les semaines du périmètre
+  preserve_past, puis un upsert par semaine ;
+- la requête actuelle du registre (`prepared_queries.sql("planification_fusionner")`) :
+  seules les semaines ajoutées, modifiées ou retirées sont écrites.
+
+Pour chaque stratégie : octets de WAL par édition (pg_current_wal_lsn avant et
+après, commit compris) et latence médiane. Le WAL est mesuré sur tout le
+cluster : lancer le benchmark sur une base sans autre activité.
+
+Usage :
+    DATABASE_URL=postgresql://... python benchmarks/bench_planification_wal.py \\
+        [chantiers=500] [semaines=104] [modifiees=1] [editions=200]
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import psycopg
+
+import prepared_queries
+
+
+SCHEMA = "bench_planification"
+
+# Toutes les semaines générées sont dans le futur : le périmètre preserve_past
+# couvre la planification entière, comme pour un chantier à venir
+SEMAINE_COURANTE = "2000-W01"
+
+ANCIENNE_SUPPRESSION = "DELETE FROM planifications WHERE chantier_id = %s AND semaine >= %s"
+
+ANCIEN_UPSERT = """
+    INSERT INTO planifications (chantier_id, semaine, minutes)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (chantier_id, semaine)
+    DO UPDATE SET minutes = EXCLUDED.minutes
+"""
+
+
+def generer_donnees(conn, chantiers, semaines):
+    """Schéma dédié : chantiers et planifications de main, données synthétiques"""
+    conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    conn.execute(f"SET search_path TO {SCHEMA}")
+    conn.execute("CREATE TABLE chantiers (id VARCHAR(255) PRIMARY KEY, label VARCHAR(500) NOT NULL)")
+    conn.execute("""
+        CREATE TABLE planifications (
+            id SERIAL PRIMARY KEY,
+            chantier_id VARCHAR(255) NOT NULL REFERENCES chantiers(id) ON DELETE CASCADE,
+            semaine VARCHAR(50) NOT NULL, minutes INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (chantier_id, semaine)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO chantiers (id, label)
+        SELECT 'CH' || lpad(i::text, 6, '0'), 'Chantier ' || i FROM generate_series(1, %s) AS i
+    """, (chantiers,))
+    conn.execute("""
+        INSERT INTO planifications (chantier_id, semaine, minutes)
+        SELECT c.id, to_char(date '2029-12-31' + 7 * w, 'IYYY-"W"IW'), 60 + w
+        FROM chantiers c CROSS JOIN generate_series(0, %s - 1) AS w
+    """, (semaines,))
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def lire_planification(conn, chantier_id):
+    return dict(conn.execute(
+        "SELECT semaine, minutes FROM planifications WHERE chantier_id = %s", (chantier_id,)
+    ).fetchall())
+
+
+def editions(conn, chantiers, modifiees, nombre, graine):
+    """Éditions reproductibles : `modifiees` semaines changent de valeur, les autres sont renvoyées telles quelles"""
+    hasard = random.Random(graine)
+    ids = [f"CH{i:06d}" for i in range(1, chantiers + 1)]
+    resultat = []
+    for _ in range(nombre):
+        chantier_id = hasard.choice(ids)
+        carte = lire_planification(conn, chantier_id)
+        for semaine in hasard.sample(sorted(carte), min(modifiees, len(carte))):
+            carte[semaine] += hasard.randint(1, 30)
+        resultat.append((chantier_id, carte))
+    conn.rollback()
+    return resultat
+
+
+def ecrire_ancien(conn, chantier_id, carte):
+    with conn.cursor() as cur:
+        cur.execute(ANCIENNE_SUPPRESSION, (chantier_id, SEMAINE_COURANTE))
+        cur.executemany(ANCIEN_UPSERT, [(chantier_id, s, m) for s, m in carte.items() if m > 0])
+
+
+def ecrire_differentiel(conn, chantier_id, carte):
+    semaines = [s for s, m in carte.items() if m > 0]
+    conn.execute(prepared_queries.sql("planification_fusionner"), (
+        [chantier_id], [True], [chantier_id] * len(semaines), semaines,
+        [carte[s] for s in semaines], SEMAINE_COURANTE
+    ))
+
+
+def mesurer(conn, nom, ecrire, liste):
+    """WAL moyen par édition (commit compris) et latence médiane"""
+    debut_lsn = conn.execute("SELECT pg_current_wal_lsn()").fetchone()[0]
+    conn.rollback()
+    durees = []
+    for chantier_id, carte in liste:
+        debut = time.perf_counter()
+        ecrire(conn, chantier_id, carte)
+        conn.commit()
+        durees.append((time.perf_counter() - debut) * 1000)
+    octets = conn.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (debut_lsn,)).fetchone()[0]
+    conn.rollback()
+    par_edition = float(octets) / len(liste)
+    print(f"{nom:<28} WAL={par_edition:>10,.0f} octets/édition  médiane={statistics.median(durees):7.2f} ms")
+    return par_edition
+
+
+def main_bench():
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL non définie")
+        sys.exit(1)
+
+    args = [int(a) for a in sys.argv[1:]]
+    chantiers, semaines, modifiees, nombre = (args + [500, 104, 1, 200][len(args):])[:4]
+    sslmode = os.environ.get("DATABASE_SSLMODE", "require")
+
+    with psycopg.connect(database_url, sslmode=sslmode) as conn:
+        print(f"🏗️  {chantiers:,} chantiers x {semaines} semaines, {nombre} éditions de {modifiees} semaine(s)\n")
+        generer_donnees(conn, chantiers, semaines)
+        try:
+            # Mêmes éditions pour les deux stratégies, rejouées sur le même état de départ
+            liste = editions(conn, chantiers, modifiees, nombre, 1)
+            ancien = mesurer(conn, "Purge + réinsertion", ecrire_ancien, liste)
+            attendu = {c: lire_planification(conn, c) for c, _ in liste}
+            conn.rollback()
+            generer_donnees(conn, chantiers, semaines)
+            nouveau = mesurer(conn, "Écriture différentielle", ecrire_differentiel, liste)
+            identique = all(lire_planification(conn, c) == carte for c, carte in attendu.items())
+            conn.rollback()
+            print(f"\n{'✅' if identique else '❌'} Planifications finales {'identiques' if identique else 'DIFFÉRENTES'}")
+            print(f"⚡ WAL divisé par {ancien / nouveau:.1f}")
+        finally:
+            conn.rollback()
+            conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main_bench()
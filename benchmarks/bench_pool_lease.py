@@ -0,0 +1,69 @@
+"""Benchmark : coût de connexion par requête, connexion directe vs bail sur le pool
+
+Compare, sur N itérations d'un `SELECT 1` :
+- une connexion `psycopg.connect()` ouverte puis fermée à chaque requête
+  (ancien comportement de repli, avec handshake TCP/TLS à chaque fois) ;
+- un bail `db_session()` sur le pool psycopg3 initialisé par main.
+
+Usage :
+    DATABASE_URL=postgresql://... python benchmarks/bench_pool_lease.py [iterations]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import psycopg
+
+import main
+
+
+def mesurer(nom, iterations, operation):
+    """Exécuter `operation` N fois et afficher les latences (ms)"""
+    durees = []
+    for _ in range(iterations):
+        debut = time.perf_counter()
+        operation()
+        durees.append((time.perf_counter() - debut) * 1000)
+    durees.sort()
+    p95 = durees[int(len(durees) * 0.95) - 1]
+    print(f"{nom:<28} moyenne={statistics.mean(durees):7.3f} ms  "
+          f"médiane={statistics.median(durees):7.3f} ms  p95={p95:7.3f} ms")
+    return statistics.mean(durees)
+
+
+def main_bench():
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL non définie")
+        sys.exit(1)
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sslmode = os.environ.get("DATABASE_SSLMODE", "require")
+
+    def connexion_directe():
+        with psycopg.connect(database_url, sslmode=sslmode) as conn:
+            conn.execute("SELECT 1").fetchone()
+
+    def bail_pool():
+        with main.db_session() as conn:
+            conn.execute("SELECT 1").fetchone()
+
+    main.init_connection_pool()
+    if not main.connection_pools:
+        print("❌ Pool indisponible")
+        sys.exit(1)
+    main.connection_pools["write"].wait()
+
+    print(f"🔬 {iterations} requêtes SELECT 1\n")
+    direct = mesurer("psycopg.connect() / requête", iterations, connexion_directe)
+    pool = mesurer("db_session() (pool)", iterations, bail_pool)
+    print(f"\n⚡ Gain par requête : {direct - pool:.3f} ms (x{direct / pool:.1f})")
+
+    main.close_connection_pools()
+
+
+if __name__ == "__main__":
+    main_bench()
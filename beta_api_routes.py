@@ -9,9 +9,13 @@ Ce module contient toutes les routes relatives à :
 - Les soldes des chantiers
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Optional, Any
-from main import get_db_connection, close_db_connection
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import Dict, List, Optional, Any
+import json
+import prepared_queries
+from database_config import execute_many, execute_query
+from disponibilite import valider_format_semaine
+from main import CHANGE_TOKEN_HEADER, champs_demandes, NEXT_CURSOR_HEADER, QUERY_BUDGET_ERRORS, copy_lignes, execute_pipeline, reponse_contenu, reponse_json, reponse_ndjson, verifier_etag, verifier_etag_async, get_read_db, get_readonly_db, get_write_db, get_admin_db, get_async_readonly_db, get_async_write_db, DB_ASYNC_ENABLED, DB_JSON_SQL_ENABLED
 
 
 # Créer le router pour les routes Beta-API
@@ -30,40 +34,31 @@ router = APIRouter(
 # Preparateurs
 
 @router.get("/preparateurs")
-def get_preparateurs():
+def get_preparateurs(request: Request, response: Response, conn=Depends(get_readonly_db)):
     """Récupérer tous les préparateurs depuis PostgreSQL"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        non_modifie = verifier_etag(request, response, conn, ("preparateurs",))
+        if non_modifie:
+            return non_modifie
         
-        cur.execute("SELECT nom, nni FROM preparateurs ORDER BY nom")
-        rows = cur.fetchall()
+        rows = execute_query("SELECT nom, nni FROM preparateurs ORDER BY nom", fetch="all", conn=conn)
 
         # Convertir en dictionnaire nom -> nni
         preparateurs = {row[0]: row[1] for row in rows}
         
         return preparateurs
         
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
     except Exception as e:
         print(f"🚨 Erreur GET /preparateurs: {str(e)}")
         return {"error": f"Erreur base de données: {str(e)}"}
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.post("/preparateurs")
-def sync_preparateurs(preparateurs_data: Dict[str, Any]):
+def sync_preparateurs(preparateurs_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Synchroniser les préparateurs avec PostgreSQL (optimisé)"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         preparateurs = preparateurs_data.get('preparateurs', {})
         
         if not preparateurs:
@@ -72,32 +67,21 @@ def sync_preparateurs(preparateurs_data: Dict[str, Any]):
         # ✅ OPTIMISATION : Bulk insert avec executemany()
         preparateurs_data_list = [(nom, nni) for nom, nni in preparateurs.items()]
         
-        cur.executemany("""
+        execute_many("""
             INSERT INTO preparateurs (nom, nni) 
             VALUES (%s, %s) 
             ON CONFLICT (nom) DO UPDATE SET nni = EXCLUDED.nni
-        """, preparateurs_data_list)
-        
-        conn.commit()
+        """, preparateurs_data_list, conn=conn, commit=True)
 
         return {"status": "✅ Préparateurs synchronisés", "count": len(preparateurs_data_list)}
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.put("/preparateurs/{ancien_nom}")
-def update_preparateur(ancien_nom: str, preparateur_data: Dict[str, Any]):
+def update_preparateur(ancien_nom: str, preparateur_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Modifier un préparateur (nom et/ou NNI) avec mise à jour en cascade"""
-    conn = None
     try:
         nouveau_nom = preparateur_data.get('nom', ancien_nom)
         nouveau_nni = preparateur_data.get('nni')
@@ -105,39 +89,36 @@ def update_preparateur(ancien_nom: str, preparateur_data: Dict[str, Any]):
         if not nouveau_nni:
             raise HTTPException(status_code=400, detail="NNI requis")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Vérifier que l'ancien préparateur existe
-        cur.execute("SELECT nom FROM preparateurs WHERE nom = %s", (ancien_nom,))
-        if not cur.fetchone():
+        # Vérifier en un seul aller-retour que l'ancien préparateur existe
+        # et (si le nom change) que le nouveau nom n'existe pas déjà
+        ancien_cur, nouveau_cur = execute_pipeline(conn, [
+            ("SELECT nom FROM preparateurs WHERE nom = %s", (ancien_nom,)),
+            ("SELECT nom FROM preparateurs WHERE nom = %s", (nouveau_nom,)),
+        ])
+        if not ancien_cur.fetchone():
             raise HTTPException(status_code=404, detail=f"Préparateur '{ancien_nom}' non trouvé")
         
-        # Si le nom change, vérifier que le nouveau nom n'existe pas déjà
-        if ancien_nom != nouveau_nom:
-            cur.execute("SELECT nom FROM preparateurs WHERE nom = %s", (nouveau_nom,))
-            if cur.fetchone():
-                raise HTTPException(status_code=409, detail=f"Le préparateur '{nouveau_nom}' existe déjà")
+        if ancien_nom != nouveau_nom and nouveau_cur.fetchone():
+            raise HTTPException(status_code=409, detail=f"Le préparateur '{nouveau_nom}' existe déjà")
         
         if ancien_nom != nouveau_nom:
+            # Renommage en cascade, en un seul aller-retour :
             # 1. Créer le nouveau préparateur
-            cur.execute("INSERT INTO preparateurs (nom, nni) VALUES (%s, %s)", (nouveau_nom, nouveau_nni))
-            
             # 2. Mettre à jour les chantiers pour pointer vers le nouveau préparateur
-            cur.execute("UPDATE chantiers SET preparateur_nom = %s WHERE preparateur_nom = %s", (nouveau_nom, ancien_nom))
-            chantiers_updated = cur.rowcount
-            
             # 3. Mettre à jour les disponibilités pour pointer vers le nouveau préparateur
-            cur.execute("UPDATE disponibilites SET preparateur_nom = %s WHERE preparateur_nom = %s", (nouveau_nom, ancien_nom))
-            disponibilites_updated = cur.rowcount
-            
             # 4. Supprimer l'ancien préparateur (maintenant plus référencé)
-            cur.execute("DELETE FROM preparateurs WHERE nom = %s", (ancien_nom,))
-            preparateur_updated = cur.rowcount
+            _, chantiers_cur, disponibilites_cur, preparateur_cur = execute_pipeline(conn, [
+                ("INSERT INTO preparateurs (nom, nni) VALUES (%s, %s)", (nouveau_nom, nouveau_nni)),
+                ("UPDATE chantiers SET preparateur_nom = %s WHERE preparateur_nom = %s", (nouveau_nom, ancien_nom)),
+                ("UPDATE disponibilites SET preparateur_nom = %s WHERE preparateur_nom = %s", (nouveau_nom, ancien_nom)),
+                ("DELETE FROM preparateurs WHERE nom = %s", (ancien_nom,)),
+            ])
+            chantiers_updated = chantiers_cur.rowcount
+            disponibilites_updated = disponibilites_cur.rowcount
+            preparateur_updated = preparateur_cur.rowcount
         else:
             # Si seul le NNI change, mise à jour simple
-            cur.execute("UPDATE preparateurs SET nni = %s WHERE nom = %s", (nouveau_nni, ancien_nom))
-            preparateur_updated = cur.rowcount
+            preparateur_updated = execute_query("UPDATE preparateurs SET nni = %s WHERE nom = %s", (nouveau_nni, ancien_nom), conn=conn)
             chantiers_updated = 0
             disponibilites_updated = 0
         
@@ -153,42 +134,31 @@ def update_preparateur(ancien_nom: str, preparateur_data: Dict[str, Any]):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.delete("/preparateurs/{nom}")
-def delete_preparateur(nom: str):
-    """Supprimer un préparateur de PostgreSQL"""
-    conn = None
+def delete_preparateur(nom: str, conn=Depends(get_write_db)):
+    """Supprimer un préparateur de PostgreSQL
+
+    Tables verrouillées dans le même ordre que le renommage (PUT
+    /preparateurs/{ancien_nom}) : chantiers, disponibilités puis préparateur.
+    Une suppression et un renommage simultanés s'attendent au lieu de
+    s'interbloquer.
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Mettre les chantiers assignés à ce préparateur comme non-assignés
+        chantiers_updated = execute_query(
+            "UPDATE chantiers SET preparateur_nom = NULL WHERE preparateur_nom = %s", (nom,), conn=conn
+        )
         
-        # Supprimer d'abord les disponibilités liées à ce préparateur
-        cur.execute("DELETE FROM disponibilites WHERE preparateur_nom = %s", (nom,))
-        disponibilites_deleted = cur.rowcount
+        # Supprimer les disponibilités liées à ce préparateur
+        disponibilites_deleted = execute_query("DELETE FROM disponibilites WHERE preparateur_nom = %s", (nom,), conn=conn)
         
         # Supprimer le préparateur
-        cur.execute("DELETE FROM preparateurs WHERE nom = %s", (nom,))
-        preparateur_deleted = cur.rowcount
-        
-        # Mettre les chantiers assignés à ce préparateur comme non-assignés
-        cur.execute("UPDATE chantiers SET preparateur_nom = NULL WHERE preparateur_nom = %s", (nom,))
-        chantiers_updated = cur.rowcount
-        
-        conn.commit()
+        preparateur_deleted = execute_query("DELETE FROM preparateurs WHERE nom = %s", (nom,), conn=conn, commit=True)
 
         if preparateur_deleted > 0:
             return {
@@ -201,108 +171,511 @@ def delete_preparateur(nom: str):
             return {"status": "⚠️ Préparateur non trouvé", "nom": nom}
             
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 # Chantiers
 
-@router.get("/chantiers")
-def get_chantiers():
-    """Récupérer tous les chantiers depuis PostgreSQL avec optimisation SQL"""
-    conn = None
+def _chantier_depuis_ligne(row):
+    """Mettre en forme une ligne de la requête chantiers_liste"""
+    # ✅ Plus de traitement Python complexe !
+    return {
+        "id": row[0],
+        "label": row[1] or "",
+        "status": row[2] or "Nouveau", 
+        "prepTime": row[3] or 0,
+        "endDate": row[4] or "",
+        "preparateur": row[5] or None,
+        "ChargeRestante": row[6] or 0,
+        "planification": row[7],      # ← Déjà au format JSON !
+        "soldes": row[8],             # ← Déjà au format JSON !
+        "forcedPlanningLock": row[9]  # ← Déjà au format JSON !
+    }
+
+
+def _chantiers_depuis_lignes(rows):
+    """Mettre en forme les lignes de la requête chantiers_liste en dictionnaire {id: chantier}"""
+    return {row[0]: _chantier_depuis_ligne(row) for row in rows}
+
+
+def _chantiers_depuis_documents(rows):
+    """Lignes (id, document) de chantier_documents en dictionnaire {id: chantier}"""
+    return {row[0]: row[1] for row in rows}
+
+
+def _documents_absents(e):
+    """Table chantier_documents pas encore créée (POST /admin/create-all-tables non relancé)"""
+    return (getattr(e, "sqlstate", None) or getattr(e, "pgcode", None)) == "42P01"
+
+
+# Tables lues par GET /chantiers (ETag de la réponse)
+CHANTIERS_TABLES = ("chantiers", "planifications", "soldes", "verrous_planification")
+
+# Pagination par curseur (keyset sur id) et filtres de GET /chantiers.
+# Sans aucun paramètre, la réponse complète historique (Beta-API.html) est conservée.
+CHANTIERS_PAGE_MAX = 1000
+
+# Documents précalculés (chantier_documents) des chantiers retenus
+CHANTIERS_DOCUMENTS_SELECT = """
+    SELECT c.id, d.document
+    FROM chantiers c
+    JOIN chantier_documents d ON d.chantier_id = c.id
+"""
+
+# Champs agrégés depuis les tables enfants (déjà présents dans chantier_documents) :
+# table, alias et valeur associée à chaque semaine
+CHANTIERS_ENFANTS = {
+    "planification": ("planifications", "p", "p.minutes"),
+    "soldes": ("soldes", "s", "s.minutes"),
+    "forcedPlanningLock": ("verrous_planification", "v",
+                           "json_build_object('preparateur', v.preparateur_nom, 'minutes', v.minutes)"),
+}
+
+
+def _agregat_enfant(champ, fenetre=False):
+    """Sous-requête corrélée d'un champ enfant (index uniques (chantier_id, semaine))
+
+    fenetre=True : semaines bornées par deux paramètres (from_week, to_week),
+    parcourues en range scan sur ces mêmes index.
+    """
+    table, alias, valeur = CHANTIERS_ENFANTS[champ]
+    condition = f" AND {alias}.semaine >= %s AND {alias}.semaine <= %s" if fenetre else ""
+    return f"""COALESCE((SELECT json_object_agg({alias}.semaine, {valeur} ORDER BY {alias}.semaine)
+                  FROM {table} {alias} WHERE {alias}.chantier_id = c.id{condition}), '{{}}'::json)"""
+
+
+# Champs d'un chantier (ordre de la réponse) et leur expression SQL. Les
+# enfants sont agrégés par sous-requête corrélée : seuls les chantiers retenus
+# lisent leurs planifications, soldes et verrous, et seulement si le champ est
+# demandé (?fields=).
+CHANTIERS_CHAMPS = {
+    "id": "c.id",
+    "label": "c.label",
+    "status": "c.status",
+    "prepTime": "c.prepTime",
+    "endDate": "c.endDate",
+    "preparateur": "c.preparateur_nom",
+    "ChargeRestante": "c.ChargeRestante",
+    **{champ: _agregat_enfant(champ) for champ in CHANTIERS_ENFANTS},
+}
+
+# Valeurs de remplacement des colonnes vides (comme _chantier_depuis_ligne)
+CHANTIERS_DEFAUTS = {"label": "", "status": "Nouveau", "prepTime": 0, "endDate": "", "preparateur": None, "ChargeRestante": 0}
+
+
+def _select_chantiers(champs, documents=False, fenetre=False):
+    """SELECT des seuls champs demandés (id en tête : clé de la réponse et du curseur)
+
+    documents=True : les champs enfants sont extraits du document précalculé
+    (une jointure sur la clé) au lieu d'agréger les tables enfants. Sans
+    champ enfant, ni document ni table enfant n'est lu. fenetre=True : voir
+    _agregat_enfant() (deux paramètres par champ enfant).
+    """
+    documents = documents and not fenetre and any(champ in CHANTIERS_ENFANTS for champ in champs)
+    colonnes = ",\n        ".join(
+        (f"d.document->'{champ}'" if documents else _agregat_enfant(champ, fenetre))
+        if champ in CHANTIERS_ENFANTS else CHANTIERS_CHAMPS[champ]
+        for champ in champs
+    )
+    jointure = "\n    JOIN chantier_documents d ON d.chantier_id = c.id" if documents else ""
+    return f"""
+    SELECT
+        {colonnes}
+    FROM chantiers c{jointure}
+"""
+
+
+def _chantiers_projetes(champs):
+    """Mise en forme {id: chantier} des lignes de _select_chantiers(champs)"""
+    def convertir(rows):
+        return {
+            row[0]: {
+                champ: (valeur or CHANTIERS_DEFAUTS[champ]) if champ in CHANTIERS_DEFAUTS else valeur
+                for champ, valeur in zip(champs, row)
+            }
+            for row in rows
+        }
+    return convertir
+
+
+# Repli sans chantier_documents : tous les champs (mêmes colonnes que chantiers_liste)
+CHANTIERS_FILTRES_SELECT = _select_chantiers(tuple(CHANTIERS_CHAMPS))
+
+
+def _filtres_chantiers(
+    status: Optional[List[str]] = Query(None, description="Statut(s) à retenir (paramètre répétable)"),
+    preparateur: Optional[List[str]] = Query(None, description="Préparateur(s) assigné(s) (paramètre répétable)"),
+    ids: Optional[List[str]] = Query(None, description="Identifiants, répétés ou séparés par des virgules"),
+    end_date_from: Optional[str] = Query(None, description="endDate minimale incluse (AAAA-MM-JJ)"),
+    end_date_to: Optional[str] = Query(None, description="endDate maximale incluse (AAAA-MM-JJ)"),
+    after: Optional[str] = Query(None, description="Curseur : id du dernier chantier de la page précédente"),
+    limit: Optional[int] = Query(None, ge=1, le=CHANTIERS_PAGE_MAX, description="Taille de page"),
+    since: Optional[str] = Query(None, description="Jeton X-Change-Token d'une réponse précédente : seuls les changements depuis"),
+    from_week: Optional[str] = Query(None, description="Première semaine incluse (YYYY-Www) de planification, soldes et forcedPlanningLock"),
+    to_week: Optional[str] = Query(None, description="Dernière semaine incluse (YYYY-Www) de planification, soldes et forcedPlanningLock"),
+    fields: Optional[List[str]] = Query(None, description="Champs à renvoyer, répétés ou séparés par des virgules (id toujours inclus)")
+):
+    """Dépendance : filtres et pagination de GET /chantiers (None si aucun paramètre)"""
+    if since is not None and not since.isdigit():
+        raise HTTPException(status_code=400, detail="Jeton 'since' invalide")
+    if since is not None and limit is not None:
+        raise HTTPException(status_code=400, detail="'since' et 'limit' ne peuvent pas être combinés")
+    for semaine in (from_week, to_week):
+        if semaine is not None and not valider_format_semaine(semaine):
+            raise HTTPException(status_code=400, detail=f"Format de semaine invalide: {semaine}. Utilisez YYYY-WXX (ex: 2025-W35)")
+    if from_week is not None and to_week is not None and from_week > to_week:
+        raise HTTPException(status_code=400, detail="'from_week' doit précéder 'to_week'")
+    filtres = {
+        "status": status,
+        "preparateur": preparateur,
+        "ids": [i.strip() for valeur in ids for i in valeur.split(",") if i.strip()] if ids else None,
+        "end_date_from": end_date_from,
+        "end_date_to": end_date_to,
+        "after": after,
+        "limit": limit,
+        "since": since,
+        "from_week": from_week,
+        "to_week": to_week,
+        "fields": champs_demandes(fields, tuple(CHANTIERS_CHAMPS)),
+    }
+    return filtres if any(v is not None for v in filtres.values()) else None
+
+
+# Conditions SQL des filtres de GET /chantiers (un paramètre chacune)
+CHANTIERS_CONDITIONS = (
+    ("ids", "c.id = ANY(%s)"),
+    ("status", "c.status = ANY(%s)"),                   # idx_chantiers_status
+    ("preparateur", "c.preparateur_nom = ANY(%s)"),     # idx_chantiers_preparateur
+    ("end_date_from", "c.endDate >= %s"),
+    ("end_date_to", "c.endDate <= %s"),
+    ("after", "c.id > %s"),                             # keyset sur la clé primaire
+    ("since", "c.change_xid >= %s::xid8"),              # idx_chantiers_change_xid
+)
+
+
+def _conditions_chantiers(filtres, exclues=()):
+    """Conditions et paramètres des filtres renseignés (hors clés exclues)"""
+    conditions, params = [], []
+    for cle, condition in CHANTIERS_CONDITIONS:
+        if cle not in exclues and filtres[cle] is not None:
+            conditions.append(condition)
+            params.append(filtres[cle])
+    return conditions, params
+
+
+def _requete_chantiers_filtres(filtres, select=CHANTIERS_DOCUMENTS_SELECT, params_select=()):
+    """Requête paramétrée des chantiers filtrés, ordonnés par id (limit + 1 pour détecter la page suivante)
+
+    params_select : paramètres du SELECT lui-même, placés avant ceux des filtres.
+    """
+    conditions, params_filtres = _conditions_chantiers(filtres)
+    params = list(params_select) + params_filtres
+    
+    query = select
+    if conditions:
+        query += "    WHERE " + "\n      AND ".join(conditions) + "\n"
+    query += "    ORDER BY c.id\n"
+    if filtres["limit"]:
+        query += "    LIMIT %s\n"
+        params.append(filtres["limit"] + 1)
+    return query, params
+
+
+# Bornes des semaines quand une seule est donnée (format YYYY-Www : ordre lexicographique)
+SEMAINE_MIN = "0000-W00"
+SEMAINE_MAX = "9999-W99"
+
+
+def _fenetre_semaines(filtres):
+    """(première, dernière) semaine de from_week / to_week, ou None sans fenêtre"""
+    if filtres is None or (filtres["from_week"] is None and filtres["to_week"] is None):
+        return None
+    return (filtres["from_week"] or SEMAINE_MIN, filtres["to_week"] or SEMAINE_MAX)
+
+
+def _champs_lus(filtres):
+    """Champs à lire colonne par colonne : ceux de ?fields=, ou tous avec une fenêtre de semaines
+
+    None : documents complets. Les documents contiennent toutes les semaines
+    et ne servent donc pas pour une fenêtre.
+    """
+    if filtres is None:
+        return None
+    if filtres["fields"] is None and _fenetre_semaines(filtres) is not None:
+        return tuple(CHANTIERS_CHAMPS)
+    return filtres["fields"]
+
+
+def _requete_chantiers_champs(filtres, champs, documents=False):
+    """Requête des champs demandés, agrégats enfants limités à la fenêtre from_week / to_week"""
+    fenetre = _fenetre_semaines(filtres)
+    if fenetre is None:
+        return _requete_chantiers_filtres(filtres, _select_chantiers(champs, documents))
+    enfants = sum(1 for champ in champs if champ in CHANTIERS_ENFANTS)
+    return _requete_chantiers_filtres(filtres, _select_chantiers(champs, fenetre=True), fenetre * enfants)
+
+
+def _page_chantiers(rows, filtres, response, convertir):
+    """Couper la ligne en trop et exposer le curseur de la page suivante"""
+    limit = filtres["limit"]
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = rows[-1][0]
+    return convertir(rows)
+
+
+def _requete_sortis_filtres(filtres):
+    """Chantiers modifiés depuis `since` qui ne vérifient plus les filtres (None sans filtre)
+
+    Pour le client, ils quittent la vue filtrée : ils sont renvoyés dans
+    "deleted" avec les chantiers supprimés.
+    """
+    conditions, params = _conditions_chantiers(filtres, exclues=("since",))
+    if not conditions:
+        return None
+    query = f"""
+    SELECT c.id
+    FROM chantiers c
+    WHERE c.change_xid >= %s::xid8
+      AND NOT COALESCE({" AND ".join(conditions)}, false)
+    """
+    return query, [filtres["since"]] + params
+
+
+def _delta_chantiers(chantiers, supprimes, jeton):
+    """Réponse d'une synchronisation delta (since) : chantiers modifiés et supprimés"""
+    return {
+        "chantiers": chantiers,
+        "deleted": sorted({row[0] for row in supprimes}),
+        "token": jeton
+    }
+
+
+def _lire_chantiers_json(conn):
+    """Corps JSON complet de GET /chantiers construit par PostgreSQL (None sans chantier_documents)"""
+    cur = conn.cursor()
+    try:
+        return prepared_queries.execute(cur, "chantiers_json").fetchone()[0]
+    except Exception as e:
+        if not _documents_absents(e):
+            raise
+        conn.rollback()
+        return None
+
+
+async def _lire_chantiers_json_async(conn):
+    """Équivalent asyncio de _lire_chantiers_json()"""
+    cur = conn.cursor()
+    try:
+        return (await (await prepared_queries.execute_async(cur, "chantiers_json")).fetchone())[0]
+    except Exception as e:
+        if not _documents_absents(e):
+            raise
+        await conn.rollback()
+        return None
+
+
+def _lire_chantiers(conn, filtres):
+    """Lignes des chantiers demandés et leur mise en forme
+
+    Lit les documents précalculés ; sur une base où chantier_documents
+    n'existe pas encore, agrège les tables enfants comme auparavant. Avec
+    ?fields=, seuls les champs demandés sont lus : colonnes de chantiers,
+    plus le document (jointure sur la clé) si un champ enfant est demandé.
+    Avec from_week / to_week, les champs enfants sont agrégés sur la seule
+    fenêtre de semaines.
+    """
+    champs = _champs_lus(filtres)
+    cur = conn.cursor()
+    try:
+        if champs is not None:
+            cur.execute(*_requete_chantiers_champs(filtres, champs, documents=True))
+            return cur.fetchall(), _chantiers_projetes(champs)
+        if filtres is None:
+            prepared_queries.execute(cur, "chantiers_documents")
+        else:
+            cur.execute(*_requete_chantiers_filtres(filtres))
+        return cur.fetchall(), _chantiers_depuis_documents
+    except Exception as e:
+        if not _documents_absents(e):
+            raise
+        conn.rollback()
+    
+    if champs is not None:
+        cur.execute(*_requete_chantiers_champs(filtres, champs))
+        return cur.fetchall(), _chantiers_projetes(champs)
+    if filtres is None:
+        prepared_queries.execute(cur, "chantiers_liste")
+    else:
+        cur.execute(*_requete_chantiers_filtres(filtres, CHANTIERS_FILTRES_SELECT))
+    return cur.fetchall(), _chantiers_depuis_lignes
+
+
+async def _lire_chantiers_async(conn, filtres):
+    """Équivalent asyncio de _lire_chantiers()"""
+    champs = _champs_lus(filtres)
+    cur = conn.cursor()
+    try:
+        if champs is not None:
+            await cur.execute(*_requete_chantiers_champs(filtres, champs, documents=True))
+            return await cur.fetchall(), _chantiers_projetes(champs)
+        if filtres is None:
+            await prepared_queries.execute_async(cur, "chantiers_documents")
+        else:
+            await cur.execute(*_requete_chantiers_filtres(filtres))
+        return await cur.fetchall(), _chantiers_depuis_documents
+    except Exception as e:
+        if not _documents_absents(e):
+            raise
+        await conn.rollback()
+    
+    if champs is not None:
+        await cur.execute(*_requete_chantiers_champs(filtres, champs))
+        return await cur.fetchall(), _chantiers_projetes(champs)
+    if filtres is None:
+        await prepared_queries.execute_async(cur, "chantiers_liste")
+    else:
+        await cur.execute(*_requete_chantiers_filtres(filtres, CHANTIERS_FILTRES_SELECT))
+    return await cur.fetchall(), _chantiers_depuis_lignes
+
+
+def get_chantiers(request: Request, response: Response, filtres=Depends(_filtres_chantiers), conn=Depends(get_readonly_db)):
+    """Récupérer les chantiers depuis leurs documents précalculés (chantier_documents)
+
+    Sans paramètre : tous les chantiers. Avec filtres et/ou limit : chantiers
+    retenus, par id croissant ; l'en-tête X-Next-Cursor donne la valeur de
+    `after` pour la page suivante (absent sur la dernière page). `fields`
+    restreint chaque chantier aux champs demandés : sans planification,
+    soldes ni forcedPlanningLock, aucune table enfant n'est lue.
+    `from_week` / `to_week` (YYYY-Www, incluses) limitent ces trois champs
+    aux semaines de la fenêtre.
+    
+    L'en-tête X-Change-Token de chaque réponse se renvoie dans `since` :
+    réponse {"chantiers", "deleted", "token"} limitée aux chantiers dont la
+    ligne, les planifications, soldes ou verrous ont changé depuis, et aux
+    identifiants supprimés. Avec des filtres, "deleted" contient aussi les
+    chantiers modifiés qui ne les vérifient plus. Un chantier peut revenir
+    deux fois, jamais manquer.
+    
+    Hors synchronisation delta (dont le corps contient le jeton), la réponse
+    porte un ETag : If-None-Match identique -> 304 sans lire les chantiers.
+    """
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
-        
-        # ✅ OPTIMISATION : Faire l'agrégation côté SQL
-        cur.execute("""
-            SELECT 
-                c.id,
-                c.label,
-                c.status,
-                c.prepTime,
-                c.endDate,
-                c.preparateur_nom,
-                c.ChargeRestante,
-                -- Agrégation des planifications en JSON
-                COALESCE(
-                    json_object_agg(p.semaine, p.minutes) FILTER (WHERE p.semaine IS NOT NULL),
-                    '{}'::json
-                ) as planification,
-                -- Agrégation des soldes en JSON
-                COALESCE(
-                    json_object_agg(s.semaine, s.minutes) FILTER (WHERE s.semaine IS NOT NULL),
-                    '{}'::json
-                ) as soldes,
-                -- Agrégation des verrous en JSON
-                COALESCE(
-                    json_object_agg(
-                        v.semaine, 
-                        json_build_object('preparateur', v.preparateur_nom, 'minutes', v.minutes)
-                    ) FILTER (WHERE v.semaine IS NOT NULL),
-                    '{}'::json
-                ) as forcedPlanningLock
-            FROM chantiers c
-            LEFT JOIN planifications p ON c.id = p.chantier_id
-            LEFT JOIN soldes s ON c.id = s.chantier_id  
-            LEFT JOIN verrous_planification v ON c.id = v.chantier_id
-            GROUP BY c.id, c.label, c.status, c.prepTime, c.endDate, c.preparateur_nom, c.ChargeRestante
-            ORDER BY c.id
-        """)
-        
-        rows = cur.fetchall()
-        
-        # ✅ Plus de traitement Python complexe !
-        chantiers = {}
-        for row in rows:
-            chantiers[row[0]] = {
-                "id": row[0],
-                "label": row[1] or "",
-                "status": row[2] or "Nouveau", 
-                "prepTime": row[3] or 0,
-                "endDate": row[4] or "",
-                "preparateur": row[5] or None,
-                "ChargeRestante": row[6] or 0,
-                "planification": row[7],      # ← Déjà au format JSON !
-                "soldes": row[8],             # ← Déjà au format JSON !
-                "forcedPlanningLock": row[9]  # ← Déjà au format JSON !
-            }
-        
-        return chantiers
-        
+        if filtres is None or filtres["since"] is None:
+            non_modifie = verifier_etag(request, response, conn, CHANTIERS_TABLES)
+            if non_modifie:
+                return non_modifie
+        # Jeton lu avant les données : rien de ce que la lecture ne voit pas ne lui échappe
+        jeton = prepared_queries.execute(cur, "jeton_changements").fetchone()[0]
+        response.headers[CHANGE_TOKEN_HEADER] = jeton
+        if filtres is None and DB_JSON_SQL_ENABLED:
+            corps = _lire_chantiers_json(conn)
+            if corps is not None:
+                return reponse_json(response, corps)
+        
+        rows, convertir = _lire_chantiers(conn, filtres)
+        if filtres is None:
+            return reponse_contenu(response, convertir(rows))
+        
+        if filtres["since"] is not None:
+            prepared_queries.execute(cur, "chantiers_supprimes_depuis", (filtres["since"],))
+            supprimes = cur.fetchall()
+            sortis = _requete_sortis_filtres(filtres)
+            if sortis is not None:
+                cur.execute(*sortis)
+                supprimes += cur.fetchall()
+            return reponse_contenu(response, _delta_chantiers(convertir(rows), supprimes, jeton))
+        return reponse_contenu(response, _page_chantiers(rows, filtres, response, convertir))
+        
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
     except Exception as e:
         print(f"🚨 Erreur GET /chantiers: {str(e)}")
         return {"error": f"Erreur base de données: {str(e)}"}
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
+
+
+async def get_chantiers_async(request: Request, response: Response, filtres=Depends(_filtres_chantiers), conn=Depends(get_async_readonly_db)):
+    """Récupérer les chantiers depuis PostgreSQL (version asyncio, mêmes paramètres)"""
+    try:
+        cur = conn.cursor()
+        if filtres is None or filtres["since"] is None:
+            non_modifie = await verifier_etag_async(request, response, conn, CHANTIERS_TABLES)
+            if non_modifie:
+                return non_modifie
+        jeton = (await (await prepared_queries.execute_async(cur, "jeton_changements")).fetchone())[0]
+        response.headers[CHANGE_TOKEN_HEADER] = jeton
+        if filtres is None and DB_JSON_SQL_ENABLED:
+            corps = await _lire_chantiers_json_async(conn)
+            if corps is not None:
+                return reponse_json(response, corps)
+        
+        rows, convertir = await _lire_chantiers_async(conn, filtres)
+        if filtres is None:
+            return reponse_contenu(response, convertir(rows))
+        
+        if filtres["since"] is not None:
+            await prepared_queries.execute_async(cur, "chantiers_supprimes_depuis", (filtres["since"],))
+            supprimes = await cur.fetchall()
+            sortis = _requete_sortis_filtres(filtres)
+            if sortis is not None:
+                await cur.execute(*sortis)
+                supprimes += await cur.fetchall()
+            return reponse_contenu(response, _delta_chantiers(convertir(rows), supprimes, jeton))
+        return reponse_contenu(response, _page_chantiers(rows, filtres, response, convertir))
+        
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
+    except Exception as e:
+        print(f"🚨 Erreur GET /chantiers: {str(e)}")
+        return {"error": f"Erreur base de données: {str(e)}"}
+
+
+router.add_api_route("/chantiers", get_chantiers_async if DB_ASYNC_ENABLED else get_chantiers, methods=["GET"])
+
+
+# Export NDJSON : documents de chantier_documents tels que stockés (texte JSON compact)
+CHANTIERS_NDJSON = """
+    SELECT document::text
+    FROM chantier_documents
+    ORDER BY chantier_id
+"""
+
+
+@router.get("/chantiers/stream")
+def stream_chantiers():
+    """Exporter tous les chantiers en NDJSON : un chantier par ligne, par id croissant
+
+    Chaque ligne est l'objet chantier de GET /chantiers. Lecture par curseur
+    côté serveur : mémoire constante quelle que soit la taille de la table.
+    """
+    try:
+        try:
+            return reponse_ndjson(CHANTIERS_NDJSON, nom="chantiers_ndjson")
+        except Exception as e:
+            if not _documents_absents(e):
+                raise
+        return reponse_ndjson(CHANTIERS_FILTRES_SELECT + "    ORDER BY c.id\n",
+                              convertir=_chantier_depuis_ligne, nom="chantiers_ndjson_agreges")
+        
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"🚨 Erreur GET /chantiers/stream: {str(e)}")
+        return {"error": f"Erreur base de données: {str(e)}"}
 
 
 @router.post("/chantiers")
-def create_chantier(chantier: Dict[str, Any]):
+def create_chantier(chantier: Dict[str, Any], conn=Depends(get_write_db)):
     """Créer un nouveau chantier dans PostgreSQL"""
     chantier_id = chantier.get('id')
     if not chantier_id:
         raise HTTPException(status_code=400, detail="ID du chantier requis")
 
-    conn = None
     try:
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Insérer le chantier
-        cur.execute("""
+        execute_query("""
             INSERT INTO chantiers (id, label, status, prepTime, endDate, preparateur_nom, ChargeRestante) 
             VALUES (%s, %s, %s, %s, %s, %s, %s)
             ON CONFLICT (id) DO UPDATE SET
@@ -320,31 +693,120 @@ def create_chantier(chantier: Dict[str, Any]):
             chantier.get('endDate'),
             chantier.get('preparateur'),
             chantier.get('ChargeRestante', chantier.get('prepTime'))
-        ))
+        ), conn=conn, commit=True)
         
-        conn.commit()
         return {"status": "✅ Chantier créé/mis à jour", "id": chantier.get('id')}
         
     except Exception as e:
-        if conn:
-            conn.rollback()  # ← MANQUANT
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
-@router.put("/chantiers/{chantier_id}")
-def update_chantier(chantier_id: str, chantier: Dict[str, Any]):
-    """Mettre à jour un chantier avec requête sécurisée optimisée"""
-    conn = None
+# Bornes des colonnes INTEGER et VARCHAR(n) (ensure_chantiers_tables) : une
+# valeur hors bornes ferait échouer toute l'instruction, donc tout le lot
+INTEGER_MIN, INTEGER_MAX = -2**31, 2**31 - 1
+ID_LONGUEUR_MAX = 255
+SEMAINE_LONGUEUR_MAX = 50
+UPDATED_AT_LONGUEUR_MAX = 100
+
+
+def _hors_colonne(valeur, longueur_max=None):
+    """Entier hors INTEGER, ou chaîne plus longue que VARCHAR(longueur_max)"""
+    if isinstance(valeur, int):
+        return not INTEGER_MIN <= valeur <= INTEGER_MAX
+    return longueur_max is not None and len(valeur) > longueur_max
+
+
+# Champs modifiables de PUT /chantiers/bulk : type JSON attendu et longueur
+# maximale de la colonne (chaînes)
+CHANTIERS_BULK_CHAMPS = {
+    'label': (str, 500),
+    'status': (str, 100),
+    'prepTime': (int, None),
+    'endDate': (str, 50),
+    'preparateur': (str, 255),
+    'ChargeRestante': (int, None)
+}
+
+
+def _preparer_chantiers_bulk(data):
+    """Objets partiels de PUT /chantiers/bulk, réduits aux champs modifiables non nuls
+
+    Lève HTTPException 400 si la liste est vide, si un élément n'a pas d'id,
+    si un id est présent deux fois, ou si un champ n'a pas le type attendu ou
+    ne tient pas dans sa colonne.
+    """
+    chantiers = data.get('chantiers')
+    if not isinstance(chantiers, list) or not chantiers:
+        raise HTTPException(status_code=400, detail="'chantiers' doit être une liste non vide d'objets chantier")
+    
+    objets, ids = [], set()
+    for chantier in chantiers:
+        if (not isinstance(chantier, dict) or not isinstance(chantier.get('id'), str) or not chantier['id']
+                or _hors_colonne(chantier['id'], ID_LONGUEUR_MAX)):
+            raise HTTPException(status_code=400, detail="Chaque élément requiert un 'id'")
+        chantier_id = chantier['id']
+        if chantier_id in ids:
+            raise HTTPException(status_code=400, detail=f"Chantier {chantier_id} présent plusieurs fois")
+        ids.add(chantier_id)
+        
+        objet = {'id': chantier_id}
+        for champ, (type_attendu, longueur_max) in CHANTIERS_BULK_CHAMPS.items():
+            valeur = chantier.get(champ)
+            if valeur is None:
+                continue
+            if not isinstance(valeur, type_attendu) or isinstance(valeur, bool) or _hors_colonne(valeur, longueur_max):
+                raise HTTPException(status_code=400, detail=f"Champ '{champ}' invalide pour le chantier {chantier_id}")
+            objet[champ] = valeur
+        objets.append(objet)
+    return objets
+
+
+@router.put("/chantiers/bulk")
+def update_chantiers_bulk(data: Dict[str, Any], conn=Depends(get_write_db)):
+    """Mettre à jour plusieurs chantiers en une seule requête (objets partiels)
+
+    Corps : {"chantiers": [{"id": ..., <champs de PUT /chantiers/{id}>}, ...]},
+    chaque objet avec ses propres champs. Tous les objets partent dans un seul
+    document JSON (jsonb_to_recordset) appliqué par un seul UPDATE. Résultat
+    par chantier : updated, not_found, unknown_preparateur (rien n'est
+    écrit pour ce chantier) ou no_changes (aucun champ fourni, chantier
+    existant) ; les autres chantiers du lot sont appliqués.
+    """
     try:
-        conn = get_db_connection()
+        objets = _preparer_chantiers_bulk(data)
+        
+        # Les objets sans champ partent aussi : existence vérifiée, rien n'est écrit
         cur = conn.cursor()
+        prepared_queries.execute(cur, "chantiers_bulk_patch", (json.dumps(objets),))
+        lignes = {row[0]: row[1:] for row in cur.fetchall()}
+        conn.commit()
         
+        results = []
+        for objet in objets:
+            resultat, label, status = lignes[objet['id']]
+            result = {"id": objet['id'], "result": resultat}
+            if resultat == "updated":
+                result.update({"label": label, "status": status})
+            results.append(result)
+        
+        return {
+            "status": "✅ Chantiers mis à jour en masse",
+            "updated": sum(1 for r in results if r["result"] == "updated"),
+            "not_found": [r["id"] for r in results if r["result"] == "not_found"],
+            "results": results
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
+
+
+@router.put("/chantiers/{chantier_id}")
+def update_chantier(chantier_id: str, chantier: Dict[str, Any], conn=Depends(get_write_db)):
+    """Mettre à jour un chantier avec requête sécurisée optimisée"""
+    try:
         # ✅ OPTIMISATION : Mapping des champs sécurisé
         field_mapping = {
             'label': 'label',
@@ -376,14 +838,11 @@ def update_chantier(chantier_id: str, chantier: Dict[str, Any]):
             RETURNING id, label, status
         """
         
-        cur.execute(query, params)
-        result = cur.fetchone()
+        result = execute_query(query, params, fetch="one", conn=conn, commit=True)
         
         if not result:
             raise HTTPException(status_code=404, detail="Chantier non trouvé")
         
-        conn.commit()
-        
         return {
             "status": "✅ Chantier mis à jour", 
             "id": result[0],
@@ -392,298 +851,581 @@ def update_chantier(chantier_id: str, chantier: Dict[str, Any]):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 
 # Disponibilité et planification
 
-@router.put("/planification")
-def update_planification(planif: Dict[str, Any]):
-    """Mettre à jour la planification d'un chantier avec préservation intelligente de l'historique"""
-    conn = None
+def _semaine_courante_planification():
+    """Semaine courante YYYY-WXX (le dimanche compte dans la semaine écoulée)"""
+    from datetime import datetime, timedelta
+    
+    now = datetime.utcnow()
+    if now.weekday() == 6:
+        now = now - timedelta(days=1)
+    
+    year, week_num, _ = now.isocalendar()
+    return f"{year}-W{week_num:02d}"
+
+
+def _preparer_planification(planif):
+    """Extraire (chantier_id, preserve_past, lignes (chantier_id, semaine, minutes) à conserver)
+
+    Seules les semaines à minutes > 0 sont conservées : les autres semaines du
+    périmètre preserve_past sont supprimées par planification_fusionner.
+    Lève HTTPException 400 si chantier_id n'est pas une chaîne non vide, si
+    planifications n'est pas un objet, si preserve_past n'est pas un booléen
+    ou si une valeur de minutes n'est pas un entier.
+    """
+    chantier_id = planif.get('chantier_id')
+    planifications = planif.get('planifications', {})
+    preserve_past = planif.get('preserve_past', True)
+    
+    if not isinstance(chantier_id, str) or not chantier_id or not isinstance(planifications, dict):
+        raise HTTPException(status_code=400, detail="'chantier_id' et un objet 'planifications' sont requis")
+    if not isinstance(preserve_past, bool):
+        raise HTTPException(status_code=400, detail=f"'preserve_past' doit être un booléen (chantier {chantier_id})")
+    for semaine, minutes in planifications.items():
+        if not isinstance(minutes, int) or isinstance(minutes, bool):
+            raise HTTPException(status_code=400, detail=f"Minutes invalides pour la semaine {semaine} du chantier {chantier_id}")
+    
+    lignes = [
+        (chantier_id, semaine, minutes)
+        for semaine, minutes in planifications.items()
+        if minutes > 0
+    ]
+    return chantier_id, preserve_past, lignes
+
+
+def _params_fusion(chantier_ids, preserve_flags, lignes):
+    """Paramètres de planification_fusionner (un tableau par colonne)"""
+    ids_lignes, semaines, minutes = (list(colonne) for colonne in zip(*lignes)) if lignes else ([], [], [])
+    return (chantier_ids, preserve_flags, ids_lignes, semaines, minutes, _semaine_courante_planification())
+
+
+def _comptes_planification(comptes, lignes):
+    """Compteurs de planification_fusionner : (supprimées, insérées, mises à jour) + inchangées"""
+    deleted_count, inserted_count, updated_count = comptes
+    return {
+        "deleted_future": deleted_count,
+        "inserted_new": inserted_count,
+        "updated": updated_count,
+        "unchanged": len(lignes) - inserted_count - updated_count
+    }
+
+
+def _resultat_planification(chantier_id, preserve_past, comptes, lignes):
+    return {
+        "status": "✅ Planification mise à jour avec préservation intelligente",
+        "chantier_id": chantier_id,
+        "mode": "preservation" if preserve_past else "legacy",
+        **_comptes_planification(comptes, lignes)
+    }
+
+
+def update_planification(planif: Dict[str, Any], conn=Depends(get_write_db)):
+    """Mettre à jour la planification d'un chantier avec préservation intelligente de l'historique
+
+    La carte reçue est comparée aux lignes en base : seules les semaines
+    ajoutées, modifiées ou retirées sont écrites (une seule instruction).
+    """
     try:
-        from datetime import datetime, timedelta
-        
-        conn = get_db_connection()
         cur = conn.cursor()
         
-        chantier_id = planif.get('chantier_id')
-        planifications = planif.get('planifications', {})
-        preserve_past = planif.get('preserve_past', True)
+        chantier_id, preserve_past, lignes = _preparer_planification(planif)
         
-        if preserve_past:
-            # Calculer la semaine courante
-            now = datetime.utcnow()
-            if now.weekday() == 6:
-                now = now - timedelta(days=1)
-            
-            year, week_num, _ = now.isocalendar()
-            current_week_key = f"{year}-W{week_num:02d}"
-            
-            # Supprimer seulement les planifications >= semaine courante
-            cur.execute("""
-                DELETE FROM planifications 
-                WHERE chantier_id = %s 
-                AND semaine >= %s
-            """, (chantier_id, current_week_key))
-            
-            deleted_count = cur.rowcount
-            
-        else:
-            # Mode legacy : Supprimer tout
-            cur.execute("DELETE FROM planifications WHERE chantier_id = %s", (chantier_id,))
-            deleted_count = cur.rowcount
+        prepared_queries.execute(cur, "chantier_existe", (chantier_id,))
+        if not cur.fetchone():
+            raise HTTPException(status_code=404, detail="Chantier non trouvé")
         
-        # ✅ CORRECTION : Utiliser ON CONFLICT pour éviter les doublons
-        inserted_count = 0
-        for semaine, minutes in planifications.items():
-            if minutes > 0:
-                cur.execute("""
-                    INSERT INTO planifications (chantier_id, semaine, minutes) 
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (chantier_id, semaine) 
-                    DO UPDATE SET minutes = EXCLUDED.minutes
-                """, (chantier_id, semaine, minutes))
-                inserted_count += 1
+        prepared_queries.execute(cur, "planification_fusionner",
+                                 _params_fusion([chantier_id], [preserve_past], lignes))
+        comptes = cur.fetchone()
         
         conn.commit()
 
+        return _resultat_planification(chantier_id, preserve_past, comptes, lignes)
+        
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
+
+
+async def update_planification_async(planif: Dict[str, Any], conn=Depends(get_async_write_db)):
+    """Mettre à jour la planification d'un chantier (version asyncio)"""
+    try:
+        cur = conn.cursor()
+        
+        chantier_id, preserve_past, lignes = _preparer_planification(planif)
+        
+        await prepared_queries.execute_async(cur, "chantier_existe", (chantier_id,))
+        if not await cur.fetchone():
+            raise HTTPException(status_code=404, detail="Chantier non trouvé")
+        
+        await prepared_queries.execute_async(cur, "planification_fusionner",
+                                             _params_fusion([chantier_id], [preserve_past], lignes))
+        comptes = await cur.fetchone()
+        
+        await conn.commit()
+
+        return _resultat_planification(chantier_id, preserve_past, comptes, lignes)
+        
+    except HTTPException:
+        await conn.rollback()
+        raise
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
+
+
+router.add_api_route("/planification", update_planification_async if DB_ASYNC_ENABLED else update_planification, methods=["PUT"])
+
+
+def _preparer_planifications_bulk(data):
+    """Chantiers de PUT /planification/bulk à partir des charges de PUT /planification
+
+    Retourne (chantier_ids, preserve_past par chantier, lignes à conserver).
+    Lève HTTPException 400 si la liste est vide, si un élément est invalide
+    (mêmes règles que PUT /planification) ou si un chantier y figure deux fois.
+    """
+    chantiers = data.get('chantiers')
+    if not isinstance(chantiers, list) or not chantiers:
+        raise HTTPException(status_code=400, detail="'chantiers' doit être une liste non vide de planifications")
+    
+    chantier_ids, preserve_flags, toutes_lignes, vus = [], [], [], set()
+    for planif in chantiers:
+        if not isinstance(planif, dict):
+            raise HTTPException(status_code=400, detail="Chaque élément requiert 'chantier_id' et un objet 'planifications'")
+        chantier_id, preserve_past, lignes = _preparer_planification(planif)
+        if chantier_id in vus:
+            raise HTTPException(status_code=400, detail=f"Chantier {chantier_id} présent plusieurs fois")
+        vus.add(chantier_id)
+        chantier_ids.append(chantier_id)
+        preserve_flags.append(preserve_past)
+        toutes_lignes.extend(lignes)
+    return chantier_ids, preserve_flags, toutes_lignes
+
+
+@router.put("/planification/bulk")
+def update_planifications_bulk(data: Dict[str, Any], conn=Depends(get_write_db)):
+    """Mettre à jour la planification de plusieurs chantiers en une seule transaction
+
+    Corps : {"chantiers": [<corps de PUT /planification>, ...]}. Chaque
+    chantier suit sa règle preserve_past (périmètre : semaines >= semaine
+    courante, ou tout l'historique) et seules les différences avec la base
+    sont écrites. Les données partent en tableaux (unnest) : vérification
+    et écriture différentielle de tous les chantiers en un seul aller-retour.
+    """
+    try:
+        chantier_ids, preserve_flags, lignes = _preparer_planifications_bulk(data)
+        
+        inconnus_cur, fusion_cur = execute_pipeline(conn, [
+            (prepared_queries.sql("chantiers_inconnus"), (chantier_ids,)),
+            (prepared_queries.sql("planification_fusionner"), _params_fusion(chantier_ids, preserve_flags, lignes)),
+        ])
+        inconnus = inconnus_cur.fetchone()[0]
+        if inconnus:
+            conn.rollback()
+            raise HTTPException(status_code=404, detail=f"Chantier(s) non trouvé(s) : {', '.join(inconnus)}")
+        comptes = fusion_cur.fetchone()
+        
+        conn.commit()
+        
         return {
-            "status": "✅ Planification mise à jour avec préservation intelligente",
-            "chantier_id": chantier_id,
-            "mode": "preservation" if preserve_past else "legacy",
-            "deleted_future": deleted_count,
-            "inserted_new": inserted_count
+            "status": "✅ Planifications mises à jour en masse",
+            "chantiers": len(chantier_ids),
+            "preservation": sum(preserve_flags),
+            "legacy": len(chantier_ids) - sum(preserve_flags),
+            **_comptes_planification(comptes, lignes)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.put("/disponibilites")
-def update_disponibilites(dispo: Dict[str, Any]):
+def update_disponibilites(dispo: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour les disponibilités d'un préparateur"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         preparateur_nom = dispo.get('preparateur_nom')
         disponibilites = dispo.get('disponibilites', {})
         
         # Supprimer les anciennes disponibilités pour ce préparateur
-        cur.execute("DELETE FROM disponibilites WHERE preparateur_nom = %s", (preparateur_nom,))
+        execute_query("DELETE FROM disponibilites WHERE preparateur_nom = %s", (preparateur_nom,), conn=conn)
         
         # Insérer les nouvelles disponibilités
+        lignes = []
         for semaine, info in disponibilites.items():
             minutes = info.get('minutes', 0) if isinstance(info, dict) else info
             updated_at = info.get('updatedAt', '') if isinstance(info, dict) else ''
             
             if minutes > 0:
-                cur.execute("""
-                    INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt) 
-                    VALUES (%s, %s, %s, %s)
-                """, (preparateur_nom, semaine, minutes, updated_at))
+                lignes.append((preparateur_nom, semaine, minutes, updated_at))
         
-        conn.commit()
+        execute_many("""
+            INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt) 
+            VALUES (%s, %s, %s, %s)
+        """, lignes, conn=conn, commit=True)
 
         return {"status": "✅ Disponibilités mises à jour", "preparateur": preparateur_nom}
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
+
+
+# PUT /sync-planning : le contenu est chargé par COPY dans des tables
+# temporaires (sans WAL, supprimées au commit), puis fusionné en SQL
+# ensembliste. Les écarts avec la base sont calculés en une jointure par
+# table, puis seules les lignes qui changent sont réécrites.
+SYNC_STAGING = """
+    CREATE TEMP TABLE sync_chantiers (
+        id VARCHAR(255) PRIMARY KEY, label VARCHAR(500), status VARCHAR(100), prepTime INTEGER,
+        endDate VARCHAR(50), preparateur_nom VARCHAR(255), ChargeRestante INTEGER
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE sync_planifications (
+        chantier_id VARCHAR(255), semaine VARCHAR(50), minutes INTEGER,
+        PRIMARY KEY (chantier_id, semaine)
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE sync_disponibilites (
+        preparateur_nom VARCHAR(255), semaine VARCHAR(50), minutes INTEGER, updatedAt VARCHAR(100),
+        PRIMARY KEY (preparateur_nom, semaine)
+    ) ON COMMIT DROP
+"""
+
+SYNC_CHANTIERS_COLONNES = ("label", "status", "prepTime", "endDate", "preparateur_nom", "ChargeRestante", "id")
+SYNC_PLANIFICATIONS_COLONNES = ("chantier_id", "semaine", "minutes")
+SYNC_DISPONIBILITES_COLONNES = ("preparateur_nom", "semaine", "minutes", "updatedAt")
+
+# Écarts : id renseigné et clé vide = ligne à supprimer, id vide = ligne à
+# insérer, les deux = minutes à mettre à jour. Les planifications ne sont
+# remplacées que pour les chantiers qui en reçoivent, les disponibilités
+# que pour les préparateurs qui en reçoivent.
+SYNC_ECARTS = """
+    ANALYZE sync_chantiers, sync_planifications, sync_disponibilites;
+    CREATE TEMP TABLE sync_planifications_ecarts ON COMMIT DROP AS
+        SELECT p.id, s.chantier_id, s.semaine, s.minutes
+        FROM (
+            SELECT id, chantier_id, semaine, minutes FROM planifications
+            WHERE chantier_id IN (SELECT chantier_id FROM sync_planifications)
+        ) p
+        FULL JOIN sync_planifications s ON s.chantier_id = p.chantier_id AND s.semaine = p.semaine
+        WHERE p.minutes IS DISTINCT FROM s.minutes;
+    CREATE TEMP TABLE sync_disponibilites_ecarts ON COMMIT DROP AS
+        SELECT d.id, s.preparateur_nom, s.semaine, s.minutes, s.updatedAt
+        FROM (
+            SELECT id, preparateur_nom, semaine, minutes, updatedAt FROM disponibilites
+            WHERE preparateur_nom IN (SELECT preparateur_nom FROM sync_disponibilites)
+        ) d
+        FULL JOIN sync_disponibilites s ON s.preparateur_nom = d.preparateur_nom AND s.semaine = d.semaine
+        WHERE (d.minutes, d.updatedAt) IS DISTINCT FROM (s.minutes, s.updatedAt);
+    ANALYZE sync_planifications_ecarts, sync_disponibilites_ecarts
+"""
+
+SYNC_FUSION = (
+    """
+    UPDATE chantiers c SET
+        label = s.label, status = s.status, prepTime = s.prepTime,
+        endDate = s.endDate, preparateur_nom = s.preparateur_nom, ChargeRestante = s.ChargeRestante
+    FROM sync_chantiers s
+    WHERE c.id = s.id
+    AND (c.label, c.status, c.prepTime, c.endDate, c.preparateur_nom, c.ChargeRestante)
+        IS DISTINCT FROM (s.label, s.status, s.prepTime, s.endDate, s.preparateur_nom, s.ChargeRestante)
+    """,
+    """
+    DELETE FROM planifications p USING sync_planifications_ecarts e
+    WHERE p.id = e.id AND e.chantier_id IS NULL
+    """,
+    """
+    UPDATE planifications p SET minutes = e.minutes FROM sync_planifications_ecarts e
+    WHERE p.id = e.id AND e.chantier_id IS NOT NULL
+    """,
+    """
+    INSERT INTO planifications (chantier_id, semaine, minutes)
+    SELECT chantier_id, semaine, minutes FROM sync_planifications_ecarts WHERE id IS NULL
+    ON CONFLICT (chantier_id, semaine)
+    DO UPDATE SET minutes = EXCLUDED.minutes
+    """,
+    """
+    DELETE FROM disponibilites d USING sync_disponibilites_ecarts e
+    WHERE d.id = e.id AND e.preparateur_nom IS NULL
+    """,
+    """
+    UPDATE disponibilites d SET minutes = e.minutes, updatedAt = e.updatedAt FROM sync_disponibilites_ecarts e
+    WHERE d.id = e.id AND e.preparateur_nom IS NOT NULL
+    """,
+    """
+    INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt)
+    SELECT preparateur_nom, semaine, minutes, updatedAt FROM sync_disponibilites_ecarts WHERE id IS NULL
+    ON CONFLICT (preparateur_nom, semaine)
+    DO UPDATE SET minutes = EXCLUDED.minutes, updatedAt = EXCLUDED.updatedAt
+    """,
+)
+
+
+def _minutes_invalides(minutes):
+    return not isinstance(minutes, int) or isinstance(minutes, bool) or _hors_colonne(minutes)
+
+
+def _preparer_sync_planning(data):
+    """Lignes de PUT /sync-planning pour les tables temporaires : (chantiers, planifications, disponibilités)
+
+    Lève HTTPException 400 si 'chantiers' ou 'data' n'est pas un objet, ou si
+    une valeur n'a pas le type attendu ou ne tient pas dans sa colonne : une
+    erreur de COPY ou de fusion annulerait toute la synchronisation.
+    """
+    chantiers = data.get('chantiers', {})
+    preparateurs = data.get('data', {})
+    if not isinstance(chantiers, dict) or not isinstance(preparateurs, dict):
+        raise HTTPException(status_code=400, detail="'chantiers' et 'data' doivent être des objets")
+    
+    chantiers_data = []
+    planifications_data = []
+    disponibilites_data = []
+    
+    for chantier_id, chantier_data in chantiers.items():
+        if not isinstance(chantier_data, dict) or _hors_colonne(chantier_id, ID_LONGUEUR_MAX):
+            raise HTTPException(status_code=400, detail=f"Chantier {chantier_id} invalide")
+        ligne = (
+            chantier_data.get('label', ''),
+            chantier_data.get('status', 'Nouveau'),
+            chantier_data.get('prepTime', 0),
+            chantier_data.get('endDate', ''),
+            chantier_data.get('preparateur'),
+            chantier_data.get('ChargeRestante', chantier_data.get('prepTime', 0)),
+        )
+        # Mêmes champs, dans le même ordre, que CHANTIERS_BULK_CHAMPS ; seul label est NOT NULL
+        for champ, valeur in zip(CHANTIERS_BULK_CHAMPS, ligne):
+            type_attendu, longueur_max = CHANTIERS_BULK_CHAMPS[champ]
+            if valeur is None and champ != 'label':
+                continue
+            if not isinstance(valeur, type_attendu) or isinstance(valeur, bool) or _hors_colonne(valeur, longueur_max):
+                raise HTTPException(status_code=400, detail=f"Champ '{champ}' invalide pour le chantier {chantier_id}")
+        chantiers_data.append(ligne + (chantier_id,))
+        
+        planifications = chantier_data.get('planification', {})
+        if not isinstance(planifications, dict):
+            raise HTTPException(status_code=400, detail=f"'planification' doit être un objet (chantier {chantier_id})")
+        for semaine, minutes in planifications.items():
+            if _minutes_invalides(minutes) or _hors_colonne(semaine, SEMAINE_LONGUEUR_MAX):
+                raise HTTPException(status_code=400, detail=f"Minutes invalides pour la semaine {semaine} du chantier {chantier_id}")
+            if minutes > 0:
+                planifications_data.append((chantier_id, semaine, minutes))
+    
+    for preparateur_nom, disponibilites in preparateurs.items():
+        if not isinstance(disponibilites, dict) or _hors_colonne(preparateur_nom, ID_LONGUEUR_MAX):
+            raise HTTPException(status_code=400, detail=f"Disponibilités invalides pour {preparateur_nom}")
+        for semaine, info in disponibilites.items():
+            minutes = info.get('minutes', 0) if isinstance(info, dict) else info
+            updated_at = info.get('updatedAt', '') if isinstance(info, dict) else ''
+            if (_minutes_invalides(minutes) or _hors_colonne(semaine, SEMAINE_LONGUEUR_MAX)
+                    or not isinstance(updated_at, str) or _hors_colonne(updated_at, UPDATED_AT_LONGUEUR_MAX)):
+                raise HTTPException(status_code=400, detail=f"Disponibilité invalide pour {preparateur_nom}, semaine {semaine}")
+            if minutes > 0:
+                disponibilites_data.append((preparateur_nom, semaine, minutes, updated_at))
+    
+    return chantiers_data, planifications_data, disponibilites_data
 
 
 @router.put("/sync-planning")
-def sync_complete_planning(data: Dict[str, Any]):
-    """Synchronisation complète avec transaction explicite optimisée"""
-    conn = None
+def sync_complete_planning(data: Dict[str, Any], conn=Depends(get_admin_db)):
+    """Synchronisation complète en une transaction : COPY vers des tables temporaires puis fusion ensembliste
+
+    Les chantiers existants sont mis à jour (les identifiants inconnus sont
+    ignorés). Les planifications des chantiers et les disponibilités des
+    préparateurs présents dans le contenu sont remplacées par celles reçues.
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # ✅ Types vérifiés avant de créer les tables temporaires
+        chantiers_data, planifications_data, disponibilites_data = _preparer_sync_planning(data)
         
-        # ✅ Transaction explicite pour TOUT grouper
-        cur.execute("BEGIN")
+        # ✅ Chargement par COPY (un flux par table, pas d'aller-retour par ligne)
+        conn.cursor().execute(SYNC_STAGING)
+        copy_lignes(conn, "sync_chantiers", SYNC_CHANTIERS_COLONNES, chantiers_data)
+        copy_lignes(conn, "sync_planifications", SYNC_PLANIFICATIONS_COLONNES, planifications_data)
+        copy_lignes(conn, "sync_disponibilites", SYNC_DISPONIBILITES_COLONNES, disponibilites_data)
         
-        try:
-            # ✅ OPTIMISATION : Préparer toutes les données avant insertion
-            chantiers_data = []
-            planifications_data = []
-            disponibilites_data = []
-            
-            # Préparer les données chantiers
-            if 'chantiers' in data:
-                for chantier_id, chantier_data in data['chantiers'].items():
-                    chantiers_data.append((
-                        chantier_data.get('label', ''),
-                        chantier_data.get('status', 'Nouveau'),
-                        chantier_data.get('prepTime', 0),
-                        chantier_data.get('endDate', ''),
-                        chantier_data.get('preparateur'),
-                        chantier_data.get('ChargeRestante', chantier_data.get('prepTime', 0)),
-                        chantier_id
-                    ))
-                    
-                    # Préparer les planifications
-                    planifications = chantier_data.get('planification', {})
-                    for semaine, minutes in planifications.items():
-                        if minutes > 0:
-                            planifications_data.append((chantier_id, semaine, minutes))
-            
-            # Préparer les disponibilités
-            if 'data' in data:
-                for preparateur_nom, disponibilites in data['data'].items():
-                    for semaine, info in disponibilites.items():
-                        minutes = info.get('minutes', 0) if isinstance(info, dict) else info
-                        updated_at = info.get('updatedAt', '') if isinstance(info, dict) else ''
-                        if minutes > 0:
-                            disponibilites_data.append((preparateur_nom, semaine, minutes, updated_at))
-            
-            # ✅ BULK OPERATIONS avec executemany()
-            if chantiers_data:
-                cur.executemany("""
-                    UPDATE chantiers SET 
-                        label = %s, status = %s, prepTime = %s, 
-                        endDate = %s, preparateur_nom = %s, ChargeRestante = %s
-                    WHERE id = %s
-                """, chantiers_data)
-            
-            # Suppression groupée des planifications
-            if planifications_data:
-                chantier_ids = list(set(row[0] for row in planifications_data))
-                cur.executemany("DELETE FROM planifications WHERE chantier_id = %s", 
-                               [(cid,) for cid in chantier_ids])
-                
-                # Insertion groupée des planifications
-                cur.executemany("""
-                    INSERT INTO planifications (chantier_id, semaine, minutes) 
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (chantier_id, semaine) 
-                    DO UPDATE SET minutes = EXCLUDED.minutes
-                """, planifications_data)
-            
-            # Disponibilités groupées
-            if disponibilites_data:
-                preparateurs = list(set(row[0] for row in disponibilites_data))
-                cur.executemany("DELETE FROM disponibilites WHERE preparateur_nom = %s",
-                               [(prep,) for prep in preparateurs])
-                
-                cur.executemany("""
-                    INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt) 
-                    VALUES (%s, %s, %s, %s)
-                """, disponibilites_data)
-            
-            # ✅ Commit unique à la fin
-            cur.execute("COMMIT")
-            
-            return {
-                "status": "✅ Planification complète synchronisée (optimisée)",
-                "chantiers_updated": len(chantiers_data),
-                "planifications_inserted": len(planifications_data), 
-                "disponibilites_inserted": len(disponibilites_data)
-            }
-            
-        except Exception as e:
-            # ✅ Rollback en cas d'erreur
-            cur.execute("ROLLBACK")
-            raise
+        # ✅ Calcul des écarts puis fusion ensembliste en un seul aller-retour
+        conn.cursor().execute(SYNC_ECARTS)
+        execute_pipeline(conn, [(requete, None) for requete in SYNC_FUSION])
+        
+        # ✅ Commit unique à la fin (tables temporaires supprimées)
+        conn.commit()
+        
+        return {
+            "status": "✅ Planification complète synchronisée (optimisée)",
+            "chantiers_updated": len(chantiers_data),
+            "planifications_inserted": len(planifications_data), 
+            "disponibilites_inserted": len(disponibilites_data)
+        }
             
+    except HTTPException:
+        raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 
-@router.get("/disponibilites")
-def get_disponibilites():
+def _disponibilites_depuis_lignes(rows):
+    """Regrouper les lignes de la requête disponibilites_liste par préparateur"""
+    disponibilites = {}
+    for row in rows:
+        preparateur = row[0]
+        if preparateur not in disponibilites:
+            disponibilites[preparateur] = {}
+        
+        disponibilites[preparateur][row[1]] = {
+            "minutes": row[2],
+            "updatedAt": row[3]
+        }
+    return {"data": disponibilites}
+
+
+def get_disponibilites(request: Request, response: Response, conn=Depends(get_readonly_db)):
     """Récupérer toutes les disponibilités depuis PostgreSQL"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        non_modifie = verifier_etag(request, response, conn, ("disponibilites",))
+        if non_modifie:
+            return non_modifie
         
-        cur.execute("""
-            SELECT preparateur_nom, semaine, minutes, updatedAt 
-            FROM disponibilites 
-            ORDER BY preparateur_nom, semaine
-        """)
+        cur = conn.cursor()
+        if DB_JSON_SQL_ENABLED:
+            return reponse_json(response, prepared_queries.execute(cur, "disponibilites_json").fetchone()[0])
+        prepared_queries.execute(cur, "disponibilites_liste")
+        return reponse_contenu(response, _disponibilites_depuis_lignes(cur.fetchall()))
         
-        rows = cur.fetchall()
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
+    except Exception as e:
+        print(f"🚨 Erreur GET /disponibilites: {str(e)}")
+        return {"error": f"Erreur base de données: {str(e)}"}
 
-        # Regrouper par préparateur
-        disponibilites = {}
-        for row in rows:
-            preparateur = row[0]
-            if preparateur not in disponibilites:
-                disponibilites[preparateur] = {}
-            
-            disponibilites[preparateur][row[1]] = {
-                "minutes": row[2],
-                "updatedAt": row[3]
-            }
-        
-        return {"data": disponibilites}
+
+async def get_disponibilites_async(request: Request, response: Response, conn=Depends(get_async_readonly_db)):
+    """Récupérer toutes les disponibilités depuis PostgreSQL (version asyncio)"""
+    try:
+        non_modifie = await verifier_etag_async(request, response, conn, ("disponibilites",))
+        if non_modifie:
+            return non_modifie
         
+        cur = conn.cursor()
+        if DB_JSON_SQL_ENABLED:
+            await prepared_queries.execute_async(cur, "disponibilites_json")
+            return reponse_json(response, (await cur.fetchone())[0])
+        await prepared_queries.execute_async(cur, "disponibilites_liste")
+        return reponse_contenu(response, _disponibilites_depuis_lignes(await cur.fetchall()))
+        
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
     except Exception as e:
         print(f"🚨 Erreur GET /disponibilites: {str(e)}")
         return {"error": f"Erreur base de données: {str(e)}"}
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
+
+
+router.add_api_route("/disponibilites", get_disponibilites_async if DB_ASYNC_ENABLED else get_disponibilites, methods=["GET"])
+
+
+# Export NDJSON : une ligne par (préparateur, semaine), dans l'ordre de l'index unique
+DISPONIBILITES_NDJSON = """
+    SELECT '{"preparateur":' || to_json(preparateur_nom)::text ||
+           ',"semaine":' || to_json(semaine)::text ||
+           ',"minutes":' || minutes ||
+           ',"updatedAt":' || COALESCE(to_json(updatedAt)::text, 'null') || '}'
+    FROM disponibilites
+    ORDER BY preparateur_nom, semaine
+"""
+
+
+@router.get("/disponibilites/stream")
+def stream_disponibilites():
+    """Exporter toutes les disponibilités en NDJSON : {"preparateur", "semaine", "minutes", "updatedAt"} par ligne"""
+    try:
+        return reponse_ndjson(DISPONIBILITES_NDJSON, nom="disponibilites_ndjson")
+        
+    except QUERY_BUDGET_ERRORS:
+        raise  # 504 via le gestionnaire de main
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"🚨 Erreur GET /disponibilites/stream: {str(e)}")
+        return {"error": f"Erreur base de données: {str(e)}"}
 
 
 # Verouillages des chantiers
 
+def _lignes_verrous(chantier_id, forced_planning_lock):
+    """Lignes (chantier_id, semaine, preparateur, minutes) à stocker : verrous à minutes > 0
+
+    Lève HTTPException 400 si forced_planning_lock n'est pas un objet, ou si
+    un verrou n'a pas des minutes entières et un préparateur texte.
+    """
+    if not isinstance(forced_planning_lock, dict):
+        raise HTTPException(status_code=400, detail=f"'forced_planning_lock' doit être un objet (chantier {chantier_id})")
+    
+    lignes = []
+    for semaine, verrou_info in forced_planning_lock.items():
+        if isinstance(verrou_info, dict):
+            preparateur = verrou_info.get('preparateur', '')
+            minutes = verrou_info.get('minutes', 0)
+        else:
+            # Format legacy : juste les minutes
+            preparateur = ''
+            minutes = verrou_info
+        
+        if (_minutes_invalides(minutes) or _hors_colonne(semaine, SEMAINE_LONGUEUR_MAX)
+                or not isinstance(preparateur, str) or _hors_colonne(preparateur, ID_LONGUEUR_MAX)):
+            raise HTTPException(status_code=400, detail=f"Verrou invalide pour la semaine {semaine} du chantier {chantier_id}")
+        if minutes > 0:  # Ne stocker que les verrous avec des minutes
+            lignes.append((chantier_id, semaine, preparateur, minutes))
+    return lignes
+
+
+def _params_verrous(chantier_ids, lignes):
+    """Paramètres de verrous_synchroniser (un tableau par colonne)"""
+    colonnes = [list(colonne) for colonne in zip(*lignes)] if lignes else [[], [], [], []]
+    return (chantier_ids, *colonnes)
+
+
+def _synchroniser_verrous(conn, chantier_id, forced_planning_lock):
+    """Remplacer les verrous d'un chantier et valider la transaction
+
+    Lève HTTPException 400 si les verrous sont invalides, 404 si le chantier
+    n'existe pas. Retourne le nombre de verrous stockés.
+    """
+    lignes = _lignes_verrous(chantier_id, forced_planning_lock)
+    cur = conn.cursor()
+    
+    # Vérifier que le chantier existe
+    prepared_queries.execute(cur, "chantier_existe", (chantier_id,))
+    if not cur.fetchone():
+        raise HTTPException(status_code=404, detail="Chantier non trouvé")
+    
+    prepared_queries.execute(cur, "verrous_synchroniser", _params_verrous([chantier_id], lignes))
+    
+    conn.commit()
+    return len(lignes)
+
+
 @router.get("/chantiers/{chantier_id}/forced-planning-lock")
-def get_forced_planning_lock(chantier_id: str):
+def get_forced_planning_lock(chantier_id: str, conn=Depends(get_read_db)):
     """Récupérer les verrous de planification forcée d'un chantier"""
-    conn = None
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Vérifier que le chantier existe
-        cur.execute("SELECT id FROM chantiers WHERE id = %s", (chantier_id,))
+        prepared_queries.execute(cur, "chantier_existe", (chantier_id,))
         if not cur.fetchone():
             raise HTTPException(status_code=404, detail="Chantier non trouvé")
         
         # Récupérer tous les verrous de ce chantier depuis la table verrous_planification
-        cur.execute("""
-            SELECT semaine, preparateur_nom, minutes 
-            FROM verrous_planification 
-            WHERE chantier_id = %s 
-            ORDER BY semaine
-        """, (chantier_id,))
+        prepared_queries.execute(cur, "verrous_chantier", (chantier_id,))
         
         rows = cur.fetchall()
         
@@ -705,52 +1447,16 @@ def get_forced_planning_lock(chantier_id: str):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.put("/chantiers/{chantier_id}/forced-planning-lock")
-def update_forced_planning_lock(chantier_id: str, lock_data: Dict[str, Any]):
+def update_forced_planning_lock(chantier_id: str, lock_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour les verrous de planification forcée d'un chantier"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Vérifier que le chantier existe
-        cur.execute("SELECT id FROM chantiers WHERE id = %s", (chantier_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="Chantier non trouvé")
-        
         # Valider et normaliser les données de verrous
         forced_planning_lock = lock_data.get('forced_planning_lock', {})
         
-        # Supprimer les anciens verrous pour ce chantier
-        cur.execute("DELETE FROM verrous_planification WHERE chantier_id = %s", (chantier_id,))
-        
-        # Insérer les nouveaux verrous
-        inserted_count = 0
-        for semaine, verrou_info in forced_planning_lock.items():
-            if isinstance(verrou_info, dict):
-                preparateur = verrou_info.get('preparateur', '')
-                minutes = verrou_info.get('minutes', 0)
-            else:
-                # Format legacy : juste les minutes
-                preparateur = ''
-                minutes = verrou_info
-            
-            if minutes > 0:  # Ne stocker que les verrous avec des minutes
-                cur.execute("""
-                    INSERT INTO verrous_planification (chantier_id, semaine, preparateur_nom, minutes)
-                    VALUES (%s, %s, %s, %s)
-                """, (chantier_id, semaine, preparateur, minutes))
-                inserted_count += 1
-        
-        conn.commit()
+        inserted_count = _synchroniser_verrous(conn, chantier_id, forced_planning_lock)
 
         return {
             "status": "✅ Verrous de planification mis à jour",
@@ -761,32 +1467,23 @@ def update_forced_planning_lock(chantier_id: str, lock_data: Dict[str, Any]):
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.delete("/chantiers/{chantier_id}/forced-planning-lock")
-def clear_forced_planning_lock(chantier_id: str):
+def clear_forced_planning_lock(chantier_id: str, conn=Depends(get_write_db)):
     """Supprimer tous les verrous de planification forcée d'un chantier"""
-    conn = None
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Vérifier que le chantier existe
-        cur.execute("SELECT id FROM chantiers WHERE id = %s", (chantier_id,))
+        prepared_queries.execute(cur, "chantier_existe", (chantier_id,))
         if not cur.fetchone():
             raise HTTPException(status_code=404, detail="Chantier non trouvé")
         
         # Supprimer tous les verrous de ce chantier
-        cur.execute("DELETE FROM verrous_planification WHERE chantier_id = %s", (chantier_id,))
+        prepared_queries.execute(cur, "verrous_supprimer_chantier", (chantier_id,))
         deleted_count = cur.rowcount
         
         conn.commit()
@@ -800,57 +1497,20 @@ def clear_forced_planning_lock(chantier_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 @router.put("/forced-planning-lock")
-def sync_forced_planning_lock_put(lock_data: Dict[str, Any]):
+def sync_forced_planning_lock_put(lock_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Synchroniser les verrous de planification forcée depuis le client (méthode PUT)"""
-    conn = None
     try:
         chantier_id = lock_data.get('chantier_id')
         forced_planning_lock = lock_data.get('forced_planning_lock', {})
         
-        if not chantier_id:
+        if not isinstance(chantier_id, str) or not chantier_id:
             raise HTTPException(status_code=400, detail="chantier_id requis")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Vérifier que le chantier existe
-        cur.execute("SELECT id FROM chantiers WHERE id = %s", (chantier_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="Chantier non trouvé")
-        
-        # Supprimer les anciens verrous pour ce chantier
-        cur.execute("DELETE FROM verrous_planification WHERE chantier_id = %s", (chantier_id,))
-        
-        # Insérer les nouveaux verrous
-        inserted_count = 0
-        for semaine, verrou_info in forced_planning_lock.items():
-            if isinstance(verrou_info, dict):
-                preparateur = verrou_info.get('preparateur', '')
-                minutes = verrou_info.get('minutes', 0)
-            else:
-                # Format legacy : juste les minutes
-                preparateur = ''
-                minutes = verrou_info
-            
-            if minutes > 0:  # Ne stocker que les verrous avec des minutes
-                cur.execute("""
-                    INSERT INTO verrous_planification (chantier_id, semaine, preparateur_nom, minutes)
-                    VALUES (%s, %s, %s, %s)
-                """, (chantier_id, semaine, preparateur, minutes))
-                inserted_count += 1
-        
-        conn.commit()
+        inserted_count = _synchroniser_verrous(conn, chantier_id, forced_planning_lock)
 
         return {
             "status": "✅ Verrous synchronisés",
@@ -861,58 +1521,21 @@ def sync_forced_planning_lock_put(lock_data: Dict[str, Any]):
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.post("/forced-planning-lock")
-def sync_forced_planning_lock(lock_data: Dict[str, Any]):
+def sync_forced_planning_lock(lock_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Synchroniser les verrous de planification forcée depuis le client (méthode POST)"""
-    conn = None
     try:
         chantier_id = lock_data.get('chantier_id')
         forced_planning_lock = lock_data.get('forced_planning_lock', {})
         
-        if not chantier_id:
+        if not isinstance(chantier_id, str) or not chantier_id:
             raise HTTPException(status_code=400, detail="chantier_id requis")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Vérifier que le chantier existe
-        cur.execute("SELECT id FROM chantiers WHERE id = %s", (chantier_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="Chantier non trouvé")
-        
-        # Supprimer les anciens verrous pour ce chantier
-        cur.execute("DELETE FROM verrous_planification WHERE chantier_id = %s", (chantier_id,))
-        
-        # Insérer les nouveaux verrous
-        inserted_count = 0
-        for semaine, verrou_info in forced_planning_lock.items():
-            if isinstance(verrou_info, dict):
-                preparateur = verrou_info.get('preparateur', '')
-                minutes = verrou_info.get('minutes', 0)
-            else:
-                # Format legacy : juste les minutes
-                preparateur = ''
-                minutes = verrou_info
-            
-            if minutes > 0:  # Ne stocker que les verrous avec des minutes
-                cur.execute("""
-                    INSERT INTO verrous_planification (chantier_id, semaine, preparateur_nom, minutes)
-                    VALUES (%s, %s, %s, %s)
-                """, (chantier_id, semaine, preparateur, minutes))
-                inserted_count += 1
-        
-        conn.commit()
+        inserted_count = _synchroniser_verrous(conn, chantier_id, forced_planning_lock)
         
         print(f"✅ Verrous synchronisés pour {chantier_id}: {inserted_count} verrous")
         
@@ -925,37 +1548,92 @@ def sync_forced_planning_lock(lock_data: Dict[str, Any]):
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         print(f"🚨 Erreur POST /forced-planning-lock: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
+
+
+def _preparer_verrous_bulk(data):
+    """Chantiers de PUT /forced-planning-lock/bulk : (chantier_ids, lignes à stocker)
+
+    Lève HTTPException 400 si la liste est vide, si un élément est invalide
+    (chantier_id non textuel, verrous refusés par _lignes_verrous) ou si un
+    chantier y figure deux fois.
+    """
+    chantiers = data.get('chantiers')
+    if not isinstance(chantiers, list) or not chantiers:
+        raise HTTPException(status_code=400, detail="'chantiers' doit être une liste non vide de verrous")
+    
+    chantier_ids, lignes, vus = [], [], set()
+    for verrous in chantiers:
+        if not isinstance(verrous, dict) or not isinstance(verrous.get('chantier_id'), str) or not verrous['chantier_id']:
+            raise HTTPException(status_code=400, detail="Chaque élément requiert 'chantier_id' et un objet 'forced_planning_lock'")
+        chantier_id = verrous['chantier_id']
+        if chantier_id in vus:
+            raise HTTPException(status_code=400, detail=f"Chantier {chantier_id} présent plusieurs fois")
+        vus.add(chantier_id)
+        chantier_ids.append(chantier_id)
+        lignes.extend(_lignes_verrous(chantier_id, verrous.get('forced_planning_lock', {})))
+    return chantier_ids, lignes
+
+
+@router.put("/forced-planning-lock/bulk")
+def sync_forced_planning_lock_bulk(data: Dict[str, Any], conn=Depends(get_write_db)):
+    """Synchroniser les verrous de plusieurs chantiers en une seule transaction
+
+    Corps : {"chantiers": [<corps de PUT /forced-planning-lock>, ...]}. Les
+    verrous de chaque chantier sont remplacés par ceux reçus (seules les
+    semaines ajoutées, modifiées ou retirées sont écrites). Vérification et
+    écriture de tous les chantiers en un seul aller-retour (unnest) ; 404
+    avec la liste des chantiers inconnus, rien n'est écrit.
+    """
+    try:
+        chantier_ids, lignes = _preparer_verrous_bulk(data)
+        
+        inconnus_cur, verrous_cur = execute_pipeline(conn, [
+            (prepared_queries.sql("chantiers_inconnus"), (chantier_ids,)),
+            (prepared_queries.sql("verrous_synchroniser"), _params_verrous(chantier_ids, lignes)),
+        ])
+        inconnus = inconnus_cur.fetchone()[0]
+        if inconnus:
+            conn.rollback()
+            raise HTTPException(status_code=404, detail=f"Chantier(s) non trouvé(s) : {', '.join(inconnus)}")
+        deleted_count, inserted_count, updated_count = verrous_cur.fetchone()
+        
+        conn.commit()
+        
+        return {
+            "status": "✅ Verrous synchronisés en masse",
+            "chantiers": len(chantier_ids),
+            "verrous": len(lignes),
+            "deleted": deleted_count,
+            "inserted": inserted_count,
+            "updated": updated_count,
+            "unchanged": len(lignes) - inserted_count - updated_count
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
 
 
 # Soldes des chantiers
 
 @router.get("/soldes/{chantier_id}")
-def get_soldes(chantier_id: str):
+def get_soldes(chantier_id: str, conn=Depends(get_read_db)):
     """Récupérer tous les soldes d'un chantier"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
+        rows = execute_query("""
             SELECT semaine, minutes
             FROM soldes
             WHERE chantier_id = %s
             ORDER BY semaine
-        """, (chantier_id,))
+        """, (chantier_id,), fetch="all", conn=conn)
         
         soldes = {}
-        for row in cur.fetchall():
+        for row in rows:
             semaine, minutes = row
             soldes[semaine] = minutes
         
@@ -967,22 +1645,12 @@ def get_soldes(chantier_id: str):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des soldes: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.put("/soldes")
-def update_soldes(solde_data: Dict[str, Any]):
+def update_soldes(solde_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour les soldes d'un chantier"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         chantier_id = solde_data.get('chantier_id')
         soldes = solde_data.get('soldes', {})
         
@@ -990,17 +1658,17 @@ def update_soldes(solde_data: Dict[str, Any]):
             raise HTTPException(status_code=400, detail="chantier_id requis")
         
         # Supprimer les anciens soldes pour ce chantier
-        cur.execute("DELETE FROM soldes WHERE chantier_id = %s", (chantier_id,))
+        execute_query("DELETE FROM soldes WHERE chantier_id = %s", (chantier_id,), conn=conn)
         
         # Insérer les nouveaux soldes
-        for semaine, minutes in soldes.items():
-            if minutes > 0:  # Ne stocker que les soldes positifs
-                cur.execute("""
-                    INSERT INTO soldes (chantier_id, semaine, minutes)
-                    VALUES (%s, %s, %s)
-                """, (chantier_id, semaine, minutes))
-        
-        conn.commit()
+        execute_many("""
+            INSERT INTO soldes (chantier_id, semaine, minutes)
+            VALUES (%s, %s, %s)
+        """, [
+            (chantier_id, semaine, minutes)
+            for semaine, minutes in soldes.items()
+            if minutes > 0  # Ne stocker que les soldes positifs
+        ], conn=conn, commit=True)
         
         return {
             "chantier_id": chantier_id,
@@ -1009,25 +1677,13 @@ def update_soldes(solde_data: Dict[str, Any]):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour des soldes: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.post("/soldes")
-def create_or_update_solde(solde_data: Dict[str, Any]):
+def create_or_update_solde(solde_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Créer ou mettre à jour un solde spécifique"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         chantier_id = solde_data.get('chantier_id')
         semaine = solde_data.get('semaine')
         minutes = solde_data.get('minutes', 0)
@@ -1037,20 +1693,18 @@ def create_or_update_solde(solde_data: Dict[str, Any]):
         
         if minutes <= 0:
             # Si minutes <= 0, supprimer le solde
-            cur.execute("""
+            execute_query("""
                 DELETE FROM soldes 
                 WHERE chantier_id = %s AND semaine = %s
-            """, (chantier_id, semaine))
+            """, (chantier_id, semaine), conn=conn, commit=True)
         else:
             # Sinon, insérer ou mettre à jour
-            cur.execute("""
+            execute_query("""
                 INSERT INTO soldes (chantier_id, semaine, minutes)
                 VALUES (%s, %s, %s)
                 ON CONFLICT (chantier_id, semaine) 
                 DO UPDATE SET minutes = %s
-            """, (chantier_id, semaine, minutes, minutes))
-        
-        conn.commit()
+            """, (chantier_id, semaine, minutes, minutes), conn=conn, commit=True)
         
         return {
             "chantier_id": chantier_id,
@@ -1060,29 +1714,14 @@ def create_or_update_solde(solde_data: Dict[str, Any]):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création/mise à jour du solde: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.delete("/soldes/{chantier_id}")
-def delete_all_soldes(chantier_id: str):
+def delete_all_soldes(chantier_id: str, conn=Depends(get_write_db)):
     """Supprimer tous les soldes d'un chantier"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("DELETE FROM soldes WHERE chantier_id = %s", (chantier_id,))
-        deleted_count = cur.rowcount
-        
-        conn.commit()
+        deleted_count = execute_query("DELETE FROM soldes WHERE chantier_id = %s", (chantier_id,), conn=conn, commit=True)
         
         return {
             "chantier_id": chantier_id,
@@ -1091,32 +1730,17 @@ def delete_all_soldes(chantier_id: str):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression des soldes: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.delete("/soldes/{chantier_id}/{semaine}")
-def delete_solde(chantier_id: str, semaine: str):
+def delete_solde(chantier_id: str, semaine: str, conn=Depends(get_write_db)):
     """Supprimer un solde spécifique"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
+        deleted_count = execute_query("""
             DELETE FROM soldes 
             WHERE chantier_id = %s AND semaine = %s
-        """, (chantier_id, semaine))
-        
-        deleted_count = cur.rowcount
-        conn.commit()
+        """, (chantier_id, semaine), conn=conn, commit=True)
         
         return {
             "chantier_id": chantier_id,
@@ -1126,50 +1750,29 @@ def delete_solde(chantier_id: str, semaine: str):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du solde: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.delete("/chantiers/{chantier_id}")
-def delete_chantier(chantier_id: str):
+def delete_chantier(chantier_id: str, conn=Depends(get_write_db)):
     """Supprimer un chantier spécifique et toutes ses données associées"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Vérifier si le chantier existe
-        cur.execute("SELECT id FROM chantiers WHERE id = %s", (chantier_id,))
-        chantier = cur.fetchone()
-        
-        if not chantier:
+        # Supprimer le chantier et toutes ses données associées en un seul aller-retour :
+        # soldes, planifications, verrous puis le chantier lui-même
+        soldes_cur, planifications_cur, verrous_cur, chantier_cur = execute_pipeline(conn, [
+            ("DELETE FROM soldes WHERE chantier_id = %s", (chantier_id,)),
+            ("DELETE FROM planifications WHERE chantier_id = %s", (chantier_id,)),
+            (prepared_queries.sql("verrous_supprimer_chantier"), (chantier_id,)),
+            ("DELETE FROM chantiers WHERE id = %s", (chantier_id,)),
+        ])
+        soldes_deleted = soldes_cur.rowcount
+        planifications_deleted = planifications_cur.rowcount
+        verrous_deleted = verrous_cur.rowcount
+        
+        # Chantier inexistant : rien n'a été supprimé, la transaction est annulée
+        if chantier_cur.rowcount == 0:
             raise HTTPException(status_code=404, detail=f"Chantier {chantier_id} non trouvé")
         
-        # Supprimer toutes les données associées au chantier
-        # 1. Supprimer les soldes
-        cur.execute("DELETE FROM soldes WHERE chantier_id = %s", (chantier_id,))
-        soldes_deleted = cur.rowcount
-        
-        # 2. Supprimer les planifications
-        cur.execute("DELETE FROM planifications WHERE chantier_id = %s", (chantier_id,))
-        planifications_deleted = cur.rowcount
-
-        # 3. Supprimer le verrou
-        cur.execute("DELETE FROM verrous_planification WHERE chantier_id = %s", (chantier_id,))
-        verrous_deleted = cur.rowcount
-        
-        # 4. Supprimer le chantier
-        cur.execute("DELETE FROM chantiers WHERE id = %s", (chantier_id,))
-        chantier_deleted = cur.rowcount
-
-
         conn.commit()
         
         return {
@@ -1182,46 +1785,28 @@ def delete_chantier(chantier_id: str):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du chantier: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
 
 
 @router.delete("/chantiers")
-def delete_all_chantiers():
+def delete_all_chantiers(conn=Depends(get_admin_db)):
     """Supprimer tous les chantiers et toutes leurs données associées"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # 1. Supprimer tous les soldes
-        cur.execute("DELETE FROM soldes")
-        soldes_deleted = cur.rowcount
+        soldes_deleted = execute_query("DELETE FROM soldes", conn=conn)
         
         # 2. Supprimer toutes les planifications
-        cur.execute("DELETE FROM planifications")
-        planifications_deleted = cur.rowcount
+        planifications_deleted = execute_query("DELETE FROM planifications", conn=conn)
         
         # 3. Supprimer tous les verrous
-        cur.execute("DELETE FROM verrous_planification")
-        verrous_deleted = cur.rowcount
+        verrous_deleted = execute_query("DELETE FROM verrous_planification", conn=conn)
         
         # 4. Supprimer tous les chantiers
-        cur.execute("DELETE FROM chantiers")
-        chantiers_deleted = cur.rowcount
-        
-        conn.commit()
+        chantiers_deleted = execute_query("DELETE FROM chantiers", conn=conn, commit=True)
         
         return {
             "deleted": True,
@@ -1234,16 +1819,6 @@ def delete_all_chantiers():
         }
     
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression de tous les chantiers: {str(e)}")
-    finally:
-        if conn:
-            try:
-                close_db_connection(conn)
-            except:
-                pass
@@ -1,54 +1,204 @@
-# Configuration pour PostgreSQL sur Render avec psycopg3
+"""
+Accès aux données partagé par les routes
+
+Ce module contient :
+- execute_query() : exécution d'une requête sur une connexion des pools de main
+  (celle de la requête HTTP en cours, ou une connexion empruntée pour l'appel)
+- Les modes de récupération : "none", "one", "all", "scalar" et "iter"
+  (curseur côté serveur, lignes lues par lots sans tout charger en mémoire)
+- execute_many() : même requête pour une liste de paramètres (executemany)
+- La gestion de transaction : commit en sortie normale, rollback sur erreur
+- Les durées par requête exposées par GET /admin/query-stats
+
+DB_SLOW_QUERY_MS (défaut 500) : seuil au-delà duquel un appel est journalisé.
+DB_ITER_BATCH_SIZE (défaut 500) : lignes lues par aller-retour en mode "iter".
+"""
+
+import itertools
 import os
-from urllib.parse import urlparse
-
-def get_database_connection():
-    """Retourne une connexion PostgreSQL avec psycopg3"""
-    database_url = os.environ.get('DATABASE_URL')
-    
-    if not database_url:
-        raise Exception("❌ DATABASE_URL non définie.")
-        
-    # Utiliser psycopg3 (déjà testé et fonctionnel)
-    import psycopg
-    
-    url = urlparse(database_url)
-    return psycopg.connect(
-        dbname=url.path[1:],
-        user=url.username,
-        password=url.password,
-        host=url.hostname,
-        port=url.port
-    )
-
-def execute_query(query, params=None, fetch=False):
-    """Exécute une requête avec gestion des différences PostgreSQL/SQLite"""
-    conn = get_database_connection()
-    database_url = os.environ.get('DATABASE_URL')
-    
+import threading
+import time
+from contextlib import contextmanager
+
+
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 500))
+ITER_BATCH_SIZE = int(os.environ.get("DB_ITER_BATCH_SIZE", 500))
+
+FETCH_MODES = ("none", "one", "all", "scalar", "iter")
+
+# Clé de requête -> compteurs cumulés (appels, erreurs, lignes, durées)
+_stats = {}
+_lock = threading.Lock()
+_cursor_ids = itertools.count(1)
+
+
+def get_database_connection(pool_name="write"):
+    """Emprunter une connexion au pool nommé de main
+
+    ⚠️ La connexion DOIT être rendue via main.close_db_connection().
+    Préférer execute_query() ou main.db_session() qui garantissent la restitution.
+    """
+    from main import get_db_connection
+    return get_db_connection(pool_name)
+
+
+def _query_key(query, name):
+    """Clé des statistiques : nom explicite, sinon début du texte SQL normalisé"""
+    if name:
+        return name
+    return " ".join(query.split())[:80]
+
+
+def _record(key, started, rows, error=False):
+    """Cumuler la durée d'un appel et journaliser les requêtes lentes"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _lock:
+        stats = _stats.setdefault(key, {"calls": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += int(error)
+        stats["rows"] += rows
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        print(f"🐢 Requête lente ({elapsed_ms:.0f} ms) : {key}")
+
+
+@contextmanager
+def _transaction(conn, pool_name, commit):
+    """Connexion de l'appel : emprunt au pool si conn est absente
+
+    Connexion empruntée : toujours validée (ou annulée sur erreur) puis rendue.
+    Connexion fournie : validée / annulée seulement si commit=True, sinon la
+    transaction reste à la charge de l'appelant (ex: dépendance get_write_db).
+    """
+    if conn is None:
+        from main import db_session
+        with db_session(pool_name) as leased:
+            yield leased
+        return
     try:
-        if database_url:  # PostgreSQL
-            cur = conn.cursor()
-            if params:
-                cur.execute(query, params)
+        yield conn
+        if commit:
+            conn.commit()
+    except BaseException:
+        if commit:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        raise
+
+
+def execute_query(query, params=None, fetch="none", conn=None, pool_name="write", commit=False, name=None,
+                  batch_size=None):
+    """Exécuter une requête sur une connexion poolée
+
+    fetch :
+    - "none"   : nombre de lignes affectées (rowcount)
+    - "one"    : première ligne (tuple) ou None
+    - "all"    : liste de toutes les lignes
+    - "scalar" : première colonne de la première ligne, ou None
+    - "iter"   : générateur de lignes alimenté par un curseur côté serveur,
+                 par lots de batch_size ; la connexion reste occupée jusqu'à
+                 épuisement (ou fermeture) du générateur
+    fetch=True / False restent acceptés ("all" / "none").
+
+    conn : connexion déjà empruntée (dépendances get_*_db de main). Sans conn,
+    une connexion du pool pool_name est empruntée pour l'appel puis rendue.
+    commit : valider la transaction de conn après l'appel (rollback sur erreur).
+    name : clé des statistiques de GET /admin/query-stats.
+    """
+    if fetch is True:
+        fetch = "all"
+    elif fetch is False or fetch is None:
+        fetch = "none"
+    if fetch not in FETCH_MODES:
+        raise ValueError(f"Mode de récupération inconnu: {fetch} (attendu: {', '.join(FETCH_MODES)})")
+
+    key = _query_key(query, name)
+    if fetch == "iter":
+        return _iter_query(query, params, conn, pool_name, commit, key, batch_size or ITER_BATCH_SIZE)
+
+    started = time.perf_counter()
+    rows = 0
+    try:
+        with _transaction(conn, pool_name, commit) as c:
+            cur = c.cursor()
+            cur.execute(query, params)
+            if fetch == "none":
+                result = cur.rowcount
+                rows = max(result, 0)
+            elif fetch == "all":
+                result = cur.fetchall()
+                rows = len(result)
             else:
-                cur.execute(query)
-        else:  # SQLite
-            cur = conn.cursor()
-            if params:
+                row = cur.fetchone()
+                rows = int(row is not None)
+                result = row if fetch == "one" else (row[0] if row else None)
+    except Exception:
+        _record(key, started, rows, error=True)
+        raise
+    _record(key, started, rows)
+    return result
+
+
+def execute_many(query, params_seq, conn=None, pool_name="write", commit=False, name=None):
+    """Exécuter une requête pour chaque jeu de paramètres (executemany), même transaction
+
+    Mêmes règles de connexion, de commit et de statistiques qu'execute_query().
+    Retourne le nombre de lignes affectées.
+    """
+    params_seq = list(params_seq)
+    key = _query_key(query, name)
+    started = time.perf_counter()
+    rows = 0
+    try:
+        with _transaction(conn, pool_name, commit) as c:
+            cur = c.cursor()
+            if params_seq:
+                cur.executemany(query, params_seq)
+                rows = max(cur.rowcount, 0)
+    except Exception:
+        _record(key, started, rows, error=True)
+        raise
+    _record(key, started, rows)
+    return rows
+
+
+def _iter_query(query, params, conn, pool_name, commit, key, batch_size):
+    """Lignes d'un curseur côté serveur, lues par lots de batch_size"""
+    started = time.perf_counter()
+    rows = 0
+    error = False
+    try:
+        with _transaction(conn, pool_name, commit) as c:
+            # Curseur nommé = DECLARE ... CURSOR côté serveur (psycopg2 et psycopg3)
+            cur = c.cursor(name=f"execute_query_{next(_cursor_ids)}")
+            cur.itersize = batch_size
+            try:
                 cur.execute(query, params)
-            else:
-                cur.execute(query)
-        
-        if fetch:
-            result = cur.fetchall()
-            conn.close()
-            return result
-        else:
-            conn.commit()
-            conn.close()
-            return True
-            
-    except Exception as e:
-        conn.close()
-        raise e
+                for row in cur:
+                    rows += 1
+                    yield row
+            finally:
+                cur.close()
+    except Exception:
+        error = True
+        raise
+    finally:
+        _record(key, started, rows, error)
+
+
+def get_query_stats() -> dict:
+    """Durées cumulées par requête, de la plus coûteuse à la moins coûteuse"""
+    with _lock:
+        requetes = {
+            key: {
+                **stats,
+                "total_ms": round(stats["total_ms"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 2)
+            }
+            for key, stats in sorted(_stats.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        }
+    return {"slow_query_ms": SLOW_QUERY_MS, "queries": requetes}
@@ -11,9 +11,10 @@ Ce module contient toutes les routes relatives au nouveau système de disponibil
 import re
 import os
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from typing import Dict, Optional, Any, List
-from main import get_db_connection, close_db_connection
+import prepared_queries
+from main import get_admin_db, get_async_admin_db, DB_ASYNC_ENABLED
 
 # Créer le router pour les disponibilités
 router = APIRouter(
@@ -109,9 +110,20 @@ def dates_de_semaine(semaine: str) -> dict:
 # FONCTION DE CALCUL DES DISPONIBILITÉS (RÉUTILISABLE)
 # ========================================================================
 
+def _aucun_horaire(preparateur_nom: str, semaine: str) -> dict:
+    return {
+        "preparateur": preparateur_nom,
+        "semaine": semaine,
+        "disponibilite_minutes": 0,
+        "disponibilite_heures": 0,
+        "message": "Aucun horaire défini pour ce préparateur",
+        "detail_par_jour": {}
+    }
+
+
 def calculer_disponibilites_preparateur(preparateur_nom: str, semaine: str, conn):
     """
-    Fonction pure de calcul des disponibilités d'un préparateur
+    Calcul des disponibilités d'un préparateur (connexion sync)
     Séparée de la logique HTTP pour réutilisabilité
     
     Args:
@@ -125,30 +137,58 @@ def calculer_disponibilites_preparateur(preparateur_nom: str, semaine: str, conn
     cur = conn.cursor()
     
     # 1. Récupérer les horaires du préparateur
-    cur.execute("""
-        SELECT jour_semaine, heure_debut, heure_fin
-        FROM horaires_preparateurs
-        WHERE preparateur_nom = %s
-        ORDER BY CASE jour_semaine 
-                     WHEN 'lundi' THEN 1 WHEN 'mardi' THEN 2 WHEN 'mercredi' THEN 3 
-                     WHEN 'jeudi' THEN 4 WHEN 'vendredi' THEN 5 WHEN 'samedi' THEN 6 
-                     WHEN 'dimanche' THEN 7 
-                 END,
-                 heure_debut
-    """, (preparateur_nom,))
-    
+    prepared_queries.execute(cur, "horaires_preparateur", (preparateur_nom,))
     horaires_preparateur = cur.fetchall()
     
     if not horaires_preparateur:
-        return {
-            "preparateur": preparateur_nom,
-            "semaine": semaine,
-            "disponibilite_minutes": 0,
-            "disponibilite_heures": 0,
-            "message": "Aucun horaire défini pour ce préparateur",
-            "detail_par_jour": {}
-        }
+        return _aucun_horaire(preparateur_nom, semaine)
+    
+    # 2. Récupérer les étiquettes planifiées pour cette semaine
+    dates_info = dates_de_semaine(semaine)
+    prepared_queries.execute(cur, "etiquettes_semaine_preparateur", (dates_info['debut'], dates_info['fin'], f'%{preparateur_nom}%'))
+    etiquettes_planifiees = cur.fetchall()
+    
+    return calculer_disponibilites_depuis_donnees(
+        preparateur_nom, semaine, horaires_preparateur, dates_info, etiquettes_planifiees
+    )
+
+
+async def calculer_disponibilites_preparateur_async(preparateur_nom: str, semaine: str, conn):
+    """Calcul des disponibilités d'un préparateur (connexion asyncio)"""
+    cur = conn.cursor()
+    
+    await prepared_queries.execute_async(cur, "horaires_preparateur", (preparateur_nom,))
+    horaires_preparateur = await cur.fetchall()
     
+    if not horaires_preparateur:
+        return _aucun_horaire(preparateur_nom, semaine)
+    
+    dates_info = dates_de_semaine(semaine)
+    await prepared_queries.execute_async(cur, "etiquettes_semaine_preparateur", (dates_info['debut'], dates_info['fin'], f'%{preparateur_nom}%'))
+    etiquettes_planifiees = await cur.fetchall()
+    
+    return calculer_disponibilites_depuis_donnees(
+        preparateur_nom, semaine, horaires_preparateur, dates_info, etiquettes_planifiees
+    )
+
+
+def calculer_disponibilites_depuis_donnees(preparateur_nom: str, semaine: str,
+                                           horaires_preparateur, dates_info: dict,
+                                           etiquettes_planifiees) -> dict:
+    """
+    Fonction pure de calcul des disponibilités (aucun accès base)
+    
+    Args:
+        preparateur_nom: Nom du préparateur
+        semaine: Semaine au format YYYY-WXX
+        horaires_preparateur: Lignes (jour_semaine, heure_debut, heure_fin)
+        dates_info: Résultat de dates_de_semaine(semaine)
+        etiquettes_planifiees: Lignes (date_jour, heure_debut, heure_fin, preparateurs,
+                               type_activite, description) de la semaine
+        
+    Returns:
+        dict: Détails complets des disponibilités calculées
+    """
     # 2. Calculer les minutes totales d'horaires par jour
     horaires_par_jour = {}
     total_minutes_horaires = 0
@@ -170,22 +210,9 @@ def calculer_disponibilites_preparateur(preparateur_nom: str, semaine: str, conn
         
         total_minutes_horaires += duree_minutes
     
-    # 3. Calculer les dates de la semaine
-    dates_info = dates_de_semaine(semaine)
+    # 3. Dates de la semaine
     dates_semaine = {k: v for k, v in dates_info.items() if k not in ['debut', 'fin']}
     
-    # 4. Récupérer les étiquettes planifiées pour cette semaine
-    cur.execute("""
-        SELECT p.date_jour, p.heure_debut, p.heure_fin, p.preparateurs,
-               e.type_activite, e.description
-        FROM planifications_etiquettes p
-        INNER JOIN etiquettes_grille e ON p.etiquette_id = e.id
-        WHERE p.date_jour BETWEEN %s AND %s
-        AND p.preparateurs LIKE %s
-    """, (dates_info['debut'], dates_info['fin'], f'%{preparateur_nom}%'))
-    
-    etiquettes_planifiees = cur.fetchall()
-    
     # 5. ✅ NOUVELLE LOGIQUE : Grouper les étiquettes par jour et fusionner les créneaux
     def fusionner_creneaux(creneaux):
         """Fusionner les créneaux qui se chevauchent ou sont contigus"""
@@ -309,73 +336,163 @@ def calculer_disponibilites_preparateur(preparateur_nom: str, semaine: str, conn
 # ROUTES DE SAUVEGARDE DES DISPONIBILITÉS
 # ========================================================================
 
-@router.post("/disponibilites/recalculer")
+REQUIRED_TABLES = ['horaires_preparateurs', 'planifications_etiquettes', 'disponibilites']
+
+TABLES_EXISTANTES_QUERY = """
+    SELECT table_name FROM information_schema.tables 
+    WHERE table_schema = 'public' 
+    AND table_name = ANY(%s)
+"""
+
+PREPARATEURS_AVEC_HORAIRES_QUERY = "SELECT DISTINCT preparateur_nom FROM horaires_preparateurs"
+
+DISPONIBILITES_UPSERT_QUERY = """
+    INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (preparateur_nom, semaine) 
+    DO UPDATE SET 
+        minutes = EXCLUDED.minutes,
+        updatedAt = EXCLUDED.updatedAt
+"""
+
+
+def _determiner_semaines(semaine: Optional[str], semaines: Optional[List[str]]) -> List[str]:
+    """Semaines à traiter (multi, unique ou courante), formats validés"""
+    if semaines:
+        # Mode multi-semaines
+        semaines_a_traiter = semaines
+    elif semaine:
+        # Mode semaine unique
+        semaines_a_traiter = [semaine]
+    else:
+        # Mode par défaut : semaine courante
+        semaines_a_traiter = [semaine_courante()]
+    
+    # ✅ VALIDATION DES FORMATS
+    for sem in semaines_a_traiter:
+        if not valider_format_semaine(sem):
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Format de semaine invalide: {sem}. Utilisez YYYY-WXX (ex: 2025-W35)"
+            )
+    
+    return semaines_a_traiter
+
+
+def _verifier_tables(existing_tables: List[str]):
+    missing_tables = [t for t in REQUIRED_TABLES if t not in existing_tables]
+    
+    if missing_tables:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": "Tables de base de données manquantes",
+                "missing_tables": missing_tables,
+                "solution": "Utilisez l'endpoint POST /admin/create-all-tables pour créer les tables"
+            }
+        )
+
+
+def _verifier_preparateurs(preparateurs: List[str]):
+    if not preparateurs:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": "Aucun préparateur trouvé",
+                "message": "Aucun préparateur n'a d'horaires définis"
+            }
+        )
+
+
+def _resultat_calcul(preparateur_nom: str, semaine: str, resultat_calcul: dict) -> dict:
+    return {
+        "preparateur": preparateur_nom,
+        "semaine": semaine,
+        "disponibilite_minutes": resultat_calcul['disponibilite_minutes'],
+        "disponibilite_heures": resultat_calcul['disponibilite_heures'],
+        "total_horaires_heures": resultat_calcul['total_horaires_heures'],
+        "total_occupees_heures": resultat_calcul['total_occupees_heures'],
+        "status": "✅ Calculé"
+    }
+
+
+def _resultat_erreur(preparateur_nom: str, semaine: str, e: Exception) -> dict:
+    return {
+        "preparateur": preparateur_nom,
+        "semaine": semaine,
+        "status": "❌ Erreur",
+        "error": str(e)
+    }
+
+
+def _resultats_semaine(semaine: str, resultats_sauvegarde: list, preparateurs: List[str]) -> dict:
+    return {
+        "semaine": semaine,
+        "resultats": resultats_sauvegarde,
+        "nb_preparateurs": len(preparateurs),
+        "nb_reussites": len([r for r in resultats_sauvegarde if r.get("status") == "✅ Calculé"])
+    }
+
+
+def _marquer_sauvegarde(resultats_par_semaine: dict):
+    for semaine_key, semaine_data in resultats_par_semaine.items():
+        for resultat in semaine_data["resultats"]:
+            if resultat.get("status") == "✅ Calculé":
+                resultat["status"] = "✅ Sauvegardé"
+
+
+def _reponse_recalcul(semaines_a_traiter: List[str], resultats_par_semaine: dict) -> dict:
+    # ✅ STATISTIQUES FINALES
+    total_calculs = sum(len(s["resultats"]) for s in resultats_par_semaine.values())
+    total_reussites = sum(s["nb_reussites"] for s in resultats_par_semaine.values())
+    
+    print(f"✅ Batch terminé: {total_reussites}/{total_calculs} calculs réussis sur {len(semaines_a_traiter)} semaines")
+    
+    # ✅ RETOUR ADAPTATIF selon le mode
+    if len(semaines_a_traiter) == 1:
+        # Mode semaine unique : format de retour compatible
+        semaine_unique = list(resultats_par_semaine.values())[0]
+        return {
+            "status": "✅ Disponibilités recalculées et sauvegardées",
+            "semaine": semaine_unique["semaine"],
+            "resultats": semaine_unique["resultats"],
+            "summary": f"{semaine_unique['nb_reussites']}/{semaine_unique['nb_preparateurs']} préparateurs traités"
+        }
+    else:
+        # Mode multi-semaines : format détaillé
+        return {
+            "status": "✅ Disponibilités recalculées en batch",
+            "mode": "multi_semaines",
+            "nb_semaines": len(semaines_a_traiter),
+            "nb_calculs_total": total_calculs,
+            "nb_reussites_total": total_reussites,
+            "resultats_par_semaine": resultats_par_semaine,
+            "summary": f"{total_reussites}/{total_calculs} calculs réussis sur {len(semaines_a_traiter)} semaines"
+        }
+
+
 def recalculer_et_sauvegarder_disponibilites(
     semaine: Optional[str] = None, 
     semaines: Optional[List[str]] = None,  # ✅ NOUVEAU : accepter plusieurs semaines
-    preparateurs: Optional[List[str]] = None
+    preparateurs: Optional[List[str]] = None,
+    conn=Depends(get_admin_db)
 ):
     """POST : Recalculer les disponibilités - accepte une seule semaine OU plusieurs semaines"""
-    conn = None
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # ✅ DÉTERMINER LES SEMAINES À TRAITER
-        semaines_a_traiter = []
-        
-        if semaines:
-            # Mode multi-semaines
-            semaines_a_traiter = semaines
-        elif semaine:
-            # Mode semaine unique
-            semaines_a_traiter = [semaine]
-        else:
-            # Mode par défaut : semaine courante
-            semaines_a_traiter = [semaine_courante()]
-        
-        # ✅ VALIDATION DES FORMATS
-        for sem in semaines_a_traiter:
-            if not valider_format_semaine(sem):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Format de semaine invalide: {sem}. Utilisez YYYY-WXX (ex: 2025-W35)"
-                )
+        semaines_a_traiter = _determiner_semaines(semaine, semaines)
         
         # ✅ VÉRIFICATION DES TABLES REQUISES
-        required_tables = ['horaires_preparateurs', 'planifications_etiquettes', 'disponibilites']
-        cur.execute(f"""
-            SELECT table_name FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = ANY(%s)
-        """, (required_tables,))
-        
-        existing_tables = [row[0] for row in cur.fetchall()]
-        missing_tables = [t for t in required_tables if t not in existing_tables]
-        
-        if missing_tables:
-            raise HTTPException(
-                status_code=422,
-                detail={
-                    "error": "Tables de base de données manquantes",
-                    "missing_tables": missing_tables,
-                    "solution": "Utilisez l'endpoint POST /admin/create-all-tables pour créer les tables"
-                }
-            )
+        cur.execute(TABLES_EXISTANTES_QUERY, (REQUIRED_TABLES,))
+        _verifier_tables([row[0] for row in cur.fetchall()])
         
         # ✅ OBTENIR LES PRÉPARATEURS
         if not preparateurs:
-            cur.execute("SELECT DISTINCT preparateur_nom FROM horaires_preparateurs")
+            cur.execute(PREPARATEURS_AVEC_HORAIRES_QUERY)
             preparateurs = [row[0] for row in cur.fetchall()]
-        
-        if not preparateurs:
-            raise HTTPException(
-                status_code=422,
-                detail={
-                    "error": "Aucun préparateur trouvé",
-                    "message": "Aucun préparateur n'a d'horaires définis"
-                }
-            )
+        _verifier_preparateurs(preparateurs)
         
         # ✅ TRAITEMENT EN BATCH : TOUTES LES SEMAINES D'UN COUP
         print(f"🔄 Traitement en batch: {len(semaines_a_traiter)} semaines × {len(preparateurs)} préparateurs")
@@ -385,103 +502,101 @@ def recalculer_et_sauvegarder_disponibilites(
         timestamp_iso = datetime.now().isoformat()
         
         # ✅ CALCULER TOUTES LES COMBINAISONS
-        for semaine_courante in semaines_a_traiter:
+        for semaine_cible in semaines_a_traiter:
             resultats_sauvegarde = []
             
             for preparateur_nom in preparateurs:
                 try:
-                    resultat_calcul = calculer_disponibilites_preparateur(preparateur_nom, semaine_courante, conn)
+                    resultat_calcul = calculer_disponibilites_preparateur(preparateur_nom, semaine_cible, conn)
                     
                     # Préparer les données pour le batch UPSERT
-                    batch_upserts.append((
-                        preparateur_nom,
-                        semaine_courante,
-                        resultat_calcul['disponibilite_minutes'],
-                        timestamp_iso
-                    ))
-                    
-                    resultats_sauvegarde.append({
-                        "preparateur": preparateur_nom,
-                        "semaine": semaine_courante,
-                        "disponibilite_minutes": resultat_calcul['disponibilite_minutes'],
-                        "disponibilite_heures": resultat_calcul['disponibilite_heures'],
-                        "total_horaires_heures": resultat_calcul['total_horaires_heures'],
-                        "total_occupees_heures": resultat_calcul['total_occupees_heures'],
-                        "status": "✅ Calculé"
-                    })
+                    batch_upserts.append((preparateur_nom, semaine_cible, resultat_calcul['disponibilite_minutes'], timestamp_iso))
+                    resultats_sauvegarde.append(_resultat_calcul(preparateur_nom, semaine_cible, resultat_calcul))
                     
                 except Exception as e:
-                    resultats_sauvegarde.append({
-                        "preparateur": preparateur_nom,
-                        "semaine": semaine_courante,
-                        "status": "❌ Erreur",
-                        "error": str(e)
-                    })
+                    resultats_sauvegarde.append(_resultat_erreur(preparateur_nom, semaine_cible, e))
             
-            resultats_par_semaine[semaine_courante] = {
-                "semaine": semaine_courante,
-                "resultats": resultats_sauvegarde,
-                "nb_preparateurs": len(preparateurs),
-                "nb_reussites": len([r for r in resultats_sauvegarde if r.get("status") == "✅ Calculé"])
-            }
+            resultats_par_semaine[semaine_cible] = _resultats_semaine(semaine_cible, resultats_sauvegarde, preparateurs)
         
         # ✅ SAUVEGARDER TOUT EN UNE SEULE TRANSACTION
         if batch_upserts:
             print(f"💾 Sauvegarde en batch de {len(batch_upserts)} disponibilités...")
-            
-            cur.executemany("""
-                INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (preparateur_nom, semaine) 
-                DO UPDATE SET 
-                    minutes = EXCLUDED.minutes,
-                    updatedAt = EXCLUDED.updatedAt
-            """, batch_upserts)
-            
-            # Marquer comme sauvegardé
-            for semaine_key, semaine_data in resultats_par_semaine.items():
-                for resultat in semaine_data["resultats"]:
-                    if resultat.get("status") == "✅ Calculé":
-                        resultat["status"] = "✅ Sauvegardé"
+            cur.executemany(DISPONIBILITES_UPSERT_QUERY, batch_upserts)
+            _marquer_sauvegarde(resultats_par_semaine)
         
         conn.commit()
         
-        # ✅ STATISTIQUES FINALES
-        total_calculs = sum(len(s["resultats"]) for s in resultats_par_semaine.values())
-        total_reussites = sum(s["nb_reussites"] for s in resultats_par_semaine.values())
-        
-        print(f"✅ Batch terminé: {total_reussites}/{total_calculs} calculs réussis sur {len(semaines_a_traiter)} semaines")
-        
-        # ✅ RETOUR ADAPTATIF selon le mode
-        if len(semaines_a_traiter) == 1:
-            # Mode semaine unique : format de retour compatible
-            semaine_unique = list(resultats_par_semaine.values())[0]
-            return {
-                "status": "✅ Disponibilités recalculées et sauvegardées",
-                "semaine": semaine_unique["semaine"],
-                "resultats": semaine_unique["resultats"],
-                "summary": f"{semaine_unique['nb_reussites']}/{semaine_unique['nb_preparateurs']} préparateurs traités"
-            }
-        else:
-            # Mode multi-semaines : format détaillé
-            return {
-                "status": "✅ Disponibilités recalculées en batch",
-                "mode": "multi_semaines",
-                "nb_semaines": len(semaines_a_traiter),
-                "nb_calculs_total": total_calculs,
-                "nb_reussites_total": total_reussites,
-                "resultats_par_semaine": resultats_par_semaine,
-                "summary": f"{total_reussites}/{total_calculs} calculs réussis sur {len(semaines_a_traiter)} semaines"
-            }
+        return _reponse_recalcul(semaines_a_traiter, resultats_par_semaine)
         
     except HTTPException:
         # Re-lever les HTTPException sans modification
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         print(f"❌ Erreur dans recalculer_et_sauvegarder_disponibilites: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
+
+
+async def recalculer_et_sauvegarder_disponibilites_async(
+    semaine: Optional[str] = None, 
+    semaines: Optional[List[str]] = None,
+    preparateurs: Optional[List[str]] = None,
+    conn=Depends(get_async_admin_db)
+):
+    """POST : Recalculer les disponibilités (version asyncio)"""
+    try:
+        cur = conn.cursor()
+        
+        semaines_a_traiter = _determiner_semaines(semaine, semaines)
+        
+        await cur.execute(TABLES_EXISTANTES_QUERY, (REQUIRED_TABLES,))
+        _verifier_tables([row[0] for row in await cur.fetchall()])
+        
+        if not preparateurs:
+            await cur.execute(PREPARATEURS_AVEC_HORAIRES_QUERY)
+            preparateurs = [row[0] for row in await cur.fetchall()]
+        _verifier_preparateurs(preparateurs)
+        
+        print(f"🔄 Traitement en batch: {len(semaines_a_traiter)} semaines × {len(preparateurs)} préparateurs")
+        
+        resultats_par_semaine = {}
+        batch_upserts = []
+        timestamp_iso = datetime.now().isoformat()
+        
+        for semaine_cible in semaines_a_traiter:
+            resultats_sauvegarde = []
+            
+            for preparateur_nom in preparateurs:
+                try:
+                    resultat_calcul = await calculer_disponibilites_preparateur_async(preparateur_nom, semaine_cible, conn)
+                    
+                    batch_upserts.append((preparateur_nom, semaine_cible, resultat_calcul['disponibilite_minutes'], timestamp_iso))
+                    resultats_sauvegarde.append(_resultat_calcul(preparateur_nom, semaine_cible, resultat_calcul))
+                    
+                except Exception as e:
+                    resultats_sauvegarde.append(_resultat_erreur(preparateur_nom, semaine_cible, e))
+            
+            resultats_par_semaine[semaine_cible] = _resultats_semaine(semaine_cible, resultats_sauvegarde, preparateurs)
+        
+        if batch_upserts:
+            print(f"💾 Sauvegarde en batch de {len(batch_upserts)} disponibilités...")
+            await cur.executemany(DISPONIBILITES_UPSERT_QUERY, batch_upserts)
+            _marquer_sauvegarde(resultats_par_semaine)
+        
+        await conn.commit()
+        
+        return _reponse_recalcul(semaines_a_traiter, resultats_par_semaine)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        await conn.rollback()
+        print(f"❌ Erreur dans recalculer_et_sauvegarder_disponibilites: {e}")
+        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
+
+
+router.add_api_route(
+    "/disponibilites/recalculer",
+    recalculer_et_sauvegarder_disponibilites_async if DB_ASYNC_ENABLED else recalculer_et_sauvegarder_disponibilites,
+    methods=["POST"]
+)
@@ -7,9 +7,11 @@ Ce module contient toutes les routes relatives à :
 - Les planifications d'étiquettes
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Optional, Any
-from main import get_db_connection, close_db_connection
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import Dict, List, Optional, Any
+import prepared_queries
+from database_config import execute_many, execute_query
+from main import champs_demandes, execute_pipeline, reponse_contenu, reponse_json, reponse_ndjson, verifier_etag, verifier_etag_async, get_readonly_db, get_write_db, get_async_readonly_db, DB_ASYNC_ENABLED, DB_JSON_SQL_ENABLED
 
 
 # Créer le router pour les routes Grille Semaine
@@ -28,56 +30,31 @@ router = APIRouter(
 
 # Horaires des préparateurs 
 
+HORAIRES_TABLE_ABSENTE = "Table horaires_preparateurs absente : utilisez POST /admin/create-all-tables"
+
+
+def _table_horaires_existe(conn):
+    """Lecture seule : la table n'est jamais créée par les routes (replica, triggers de version)"""
+    return execute_query("SELECT to_regclass('horaires_preparateurs') IS NOT NULL", fetch="scalar", conn=conn)
+
+
 @router.get("/horaires")
-def get_all_horaires():
+def get_all_horaires(request: Request, response: Response, conn=Depends(get_readonly_db)):
     """Récupérer tous les horaires de tous les préparateurs"""
-    conn = None
     try:
+        # Table créée par POST /admin/create-all-tables (avec ses triggers de version)
+        if not _table_horaires_existe(conn):
+            return {"message": HORAIRES_TABLE_ABSENTE, "horaires": {}}
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        non_modifie = verifier_etag(request, response, conn, ("horaires_preparateurs",))
+        if non_modifie:
+            return non_modifie
         
-        # Vérifier si la table horaires existe
-        cur.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'horaires_preparateurs'
-        """)
-        table_exists = cur.fetchone()
-        
-        if not table_exists:
-            # Créer la table si elle n'existe pas
-            cur.execute("""
-                CREATE TABLE horaires_preparateurs (
-                    id SERIAL PRIMARY KEY,
-                    preparateur_nom VARCHAR(255) NOT NULL,
-                    jour_semaine VARCHAR(20) NOT NULL,
-                    heure_debut TIME NOT NULL,
-                    heure_fin TIME NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    
-                    -- Index pour améliorer les performances
-                    CONSTRAINT check_jour_semaine CHECK (jour_semaine IN ('lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche'))
-                )
-            """)
-            
-            # Créer des index
-            cur.execute("CREATE INDEX idx_horaires_preparateur ON horaires_preparateurs (preparateur_nom)")
-            cur.execute("CREATE INDEX idx_horaires_jour ON horaires_preparateurs (jour_semaine)")
-            
-            # Trigger pour mettre à jour updated_at
-            cur.execute("""
-                CREATE TRIGGER update_horaires_updated_at 
-                BEFORE UPDATE ON horaires_preparateurs 
-                FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()
-            """)
-            
-            conn.commit()
-            return {"message": "Table horaires_preparateurs créée", "horaires": {}}
+        if DB_JSON_SQL_ENABLED:
+            return reponse_json(response, prepared_queries.execute(conn.cursor(), "horaires_json").fetchone()[0])
         
         # Récupérer tous les horaires
-        cur.execute("""
+        results = execute_query("""
             SELECT preparateur_nom, jour_semaine, heure_debut, heure_fin
             FROM horaires_preparateurs
             ORDER BY preparateur_nom, 
@@ -91,9 +68,7 @@ def get_all_horaires():
                          WHEN 'dimanche' THEN 7 
                      END,
                      heure_debut
-        """)
-        
-        results = cur.fetchall()
+        """, fetch="all", conn=conn)
         
         # Organiser les données par préparateur
         horaires = {}
@@ -111,24 +86,16 @@ def get_all_horaires():
                 'fin': str(heure_fin)
             })
         
-        return horaires
+        return reponse_contenu(response, horaires)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des horaires: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.get("/horaires/{preparateur_nom}")
-def get_horaires_preparateur(preparateur_nom: str):
+def get_horaires_preparateur(preparateur_nom: str, conn=Depends(get_readonly_db)):
     """Récupérer les horaires d'un préparateur spécifique"""
-    conn = None
     try:
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
+        results = execute_query("""
             SELECT jour_semaine, heure_debut, heure_fin
             FROM horaires_preparateurs
             WHERE preparateur_nom = %s
@@ -142,9 +109,7 @@ def get_horaires_preparateur(preparateur_nom: str):
                          WHEN 'dimanche' THEN 7 
                      END,
                      heure_debut
-        """, (preparateur_nom,))
-        
-        results = cur.fetchall()
+        """, (preparateur_nom,), fetch="all", conn=conn)
         
         # Organiser les données par jour
         horaires = {
@@ -163,20 +128,13 @@ def get_horaires_preparateur(preparateur_nom: str):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des horaires: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.put("/horaires/{preparateur_nom}")
-def update_horaires_preparateur(preparateur_nom: str, horaires_data: Dict[str, Any]):
+def update_horaires_preparateur(preparateur_nom: str, horaires_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour les horaires d'un préparateur (optimisé)"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Supprimer tous les horaires existants pour ce préparateur
-        cur.execute("DELETE FROM horaires_preparateurs WHERE preparateur_nom = %s", (preparateur_nom,))
+        execute_query("DELETE FROM horaires_preparateurs WHERE preparateur_nom = %s", (preparateur_nom,), conn=conn)
         
         # ✅ OPTIMISATION : Préparer toutes les données pour bulk insert
         horaires_bulk_data = []
@@ -187,13 +145,10 @@ def update_horaires_preparateur(preparateur_nom: str, horaires_data: Dict[str, A
                         horaires_bulk_data.append((preparateur_nom, jour, creneau['debut'], creneau['fin']))
         
         # ✅ Bulk insert
-        if horaires_bulk_data:
-            cur.executemany("""
-                INSERT INTO horaires_preparateurs (preparateur_nom, jour_semaine, heure_debut, heure_fin)
-                VALUES (%s, %s, %s, %s)
-            """, horaires_bulk_data)
-        
-        conn.commit()
+        execute_many("""
+            INSERT INTO horaires_preparateurs (preparateur_nom, jour_semaine, heure_debut, heure_fin)
+            VALUES (%s, %s, %s, %s)
+        """, horaires_bulk_data, conn=conn, commit=True)
         
         return {
             "status": "✅ Horaires mis à jour (optimisé)",
@@ -203,53 +158,17 @@ def update_horaires_preparateur(preparateur_nom: str, horaires_data: Dict[str, A
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour des horaires: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.post("/horaires")
-def sync_all_horaires(horaires_data: Dict[str, Any]):
+def sync_all_horaires(horaires_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Synchroniser tous les horaires des préparateurs (optimisé)"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # ✅ AJOUT : Vérifier si la table existe et la créer si nécessaire
-        cur.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'horaires_preparateurs'
-        """)
-        table_exists = cur.fetchone()
-        
-        if not table_exists:
-            # Créer la table si elle n'existe pas
-            cur.execute("""
-                CREATE TABLE horaires_preparateurs (
-                    id SERIAL PRIMARY KEY,
-                    preparateur_nom VARCHAR(255) NOT NULL,
-                    jour_semaine VARCHAR(20) NOT NULL,
-                    heure_debut TIME NOT NULL,
-                    heure_fin TIME NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    
-                    CONSTRAINT check_jour_semaine CHECK (jour_semaine IN ('lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche'))
-                )
-            """)
-            
-            # Créer des index
-            cur.execute("CREATE INDEX idx_horaires_preparateur ON horaires_preparateurs (preparateur_nom)")
-            cur.execute("CREATE INDEX idx_horaires_jour ON horaires_preparateurs (jour_semaine)")
-            
-            conn.commit()
+        if not _table_horaires_existe(conn):
+            raise HTTPException(status_code=503, detail=HORAIRES_TABLE_ABSENTE)
         
         # Supprimer tous les horaires existants
-        cur.execute("DELETE FROM horaires_preparateurs")
+        execute_query("DELETE FROM horaires_preparateurs", conn=conn)
         
         # ✅ AJOUT DE LA LOGIQUE MANQUANTE :
         # ✅ OPTIMISATION : Préparer toutes les données avant insertion
@@ -268,13 +187,10 @@ def sync_all_horaires(horaires_data: Dict[str, Any]):
                                 ))
         
         # ✅ Bulk insert avec executemany()
-        if horaires_bulk_data:
-            cur.executemany("""
-                INSERT INTO horaires_preparateurs (preparateur_nom, jour_semaine, heure_debut, heure_fin)
-                VALUES (%s, %s, %s, %s)
-            """, horaires_bulk_data)
-        
-        conn.commit()
+        execute_many("""
+            INSERT INTO horaires_preparateurs (preparateur_nom, jour_semaine, heure_debut, heure_fin)
+            VALUES (%s, %s, %s, %s)
+        """, horaires_bulk_data, conn=conn, commit=True)
         
         return {
             "status": "✅ Synchronisation complète optimisée",
@@ -282,91 +198,206 @@ def sync_all_horaires(horaires_data: Dict[str, Any]):
             "total_creneaux": len(horaires_bulk_data)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la synchronisation: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 
 
 # Gestion des étiquettes de planification
 
-@router.get("/etiquettes-grille")
-def get_all_etiquettes_grille():
-    """Récupérer toutes les étiquettes de la grille semaine avec leurs planifications (optimisé)"""
-    conn = None
+ETIQUETTES_STATUS = "✅ Étiquettes récupérées"
+
+
+def _etiquettes_depuis_lignes(rows):
+    """Mettre en forme les lignes de la requête etiquettes_grille_liste pour la réponse"""
+    # ✅ Traitement minimal côté Python
+    etiquettes_list = []
+    for row in rows:
+        etiquettes_list.append({
+            "id": row[0],
+            "type_activite": row[1],
+            "description": row[2],
+            "group_id": row[3],
+            "texte": row[4] or "",     # ← AJOUT du champ texte
+            "created_at": row[5].isoformat() if row[5] else None,  # ← Index décalé
+            "updated_at": row[6].isoformat() if row[6] else None,  # ← Index décalé
+            "planifications": row[7]   # ← Index décalé
+        })
+    
+    return {
+        "status": ETIQUETTES_STATUS,
+        "count": len(etiquettes_list),
+        "etiquettes": etiquettes_list
+    }
+
+
+# Tables lues par GET /etiquettes-grille (ETag de la réponse)
+ETIQUETTES_GRILLE_TABLES = ("etiquettes_grille", "planifications_etiquettes")
+
+# Champs d'une étiquette (ordre de la réponse) et leur expression SQL pour
+# ?fields= : sans planifications, ni jointure ni GROUP BY ; texte n'est lu
+# que s'il est demandé.
+ETIQUETTES_CHAMPS = {
+    "id": "e.id",
+    "type_activite": "e.type_activite",
+    "description": "e.description",
+    "group_id": "e.group_id",
+    "texte": "e.texte",
+    "created_at": "e.created_at",
+    "updated_at": "e.updated_at",
+    "planifications": """COALESCE((
+            SELECT json_agg(
+                json_build_object(
+                    'id', p.id,
+                    'date_jour', p.date_jour::text,
+                    'heure_debut', p.heure_debut::text,
+                    'heure_fin', p.heure_fin::text,
+                    'preparateurs', p.preparateurs
+                ) ORDER BY p.date_jour ASC, p.heure_debut ASC
+            )
+            FROM planifications_etiquettes p
+            WHERE p.etiquette_id = e.id
+        ), '[]'::json)""",
+}
+
+
+def fields_etiquettes(
+    fields: Optional[List[str]] = Query(None, description="Champs à renvoyer, répétés ou séparés par des virgules (id toujours inclus)")
+):
+    """Dépendance : champs demandés par ?fields= (None : étiquettes complètes)"""
+    return champs_demandes(fields, tuple(ETIQUETTES_CHAMPS))
+
+
+def requete_etiquettes_projetees(champs):
+    """Étiquettes réduites aux champs demandés, plus récentes d'abord"""
+    return f"""
+        SELECT
+            {", ".join(ETIQUETTES_CHAMPS[champ] for champ in champs)}
+        FROM etiquettes_grille e
+        ORDER BY e.created_at DESC
+    """
+
+
+def etiquettes_projetees(champs, rows):
+    """Mettre en forme les lignes de requete_etiquettes_projetees() (comme _etiquettes_depuis_lignes)"""
+    etiquettes_list = []
+    for row in rows:
+        etiquette = dict(zip(champs, row))
+        if "texte" in etiquette:
+            etiquette["texte"] = etiquette["texte"] or ""
+        for champ in ("created_at", "updated_at"):
+            if etiquette.get(champ):
+                etiquette[champ] = etiquette[champ].isoformat()
+        etiquettes_list.append(etiquette)
+    return etiquettes_list
+
+
+def get_all_etiquettes_grille(request: Request, response: Response, champs=Depends(fields_etiquettes), conn=Depends(get_readonly_db)):
+    """Récupérer toutes les étiquettes de la grille semaine avec leurs planifications (optimisé)
+
+    `fields` restreint chaque étiquette aux champs demandés (sans
+    planifications : planifications_etiquettes n'est pas lue).
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # ✅ MODIFICATION : Ajouter la colonne texte
-        cur.execute("""
-            SELECT 
-                e.id,
-                e.type_activite,
-                e.description,
-                e.group_id,
-                e.texte,              -- ← AJOUT de la colonne texte
-                e.created_at,
-                e.updated_at,
-                -- Agrégation des planifications en JSON
-                COALESCE(
-                    json_agg(
-                        json_build_object(
-                            'id', p.id,
-                            'date_jour', p.date_jour::text,
-                            'heure_debut', p.heure_debut::text,
-                            'heure_fin', p.heure_fin::text,
-                            'preparateurs', p.preparateurs
-                        ) ORDER BY p.date_jour ASC, p.heure_debut ASC
-                    ) FILTER (WHERE p.id IS NOT NULL),
-                    '[]'::json
-                ) as planifications_json
-            FROM etiquettes_grille e
-            LEFT JOIN planifications_etiquettes p ON e.id = p.etiquette_id
-            GROUP BY e.id, e.type_activite, e.description, e.group_id, e.texte, e.created_at, e.updated_at  -- ← AJOUT dans GROUP BY
-            ORDER BY e.created_at DESC
-        """)
+        non_modifie = verifier_etag(request, response, conn, ETIQUETTES_GRILLE_TABLES)
+        if non_modifie:
+            return non_modifie
         
-        rows = cur.fetchall()
+        if champs is not None:
+            etiquettes = etiquettes_projetees(champs, execute_query(requete_etiquettes_projetees(champs), fetch="all", conn=conn))
+            return reponse_contenu(response, {"status": ETIQUETTES_STATUS, "count": len(etiquettes), "etiquettes": etiquettes})
+        cur = conn.cursor()
+        if DB_JSON_SQL_ENABLED:
+            prepared_queries.execute(cur, "etiquettes_grille_json", (ETIQUETTES_STATUS,))
+            return reponse_json(response, cur.fetchone()[0])
+        prepared_queries.execute(cur, "etiquettes_grille_liste")
+        return reponse_contenu(response, _etiquettes_depuis_lignes(cur.fetchall()))
         
-        # ✅ Traitement minimal côté Python
-        etiquettes_list = []
-        for row in rows:
-            etiquettes_list.append({
-                "id": row[0],
-                "type_activite": row[1],
-                "description": row[2],
-                "group_id": row[3],
-                "texte": row[4] or "",     # ← AJOUT du champ texte
-                "created_at": row[5].isoformat() if row[5] else None,  # ← Index décalé
-                "updated_at": row[6].isoformat() if row[6] else None,  # ← Index décalé
-                "planifications": row[7]   # ← Index décalé
-            })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
+
+
+async def get_all_etiquettes_grille_async(request: Request, response: Response, champs=Depends(fields_etiquettes), conn=Depends(get_async_readonly_db)):
+    """Récupérer toutes les étiquettes de la grille semaine (version asyncio, mêmes paramètres)"""
+    try:
+        non_modifie = await verifier_etag_async(request, response, conn, ETIQUETTES_GRILLE_TABLES)
+        if non_modifie:
+            return non_modifie
         
-        return {
-            "status": "✅ Étiquettes récupérées",
-            "count": len(etiquettes_list),
-            "etiquettes": etiquettes_list
-        }
+        cur = conn.cursor()
+        if champs is not None:
+            await cur.execute(requete_etiquettes_projetees(champs))
+            etiquettes = etiquettes_projetees(champs, await cur.fetchall())
+            return reponse_contenu(response, {"status": ETIQUETTES_STATUS, "count": len(etiquettes), "etiquettes": etiquettes})
+        if DB_JSON_SQL_ENABLED:
+            await prepared_queries.execute_async(cur, "etiquettes_grille_json", (ETIQUETTES_STATUS,))
+            return reponse_json(response, (await cur.fetchone())[0])
+        await prepared_queries.execute_async(cur, "etiquettes_grille_liste")
+        return reponse_contenu(response, _etiquettes_depuis_lignes(await cur.fetchall()))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
+
+
+router.add_api_route(
+    "/etiquettes-grille",
+    get_all_etiquettes_grille_async if DB_ASYNC_ENABLED else get_all_etiquettes_grille,
+    methods=["GET"]
+)
+
+
+# Export NDJSON : une étiquette par ligne, même objet que dans GET /etiquettes-grille.
+# Planifications agrégées par sous-requête corrélée et tri sur idx_etiquettes_created_at :
+# les premières lignes partent sans agréger toute la table.
+ETIQUETTES_GRILLE_NDJSON = """
+    SELECT
+        '{"id":' || e.id ||
+        ',"type_activite":' || to_json(e.type_activite)::text ||
+        ',"description":' || COALESCE(to_json(e.description)::text, 'null') ||
+        ',"group_id":' || COALESCE(to_json(e.group_id)::text, 'null') ||
+        ',"texte":' || to_json(COALESCE(e.texte, ''))::text ||
+        ',"created_at":' || COALESCE(to_json(
+            to_char(e.created_at, 'YYYY-MM-DD"T"HH24:MI:SS') ||
+            CASE WHEN mod(date_part('microseconds', e.created_at)::int, 1000000) = 0 THEN '' ELSE to_char(e.created_at, '.US') END ||
+            to_char(e.created_at, 'TZH:TZM'))::text, 'null') ||
+        ',"updated_at":' || COALESCE(to_json(
+            to_char(e.updated_at, 'YYYY-MM-DD"T"HH24:MI:SS') ||
+            CASE WHEN mod(date_part('microseconds', e.updated_at)::int, 1000000) = 0 THEN '' ELSE to_char(e.updated_at, '.US') END ||
+            to_char(e.updated_at, 'TZH:TZM'))::text, 'null') ||
+        ',"planifications":' || COALESCE((
+            SELECT '[' || string_agg(
+                '{"id":' || p.id ||
+                ',"date_jour":' || to_json(p.date_jour::text)::text ||
+                ',"heure_debut":' || to_json(p.heure_debut::text)::text ||
+                ',"heure_fin":' || to_json(p.heure_fin::text)::text ||
+                ',"preparateurs":' || to_json(p.preparateurs)::text || '}',
+                ',' ORDER BY p.date_jour ASC, p.heure_debut ASC
+            ) || ']'
+            FROM planifications_etiquettes p
+            WHERE p.etiquette_id = e.id
+        ), '[]') || '}'
+    FROM etiquettes_grille e
+    ORDER BY e.created_at DESC
+"""
+
+
+@router.get("/etiquettes-grille/stream")
+def stream_etiquettes_grille():
+    """Exporter toutes les étiquettes en NDJSON : une étiquette et ses planifications par ligne, plus récentes d'abord"""
+    try:
+        return reponse_ndjson(ETIQUETTES_GRILLE_NDJSON, nom="etiquettes_grille_ndjson")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de l'export: {str(e)}")
 
 @router.post("/etiquettes-grille")
-def create_etiquette_grille(etiquette_data: Dict[str, Any]):
+def create_etiquette_grille(etiquette_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Créer une nouvelle étiquette de la grille semaine avec ses planifications (optimisé)"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Valider les données requises
         required_fields = ['type_activite', 'planifications']
         for field in required_fields:
@@ -376,116 +407,91 @@ def create_etiquette_grille(etiquette_data: Dict[str, Any]):
         if not etiquette_data['planifications']:
             raise HTTPException(status_code=400, detail="Au moins une planification est requise")
         
-        # ✅ OPTIMISATION : Transaction explicite
-        cur.execute("BEGIN")
-        
-        try:
-            # ✅ MODIFICATION : Créer l'étiquette principale avec texte
-            cur.execute("""
-                INSERT INTO etiquettes_grille (type_activite, description, group_id, texte)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id, created_at, updated_at
-            """, (
-                etiquette_data['type_activite'],
-                etiquette_data.get('description'),
-                etiquette_data.get('group_id'),
-                etiquette_data.get('texte', '')  # ← AJOUT du paramètre texte
-            ))
-            
-            etiquette_result = cur.fetchone()
-            etiquette_id = etiquette_result[0]
-            
-            # ✅ OPTIMISATION : Préparer toutes les planifications
-            planifications_bulk_data = []
-            for planif in etiquette_data['planifications']:
-                # Valider les champs de planification
-                required_planif_fields = ['date_jour', 'heure_debut', 'heure_fin', 'preparateurs']
-                for field in required_planif_fields:
-                    if field not in planif:
-                        raise HTTPException(status_code=400, detail=f"Champ planification requis manquant: {field}")
-                
-                # Valider les heures
-                if planif['heure_debut'] >= planif['heure_fin']:
-                    raise HTTPException(status_code=400, detail=f"Heure de début ({planif['heure_debut']}) doit être < heure de fin ({planif['heure_fin']})")
-                
-                planifications_bulk_data.append((
-                    etiquette_id,
-                    planif['date_jour'],
-                    planif['heure_debut'],
-                    planif['heure_fin'],
-                    planif['preparateurs']
-                ))
-            
-            # ✅ Bulk insert des planifications
-            cur.executemany("""
-                INSERT INTO planifications_etiquettes (etiquette_id, date_jour, heure_debut, heure_fin, preparateurs)
-                VALUES (%s, %s, %s, %s, %s)
-            """, planifications_bulk_data)
-            
-            # ✅ Récupérer les IDs des planifications créées en une seule requête
-            cur.execute("""
-                SELECT id, date_jour, heure_debut, heure_fin, preparateurs, created_at
-                FROM planifications_etiquettes 
-                WHERE etiquette_id = %s
-                ORDER BY date_jour, heure_debut
-            """, (etiquette_id,))
-            
-            planifications_creees = []
-            for row in cur.fetchall():
-                planifications_creees.append({
-                    "id": row[0],
-                    "date_jour": str(row[1]),
-                    "heure_debut": str(row[2]),
-                    "heure_fin": str(row[3]),
-                    "preparateurs": row[4],
-                    "created_at": row[5].isoformat()
-                })
+        # ✅ OPTIMISATION : Transaction unique (annulée par get_write_db en cas d'erreur)
+        # ✅ MODIFICATION : Créer l'étiquette principale avec texte
+        etiquette_result = execute_query("""
+            INSERT INTO etiquettes_grille (type_activite, description, group_id, texte)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id, created_at, updated_at
+        """, (
+            etiquette_data['type_activite'],
+            etiquette_data.get('description'),
+            etiquette_data.get('group_id'),
+            etiquette_data.get('texte', '')  # ← AJOUT du paramètre texte
+        ), fetch="one", conn=conn)
+        etiquette_id = etiquette_result[0]
+        
+        # ✅ OPTIMISATION : Préparer toutes les planifications
+        planifications_bulk_data = []
+        for planif in etiquette_data['planifications']:
+            # Valider les champs de planification
+            required_planif_fields = ['date_jour', 'heure_debut', 'heure_fin', 'preparateurs']
+            for field in required_planif_fields:
+                if field not in planif:
+                    raise HTTPException(status_code=400, detail=f"Champ planification requis manquant: {field}")
             
-            # ✅ Commit unique à la fin
-            cur.execute("COMMIT")
+            # Valider les heures
+            if planif['heure_debut'] >= planif['heure_fin']:
+                raise HTTPException(status_code=400, detail=f"Heure de début ({planif['heure_debut']}) doit être < heure de fin ({planif['heure_fin']})")
             
-            return {
-                "status": "✅ Étiquette créée (optimisé)",
-                "etiquette": {
-                    "id": etiquette_id,
-                    "type_activite": etiquette_data['type_activite'],
-                    "description": etiquette_data.get('description'),
-                    "group_id": etiquette_data.get('group_id'),
-                    "texte": etiquette_data.get('texte', ''),  # ← AJOUT dans la réponse
-                    "created_at": etiquette_result[1].isoformat(),
-                    "updated_at": etiquette_result[2].isoformat(),
-                    "planifications": planifications_creees
-                }
+            planifications_bulk_data.append((
+                etiquette_id,
+                planif['date_jour'],
+                planif['heure_debut'],
+                planif['heure_fin'],
+                planif['preparateurs']
+            ))
+        
+        # ✅ Bulk insert des planifications
+        execute_many("""
+            INSERT INTO planifications_etiquettes (etiquette_id, date_jour, heure_debut, heure_fin, preparateurs)
+            VALUES (%s, %s, %s, %s, %s)
+        """, planifications_bulk_data, conn=conn)
+        
+        # ✅ Récupérer les IDs des planifications créées en une seule requête (commit unique à la fin)
+        rows = execute_query("""
+            SELECT id, date_jour, heure_debut, heure_fin, preparateurs, created_at
+            FROM planifications_etiquettes 
+            WHERE etiquette_id = %s
+            ORDER BY date_jour, heure_debut
+        """, (etiquette_id,), fetch="all", conn=conn, commit=True)
+        
+        planifications_creees = []
+        for row in rows:
+            planifications_creees.append({
+                "id": row[0],
+                "date_jour": str(row[1]),
+                "heure_debut": str(row[2]),
+                "heure_fin": str(row[3]),
+                "preparateurs": row[4],
+                "created_at": row[5].isoformat()
+            })
+        
+        return {
+            "status": "✅ Étiquette créée (optimisé)",
+            "etiquette": {
+                "id": etiquette_id,
+                "type_activite": etiquette_data['type_activite'],
+                "description": etiquette_data.get('description'),
+                "group_id": etiquette_data.get('group_id'),
+                "texte": etiquette_data.get('texte', ''),  # ← AJOUT dans la réponse
+                "created_at": etiquette_result[1].isoformat(),
+                "updated_at": etiquette_result[2].isoformat(),
+                "planifications": planifications_creees
             }
-            
-        except Exception as e:
-            # ✅ Rollback en cas d'erreur
-            cur.execute("ROLLBACK")
-            raise
+        }
             
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.put("/etiquettes-grille/{etiquette_id}")
-def update_etiquette_grille(etiquette_id: int, etiquette_data: Dict[str, Any]):
+def update_etiquette_grille(etiquette_id: int, etiquette_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour une étiquette de la grille semaine"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vérifier que l'étiquette existe
-        cur.execute("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,))
-        if not cur.fetchone():
+        if not execute_query("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,), fetch="one", conn=conn):
             raise HTTPException(status_code=404, detail="Étiquette non trouvée")
         
         # Mettre à jour les informations de l'étiquette
@@ -507,12 +513,12 @@ def update_etiquette_grille(etiquette_id: int, etiquette_data: Dict[str, Any]):
                 SET {', '.join(update_fields)}
                 WHERE id = %s
             """
-            cur.execute(query, update_values)
+            execute_query(query, update_values, conn=conn)
         
         # ✅ OPTIMISATION : Bulk insert pour les planifications
         if 'planifications' in etiquette_data:
             # Supprimer les anciennes planifications
-            cur.execute("DELETE FROM planifications_etiquettes WHERE etiquette_id = %s", (etiquette_id,))
+            execute_query("DELETE FROM planifications_etiquettes WHERE etiquette_id = %s", (etiquette_id,), conn=conn)
             
             # ✅ Préparer toutes les planifications pour bulk insert
             planifications_bulk_data = []
@@ -526,11 +532,10 @@ def update_etiquette_grille(etiquette_id: int, etiquette_data: Dict[str, Any]):
                 ))
             
             # ✅ Bulk insert
-            if planifications_bulk_data:
-                cur.executemany("""
-                    INSERT INTO planifications_etiquettes (etiquette_id, date_jour, heure_debut, heure_fin, preparateurs)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, planifications_bulk_data)
+            execute_many("""
+                INSERT INTO planifications_etiquettes (etiquette_id, date_jour, heure_debut, heure_fin, preparateurs)
+                VALUES (%s, %s, %s, %s, %s)
+            """, planifications_bulk_data, conn=conn)
         
         conn.commit()
         
@@ -542,29 +547,17 @@ def update_etiquette_grille(etiquette_id: int, etiquette_data: Dict[str, Any]):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 
 @router.put("/etiquettes-grille/{etiquette_id}/horaires")
-def update_etiquette_horaires(etiquette_id: int, horaires_data: Dict[str, Any]):
+def update_etiquette_horaires(etiquette_id: int, horaires_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour seulement les heures d'une planification d'étiquette (sans toucher aux préparateurs)"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vérifier que l'étiquette existe
-        cur.execute("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,))
-        if not cur.fetchone():
+        if not execute_query("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,), fetch="one", conn=conn):
             raise HTTPException(status_code=404, detail="Étiquette non trouvée")
         
         # Vérifier les champs requis
@@ -578,7 +571,7 @@ def update_etiquette_horaires(etiquette_id: int, horaires_data: Dict[str, Any]):
             raise HTTPException(status_code=400, detail=f"Heure de début ({horaires_data['heure_debut']}) doit être < heure de fin ({horaires_data['heure_fin']})")
         
         # Mettre à jour seulement les heures de la planification spécifique
-        cur.execute("""
+        planifications_modifiees = execute_query("""
             UPDATE planifications_etiquettes 
             SET heure_debut = %s, heure_fin = %s
             WHERE id = %s AND etiquette_id = %s
@@ -587,19 +580,17 @@ def update_etiquette_horaires(etiquette_id: int, horaires_data: Dict[str, Any]):
             horaires_data['heure_fin'],
             horaires_data['planification_id'],
             etiquette_id
-        ))
+        ), conn=conn)
         
-        if cur.rowcount == 0:
+        if planifications_modifiees == 0:
             raise HTTPException(status_code=404, detail="Planification non trouvée pour cette étiquette")
         
         # Mettre à jour le timestamp de l'étiquette
-        cur.execute("""
+        execute_query("""
             UPDATE etiquettes_grille 
             SET updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (etiquette_id,))
-        
-        conn.commit()
+        """, (etiquette_id,), conn=conn, commit=True)
         
         return {
             "status": "✅ Horaires mis à jour",
@@ -608,28 +599,16 @@ def update_etiquette_horaires(etiquette_id: int, horaires_data: Dict[str, Any]):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour des horaires: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.post("/etiquettes-grille/{etiquette_id}/planifications")
-def add_planification_to_etiquette(etiquette_id: int, planification_data: dict):
+def add_planification_to_etiquette(etiquette_id: int, planification_data: dict, conn=Depends(get_write_db)):
     """Ajouter une nouvelle planification à une étiquette existante"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vérifier que l'étiquette existe
-        cur.execute("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,))
-        if not cur.fetchone():
+        if not execute_query("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,), fetch="one", conn=conn):
             raise HTTPException(status_code=404, detail="Étiquette non trouvée")
         
         # Vérifier les données requises
@@ -639,7 +618,7 @@ def add_planification_to_etiquette(etiquette_id: int, planification_data: dict):
                 raise HTTPException(status_code=422, detail=f"Champ manquant: {field}")
         
         # Insérer la nouvelle planification
-        cur.execute("""
+        planification_id = execute_query("""
             INSERT INTO planifications_etiquettes 
             (etiquette_id, date_jour, heure_debut, heure_fin, preparateurs)
             VALUES (%s, %s, %s, %s, %s)
@@ -650,18 +629,14 @@ def add_planification_to_etiquette(etiquette_id: int, planification_data: dict):
             planification_data['heure_debut'],
             planification_data['heure_fin'],
             planification_data['preparateurs']
-        ))
-        
-        planification_id = cur.fetchone()[0]
+        ), fetch="scalar", conn=conn)
         
         # Mettre à jour le timestamp de l'étiquette
-        cur.execute("""
+        execute_query("""
             UPDATE etiquettes_grille 
             SET updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (etiquette_id,))
-        
-        conn.commit()
+        """, (etiquette_id,), conn=conn, commit=True)
         
         return {
             "status": "✅ Planification ajoutée",
@@ -674,35 +649,22 @@ def add_planification_to_etiquette(etiquette_id: int, planification_data: dict):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'ajout de la planification: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.put("/etiquettes-grille/{etiquette_id}/planifications/{planification_id}")
-def update_planification_specifique(etiquette_id: int, planification_id: int, update_data: Dict[str, Any]):
+def update_planification_specifique(etiquette_id: int, planification_id: int, update_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour une planification spécifique (date, heures, et un seul préparateur)"""
     import os  # ✅ Ajout pour debug conditionnel
     DEBUG_MODE = os.getenv('DEBUG_MODE', 'false').lower() == 'true'
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vérifier que l'étiquette et la planification existent
-        cur.execute("""
+        result = execute_query("""
             SELECT id, preparateurs FROM planifications_etiquettes 
             WHERE id = %s AND etiquette_id = %s
-        """, (planification_id, etiquette_id))
-        
-        result = cur.fetchone()
+        """, (planification_id, etiquette_id), fetch="one", conn=conn)
         if not result:
             raise HTTPException(status_code=404, detail="Planification non trouvée pour cette étiquette")
         
@@ -783,7 +745,7 @@ def update_planification_specifique(etiquette_id: int, planification_id: int, up
             print(f"   👥 Nouveaux préparateurs finaux: {nouveaux_preparateurs}")
         
         # Mettre à jour la planification
-        cur.execute("""
+        planifications_modifiees = execute_query("""
             UPDATE planifications_etiquettes 
             SET date_jour = %s, 
                 heure_debut = %s, 
@@ -797,19 +759,17 @@ def update_planification_specifique(etiquette_id: int, planification_id: int, up
             nouveaux_preparateurs,
             planification_id,
             etiquette_id
-        ))
+        ), conn=conn)
         
-        if cur.rowcount == 0:
+        if planifications_modifiees == 0:
             raise HTTPException(status_code=404, detail="Aucune planification mise à jour")
         
         # Mettre à jour le timestamp de l'étiquette
-        cur.execute("""
+        execute_query("""
             UPDATE etiquettes_grille 
             SET updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (etiquette_id,))
-        
-        conn.commit()
+        """, (etiquette_id,), conn=conn, commit=True)
         
         return {
             "status": "✅ Planification spécifique mise à jour",
@@ -830,37 +790,24 @@ def update_planification_specifique(etiquette_id: int, planification_id: int, up
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour de la planification: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.post("/etiquettes-grille/{etiquette_id}/planifications/{planification_id}/preparateurs")
-def add_preparateur_to_planification(etiquette_id: int, planification_id: int, preparateur_data: Dict[str, Any]):
+def add_preparateur_to_planification(etiquette_id: int, planification_id: int, preparateur_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Ajouter un préparateur à une planification existante"""
     import os  # ✅ Ajout pour debug conditionnel
     DEBUG_MODE = os.getenv('DEBUG_MODE', 'false').lower() == 'true'
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vérifier que l'étiquette et la planification existent
-        cur.execute("""
+        result = execute_query("""
             SELECT p.id, p.preparateurs, e.type_activite, e.description
             FROM planifications_etiquettes p
             INNER JOIN etiquettes_grille e ON p.etiquette_id = e.id
             WHERE p.id = %s AND p.etiquette_id = %s
-        """, (planification_id, etiquette_id))
-        
-        result = cur.fetchone()
+        """, (planification_id, etiquette_id), fetch="one", conn=conn)
         if not result:
             raise HTTPException(status_code=404, detail="Planification non trouvée pour cette étiquette")
         
@@ -898,23 +845,21 @@ def add_preparateur_to_planification(etiquette_id: int, planification_id: int, p
             print(f"   👥 Nouveaux préparateurs: {nouveaux_preparateurs}")
         
         # Mettre à jour la planification avec le nouveau préparateur
-        cur.execute("""
+        planifications_modifiees = execute_query("""
             UPDATE planifications_etiquettes 
             SET preparateurs = %s
             WHERE id = %s AND etiquette_id = %s
-        """, (nouveaux_preparateurs, planification_id, etiquette_id))
+        """, (nouveaux_preparateurs, planification_id, etiquette_id), conn=conn)
         
-        if cur.rowcount == 0:
+        if planifications_modifiees == 0:
             raise HTTPException(status_code=404, detail="Aucune planification mise à jour")
         
         # Mettre à jour le timestamp de l'étiquette
-        cur.execute("""
+        execute_query("""
             UPDATE etiquettes_grille 
             SET updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (etiquette_id,))
-        
-        conn.commit()
+        """, (etiquette_id,), conn=conn, commit=True)
         
         return {
             "status": "✅ Préparateur ajouté à la planification",
@@ -934,44 +879,30 @@ def add_preparateur_to_planification(etiquette_id: int, planification_id: int, p
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'ajout du préparateur: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.delete("/etiquettes-grille/{etiquette_id}")
-def delete_etiquette_grille(etiquette_id: int):
+def delete_etiquette_grille(etiquette_id: int, conn=Depends(get_write_db)):
     """Supprimer une étiquette de la grille semaine et toutes ses planifications"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Récupérer les informations avant suppression
-        cur.execute("""
+        result = execute_query("""
             SELECT e.type_activite, e.description, e.group_id, 
                    COUNT(p.id) as nb_planifications
             FROM etiquettes_grille e
             LEFT JOIN planifications_etiquettes p ON e.id = p.etiquette_id
             WHERE e.id = %s
             GROUP BY e.id, e.type_activite, e.description, e.group_id
-        """, (etiquette_id,))
-        
-        result = cur.fetchone()
+        """, (etiquette_id,), fetch="one", conn=conn)
         if not result:
             raise HTTPException(status_code=404, detail="Étiquette non trouvée")
         
         type_activite, description, group_id, nb_planifications = result
         
         # Supprimer l'étiquette (les planifications sont supprimées automatiquement via CASCADE)
-        cur.execute("DELETE FROM etiquettes_grille WHERE id = %s", (etiquette_id,))
-        conn.commit()
+        execute_query("DELETE FROM etiquettes_grille WHERE id = %s", (etiquette_id,), conn=conn, commit=True)
         
         return {
             "status": "✅ Étiquette supprimée",
@@ -983,47 +914,37 @@ def delete_etiquette_grille(etiquette_id: int):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.delete("/etiquettes-grille/{etiquette_id}/planifications/{planification_id}")
-def delete_planification_etiquette(etiquette_id: int, planification_id: int):
+def delete_planification_etiquette(etiquette_id: int, planification_id: int, conn=Depends(get_write_db)):
     """Supprimer une planification spécifique d'une étiquette sans supprimer l'étiquette entière"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Vérifier que l'étiquette et la planification existent
-        cur.execute("""
-            SELECT e.type_activite, e.description, e.group_id,
-                   p.date_jour, p.heure_debut, p.heure_fin, p.preparateurs
-            FROM etiquettes_grille e
-            INNER JOIN planifications_etiquettes p ON e.id = p.etiquette_id
-            WHERE e.id = %s AND p.id = %s
-        """, (etiquette_id, planification_id))
+        # Vérifier que l'étiquette et la planification existent, et compter
+        # les planifications de l'étiquette, en un seul aller-retour
+        planification_cur, count_cur = execute_pipeline(conn, [
+            ("""
+                SELECT e.type_activite, e.description, e.group_id,
+                       p.date_jour, p.heure_debut, p.heure_fin, p.preparateurs
+                FROM etiquettes_grille e
+                INNER JOIN planifications_etiquettes p ON e.id = p.etiquette_id
+                WHERE e.id = %s AND p.id = %s
+            """, (etiquette_id, planification_id)),
+            ("""
+                SELECT COUNT(*) FROM planifications_etiquettes 
+                WHERE etiquette_id = %s
+            """, (etiquette_id,)),
+        ])
         
-        result = cur.fetchone()
+        result = planification_cur.fetchone()
         if not result:
             raise HTTPException(status_code=404, detail="Étiquette ou planification non trouvée")
         
         type_activite, description, group_id, date_jour, heure_debut, heure_fin, preparateurs = result
         
-        # Vérifier combien de planifications restent pour cette étiquette
-        cur.execute("""
-            SELECT COUNT(*) FROM planifications_etiquettes 
-            WHERE etiquette_id = %s
-        """, (etiquette_id,))
-        
-        nb_planifications_total = cur.fetchone()[0]
+        nb_planifications_total = count_cur.fetchone()[0]
         
         # Si c'est la dernière planification, on peut soit interdire la suppression
         # soit supprimer toute l'étiquette (à décider selon vos besoins)
@@ -1033,22 +954,23 @@ def delete_planification_etiquette(etiquette_id: int, planification_id: int):
                 detail="Impossible de supprimer la dernière planification d'une étiquette. Supprimez l'étiquette entière si nécessaire."
             )
         
-        # Supprimer la planification spécifique
-        cur.execute("""
-            DELETE FROM planifications_etiquettes 
-            WHERE id = %s AND etiquette_id = %s
-        """, (planification_id, etiquette_id))
+        # Supprimer la planification spécifique et mettre à jour le timestamp
+        # de l'étiquette en un seul aller-retour
+        delete_cur, _ = execute_pipeline(conn, [
+            ("""
+                DELETE FROM planifications_etiquettes 
+                WHERE id = %s AND etiquette_id = %s
+            """, (planification_id, etiquette_id)),
+            ("""
+                UPDATE etiquettes_grille 
+                SET updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (etiquette_id,)),
+        ])
         
-        if cur.rowcount == 0:
+        if delete_cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Planification non trouvée")
         
-        # Mettre à jour le timestamp de l'étiquette
-        cur.execute("""
-            UPDATE etiquettes_grille 
-            SET updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (etiquette_id,))
-        
         conn.commit()
         
         return {
@@ -1068,35 +990,22 @@ def delete_planification_etiquette(etiquette_id: int, planification_id: int):
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression de la planification: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @router.delete("/etiquettes-grille/{etiquette_id}/planifications/{planification_id}/preparateurs/{preparateur_nom}")
-def remove_preparateur_from_planification(etiquette_id: int, planification_id: int, preparateur_nom: str):
+def remove_preparateur_from_planification(etiquette_id: int, planification_id: int, preparateur_nom: str, conn=Depends(get_write_db)):
     """Retirer un préparateur spécifique d'une planification sans affecter les autres préparateurs"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vérifier que l'étiquette et la planification existent
-        cur.execute("""
+        result = execute_query("""
             SELECT e.type_activite, e.description, e.group_id,
                    p.date_jour, p.heure_debut, p.heure_fin, p.preparateurs
             FROM etiquettes_grille e
             INNER JOIN planifications_etiquettes p ON e.id = p.etiquette_id
             WHERE e.id = %s AND p.id = %s
-        """, (etiquette_id, planification_id))
-        
-        result = cur.fetchone()
+        """, (etiquette_id, planification_id), fetch="one", conn=conn)
         if not result:
             raise HTTPException(status_code=404, detail="Étiquette ou planification non trouvée")
         
@@ -1129,23 +1038,24 @@ def remove_preparateur_from_planification(etiquette_id: int, planification_id: i
         preparateurs_list.remove(preparateur_nom_clean)
         nouveaux_preparateurs = ','.join(preparateurs_list)
         
-        # Mettre à jour la planification
-        cur.execute("""
-            UPDATE planifications_etiquettes 
-            SET preparateurs = %s
-            WHERE id = %s AND etiquette_id = %s
-        """, (nouveaux_preparateurs, planification_id, etiquette_id))
+        # Mettre à jour la planification et le timestamp de l'étiquette
+        # en un seul aller-retour
+        update_cur, _ = execute_pipeline(conn, [
+            ("""
+                UPDATE planifications_etiquettes 
+                SET preparateurs = %s
+                WHERE id = %s AND etiquette_id = %s
+            """, (nouveaux_preparateurs, planification_id, etiquette_id)),
+            ("""
+                UPDATE etiquettes_grille 
+                SET updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (etiquette_id,)),
+        ])
         
-        if cur.rowcount == 0:
+        if update_cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Impossible de mettre à jour la planification")
         
-        # Mettre à jour le timestamp de l'étiquette
-        cur.execute("""
-            UPDATE etiquettes_grille 
-            SET updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (etiquette_id,))
-        
         conn.commit()
         
         return {
@@ -1167,13 +1077,6 @@ def remove_preparateur_from_planification(etiquette_id: int, planification_id: i
         }
         
     except HTTPException:
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors du retrait du préparateur: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
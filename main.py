@@ -1,8 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import Dict, Optional, Any
+from contextlib import contextmanager, asynccontextmanager
+from decimal import Decimal
+import asyncio
+import datetime
+import hashlib
+import itertools
 import os
 import json
+import threading
+import time
+
+import database_config
+import metrics
+import prepared_queries
 
 
 # Render → Uvicorn → FastAPI
@@ -13,12 +27,188 @@ if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=port)
 
 
-# Variables globales pour le pool de connexions
-connection_pool = None
+# Variables globales pour les pools de connexions nommés (read / write / admin / replica)
+connection_pools = {}
+async_connection_pools = {}
+
+# Chemin asyncio natif (AsyncConnectionPool) pour les endpoints chauds.
+# DB_ASYNC_ENABLED=false revient aux routes sync (thread pool) pendant la migration.
+DB_ASYNC_ENABLED = os.environ.get("DB_ASYNC_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+# Listes complètes (chantiers, disponibilités, horaires, étiquettes) sérialisées
+# par PostgreSQL et renvoyées telles quelles, octet pour octet identiques à la
+# sérialisation FastAPI. DB_JSON_SQL_ENABLED=false revient aux dict Python.
+DB_JSON_SQL_ENABLED = os.environ.get("DB_JSON_SQL_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+# Un pool par classe de charge : les lectures interactives (GET /chantiers...)
+# ne sont plus affamées par les écritures ou les traitements lourds (/admin/*,
+# recalcul, synchronisations en masse). Chaque valeur est surchargeable par
+# DB_POOL_<NOM>_MIN / _MAX / _TIMEOUT / _MAX_WAITING.
+POOL_SETTINGS = {
+    "read": {
+        "min_size": _env_int("DB_POOL_READ_MIN", 2),
+        "max_size": _env_int("DB_POOL_READ_MAX", 8),
+        "timeout": _env_float("DB_POOL_READ_TIMEOUT", 2),
+        "max_waiting": _env_int("DB_POOL_READ_MAX_WAITING", 20),
+    },
+    "write": {
+        "min_size": _env_int("DB_POOL_WRITE_MIN", 1),
+        "max_size": _env_int("DB_POOL_WRITE_MAX", 4),
+        "timeout": _env_float("DB_POOL_WRITE_TIMEOUT", 5),
+        "max_waiting": _env_int("DB_POOL_WRITE_MAX_WAITING", 10),
+    },
+    "admin": {
+        "min_size": _env_int("DB_POOL_ADMIN_MIN", 0),
+        "max_size": _env_int("DB_POOL_ADMIN_MAX", 2),
+        "timeout": _env_float("DB_POOL_ADMIN_TIMEOUT", 10),
+        "max_waiting": _env_int("DB_POOL_ADMIN_MAX_WAITING", 2),
+    },
+    # Exports NDJSON : une connexion reste empruntée tant que le client lit le
+    # flux, un client lent ne doit pas priver /admin/* ni les synchronisations
+    "export": {
+        "min_size": _env_int("DB_POOL_EXPORT_MIN", 0),
+        "max_size": _env_int("DB_POOL_EXPORT_MAX", 2),
+        "timeout": _env_float("DB_POOL_EXPORT_TIMEOUT", 2),
+        "max_waiting": _env_int("DB_POOL_EXPORT_MAX_WAITING", 4),
+    },
+    # Réplique en streaming (créé seulement si DATABASE_REPLICA_URL est définie)
+    "replica": {
+        "min_size": _env_int("DB_POOL_REPLICA_MIN", 2),
+        "max_size": _env_int("DB_POOL_REPLICA_MAX", 8),
+        "timeout": _env_float("DB_POOL_REPLICA_TIMEOUT", 2),
+        "max_waiting": _env_int("DB_POOL_REPLICA_MAX_WAITING", 20),
+    },
+}
+
+POOL_MAX_IDLE = 10        # secondes
+POOL_MAX_LIFETIME = 300   # secondes
+
+# Délai conseillé au client (en secondes) quand un pool est saturé
+DB_POOL_RETRY_AFTER = _env_int("DB_POOL_RETRY_AFTER", 2)
+
+# Budgets de requête par pool, donc par classe de routes (en millisecondes,
+# 0 = sans limite). Appliqués à la session à l'ouverture de chaque connexion :
+# une requête hors budget est annulée par PostgreSQL et rend sa connexion au
+# lieu de bloquer le pool. Surchargeables par DB_POOL_<NOM>_STATEMENT_TIMEOUT /
+# _LOCK_TIMEOUT / _IDLE_TX_TIMEOUT.
+def _query_budget(name, statement_timeout, lock_timeout, idle_timeout):
+    prefix = f"DB_POOL_{name.upper()}_"
+    return {
+        "statement_timeout": _env_int(prefix + "STATEMENT_TIMEOUT", statement_timeout),
+        "lock_timeout": _env_int(prefix + "LOCK_TIMEOUT", lock_timeout),
+        "idle_in_transaction_session_timeout": _env_int(prefix + "IDLE_TX_TIMEOUT", idle_timeout),
+    }
+
+QUERY_BUDGETS = {
+    "read": _query_budget("read", 5000, 2000, 10000),
+    "write": _query_budget("write", 15000, 5000, 30000),
+    # Recalcul des disponibilités sur plusieurs années, synchronisations en masse
+    "admin": _query_budget("admin", 300000, 30000, 60000),
+    # Par FETCH ; un client qui ne lit plus pendant 30 s libère sa connexion
+    "export": _query_budget("export", 60000, 2000, 30000),
+    "replica": _query_budget("replica", 5000, 2000, 10000),
+}
+
+QUERY_BUDGET_SQL = (
+    "SELECT set_config('statement_timeout', %s, false), "
+    "set_config('lock_timeout', %s, false), "
+    "set_config('idle_in_transaction_session_timeout', %s, false)"
+)
+
+# Lectures sur réplique : au-delà de DATABASE_REPLICA_MAX_LAG secondes de retard,
+# les routes en lecture seule repassent sur le primaire. Le retard est mesuré au
+# plus une fois toutes les DATABASE_REPLICA_LAG_CHECK_INTERVAL secondes.
+DATABASE_REPLICA_MAX_LAG = _env_float("DATABASE_REPLICA_MAX_LAG", 5)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = _env_float("DATABASE_REPLICA_LAG_CHECK_INTERVAL", 2)
+
+# En-tête client pour lire ses propres écritures (routage forcé sur le primaire)
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+# En-tête de réponse indiquant la source de la lecture (replica / primary)
+READ_SOURCE_HEADER = "X-Read-Source"
+# En-tête de réponse des listes paginées : curseur de la page suivante
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# En-tête de réponse de GET /chantiers : jeton à renvoyer dans ?since= (synchronisation delta)
+CHANGE_TOKEN_HEADER = "X-Change-Token"
+
+# Tables versionnées (ensure_versions_tables) : un trigger par instruction y
+# enregistre la dernière transaction d'écriture, d'où les ETag des listes GET
+VERSIONED_TABLES = (
+    'chantiers', 'planifications', 'soldes', 'verrous_planification', 'preparateurs',
+    'disponibilites', 'horaires_preparateurs', 'etiquettes_grille', 'planifications_etiquettes',
+    'text_templates'
+)
+
+def _pool_url(name):
+    """URL de connexion d'un pool nommé (None si le pool n'est pas configuré)"""
+    if name == "replica":
+        return os.environ.get('DATABASE_REPLICA_URL')
+    return os.environ.get('DATABASE_URL')
+
+def _pool_connect_kwargs():
+    """Paramètres de connexion communs aux pools sync et async"""
+    return {                         # Optimisations TCP/SSL avancées
+        "sslmode": os.environ.get("DATABASE_SSLMODE", "require"),  # SSL obligatoire (sauf base locale)
+        "connect_timeout": 5,        # 5 sec timeout connexion
+        "keepalives_idle": 600,      # 10 min avant premier keep-alive
+        "keepalives_interval": 30,   # Keep-alive toutes les 30 sec
+        "keepalives_count": 3        # 3 tentatives keep-alive avant abandon
+    }
+
+def _pool_reconnect_failed(pool):
+    """Callback psycopg_pool : la reconnexion a échoué pendant reconnect_timeout"""
+    print(f"🚨 Pool '{pool.name}' : reconnexion à la base impossible")
+    metrics.record_reconnect_failure(pool.name)
+
+def _psycopg3_pool_options(name):
+    settings = POOL_SETTINGS[name]
+    return dict(
+        min_size=settings["min_size"],
+        max_size=settings["max_size"],
+        max_idle=POOL_MAX_IDLE,
+        max_lifetime=POOL_MAX_LIFETIME,
+        timeout=settings["timeout"],
+        max_waiting=settings["max_waiting"],  # File pleine → TooManyRequests immédiat
+        name=name,
+        # ✨ Reconnexion automatique si la base redémarre
+        reconnect_timeout=30,
+        reconnect_failed=_pool_reconnect_failed,
+        kwargs=_pool_connect_kwargs()
+    )
+
+def _budget_params(name):
+    budget = QUERY_BUDGETS[name]
+    return (str(budget["statement_timeout"]), str(budget["lock_timeout"]),
+            str(budget["idle_in_transaction_session_timeout"]))
+
+def _configurer_budget(name):
+    """Callback configure psycopg_pool : budgets de session d'une nouvelle connexion"""
+    params = _budget_params(name)
+    def configure(conn):
+        conn.execute(QUERY_BUDGET_SQL, params)
+        conn.commit()  # Le pool refuse une connexion rendue en transaction
+    return configure
+
+def _configurer_budget_async(name):
+    """Équivalent asyncio de _configurer_budget()"""
+    params = _budget_params(name)
+    async def configure(conn):
+        await conn.execute(QUERY_BUDGET_SQL, params)
+        await conn.commit()
+    return configure
+
+def _budget_options(name):
+    """Budgets en paramètres de démarrage libpq (pool psycopg2, sans callback configure)"""
+    return " ".join(f"-c {setting}={valeur}" for setting, valeur in QUERY_BUDGETS[name].items())
 
 def init_connection_pool():
-    """Initialiser le pool de connexions au startup"""
-    global connection_pool
+    """Initialiser les pools de connexions nommés au startup"""
+    global connection_pools
     database_url = os.environ.get('DATABASE_URL')
     
     if not database_url:
@@ -28,76 +218,208 @@ def init_connection_pool():
     try:
         # Essayer psycopg3 avec pool
         import psycopg_pool
-        connection_pool = psycopg_pool.ConnectionPool(
-            database_url, 
-            min_size=2,        
-            max_size=10,       
-            max_idle=10,       
-            max_lifetime=300,  
-            timeout=5,
-            # ✨ NOUVELLES OPTIMISATIONS ULTRA-MODERNES :
-            reconnect_timeout=30,            # Reconnexion automatique si DB restart
-            reconnect_failed=2,              # 2 tentatives de reconnexion
-            kwargs={                         # Optimisations TCP/SSL avancées
-                "sslmode": "require",        # SSL obligatoire
-                "connect_timeout": 5,        # 5 sec timeout connexion
-                "keepalives_idle": 600,      # 10 min avant premier keep-alive
-                "keepalives_interval": 30,   # Keep-alive toutes les 30 sec
-                "keepalives_count": 3        # 3 tentatives keep-alive avant abandon
-            }
-        )
-        print("✅ Pool de connexions psycopg3 ULTRA-MODERNE initialisé (2-10 connexions)")
+        for name in POOL_SETTINGS:
+            if not _pool_url(name):
+                continue
+            connection_pools[name] = psycopg_pool.ConnectionPool(
+                _pool_url(name), configure=_configurer_budget(name), **_psycopg3_pool_options(name)
+            )
+            settings = POOL_SETTINGS[name]
+            print(f"✅ Pool psycopg3 '{name}' initialisé ({settings['min_size']}-{settings['max_size']} connexions)")
     except ImportError:
         try:
             # Fallback sur psycopg2 avec pool simple
             import psycopg2.pool
-            connection_pool = psycopg2.pool.SimpleConnectionPool(
-                2, 10, database_url
-            )
-            print("✅ Pool de connexions psycopg2 initialisé (2-10 connexions)")
+            for name, settings in POOL_SETTINGS.items():
+                if not _pool_url(name):
+                    continue
+                connection_pools[name] = psycopg2.pool.SimpleConnectionPool(
+                    settings["min_size"], settings["max_size"], _pool_url(name), options=_budget_options(name)
+                )
+            print(f"✅ Pools de connexions psycopg2 initialisés ({' / '.join(connection_pools)})")
         except ImportError:
             print("⚠️ Aucun module de pool disponible - pool désactivé")
-            connection_pool = None
+            connection_pools.clear()
+
+def close_connection_pools():
+    """Fermer tous les pools sync au shutdown"""
+    for name, pool in list(connection_pools.items()):
+        try:
+            if hasattr(pool, 'closeall'):
+                pool.closeall()
+            elif hasattr(pool, 'close'):
+                pool.close()
+            print(f"✅ Pool '{name}' fermé proprement")
+        except Exception as e:
+            print(f"⚠️ Erreur lors de la fermeture du pool '{name}': {e}")
+    connection_pools.clear()
+
+async def init_async_connection_pools():
+    """Initialiser les pools asyncio nommés (psycopg3 AsyncConnectionPool) au startup
 
-def get_db_connection():  # ✅ SUPPRIMER le paramètre auto_create_tables complètement
-    """Obtenir une connexion du pool (SANS création automatique de tables)"""
-    global connection_pool
+    La concurrence des routes async est bornée par max_size de chaque pool :
+    les requêtes en surplus attendent une connexion (dans la limite de
+    max_waiting) au lieu d'occuper un thread chacune.
+    """
     database_url = os.environ.get('DATABASE_URL')
     
     if not database_url:
-        raise Exception("DATABASE_URL non définie")
+        print("⚠️ DATABASE_URL non définie - pool async désactivé")
+        return
     
-    conn = None
+    try:
+        import psycopg_pool
+    except ImportError:
+        print("⚠️ psycopg_pool indisponible - pool async désactivé")
+        return
     
-    # Si le pool est disponible, l'utiliser    
-    if connection_pool:
+    for name in POOL_SETTINGS:
+        if not _pool_url(name):
+            continue
+        pool = psycopg_pool.AsyncConnectionPool(
+            _pool_url(name), open=False, configure=_configurer_budget_async(name), **_psycopg3_pool_options(name)
+        )
+        await pool.open()
+        async_connection_pools[name] = pool
+    print(f"✅ Pools de connexions psycopg3 ASYNC initialisés ({' / '.join(async_connection_pools)})")
+
+async def close_async_connection_pools():
+    """Fermer les pools asyncio au shutdown"""
+    for name, pool in list(async_connection_pools.items()):
         try:
-            if hasattr(connection_pool, 'getconn'):
-                # psycopg2 pool
-                conn = connection_pool.getconn()
-                conn._pool_type = 'psycopg2_pool'
-            else:
-                # psycopg3 pool
-                conn = connection_pool.connection()
-                conn._pool_type = 'psycopg3_pool'
+            await pool.close()
+            print(f"✅ Pool async '{name}' fermé proprement")
         except Exception as e:
-            print(f"⚠️ Erreur pool, fallback connexion directe: {e}")
+            print(f"⚠️ Erreur lors de la fermeture du pool async '{name}': {e}")
+    async_connection_pools.clear()
+
+def _pool_saturation_errors():
+    """Exceptions levées par les pools quand aucune connexion n'est disponible"""
+    errors = []
+    try:
+        import psycopg_pool
+        errors += [psycopg_pool.TooManyRequests, psycopg_pool.PoolTimeout]
+    except ImportError:
+        pass
+    try:
+        import psycopg2.pool
+        errors.append(psycopg2.pool.PoolError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+POOL_SATURATION_ERRORS = _pool_saturation_errors()
+
+def _pool_sature(pool_name, e):
+    """HTTPException 503 + Retry-After pour un pool saturé (échec rapide plutôt qu'un 500)"""
+    print(f"⚠️ Pool '{pool_name}' saturé: {type(e).__name__}")
+    return HTTPException(
+        status_code=503,
+        detail=f"Base de données saturée (pool '{pool_name}'), réessayez dans {DB_POOL_RETRY_AFTER}s",
+        headers={"Retry-After": str(DB_POOL_RETRY_AFTER)}
+    )
+
+def _query_budget_errors():
+    """Erreurs PostgreSQL d'une requête annulée hors budget -> paramètre dépassé"""
+    errors = {}
+    for module_name in ("psycopg.errors", "psycopg2.errors"):
+        try:
+            module = __import__(module_name, fromlist=["QueryCanceled"])
+        except ImportError:
+            continue
+        errors[module.QueryCanceled] = "statement_timeout"
+        errors[module.LockNotAvailable] = "lock_timeout"
+        errors[module.IdleInTransactionSessionTimeout] = "idle_in_transaction_session_timeout"
+    return errors
+
+_QUERY_BUDGET_SETTINGS = _query_budget_errors()
+QUERY_BUDGET_ERRORS = tuple(_QUERY_BUDGET_SETTINGS)
+
+# Dépassements par paramètre puis par route : {"statement_timeout": {"GET /chantiers": 3}}
+query_budget_stats = {setting: {} for setting in ("statement_timeout", "lock_timeout", "idle_in_transaction_session_timeout")}
+_query_budget_lock = threading.Lock()
+
+def _erreur_budget(exc):
+    """Erreur de budget à l'origine de exc (chaîne __cause__ / __context__), ou None
+
+    Les routes convertissent les erreurs base en HTTPException 500 : l'erreur
+    PostgreSQL d'origine reste accessible par le chaînage des exceptions.
+    """
+    vues = set()
+    while exc is not None and id(exc) not in vues:
+        if isinstance(exc, QUERY_BUDGET_ERRORS):
+            return exc
+        vues.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+def _budget_depasse(request, e):
+    """Compter un dépassement de budget et répondre 504 (503 + Retry-After pour un verrou)"""
+    setting = next(s for cls, s in _QUERY_BUDGET_SETTINGS.items() if isinstance(e, cls))
+    route = request.scope.get("route")
+    cle = f"{request.method} {route.path if route else request.url.path}"
+    with _query_budget_lock:
+        query_budget_stats[setting][cle] = query_budget_stats[setting].get(cle, 0) + 1
+    print(f"⏱️ Requête annulée ({setting}) sur {cle}: {str(e).splitlines()[0]}")
+    if setting == "lock_timeout":
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"Données verrouillées par une autre opération (lock_timeout dépassé), réessayez dans {DB_POOL_RETRY_AFTER}s"},
+            headers={"Retry-After": str(DB_POOL_RETRY_AFTER)}
+        )
+    return JSONResponse(
+        status_code=504,
+        content={"detail": f"Requête annulée : budget {setting} dépassé pour {cle}"}
+    )
+
+def get_db_connection(pool_name="write"):  # ✅ SUPPRIMER le paramètre auto_create_tables complètement
+    """Obtenir une connexion du pool nommé (SANS création automatique de tables)
+
+    ⚠️ Toute connexion obtenue ici DOIT être rendue via close_db_connection().
+    Préférer db_session() ou les dépendances get_read_db / get_write_db /
+    get_admin_db qui garantissent la restitution.
+    Lève HTTPException 503 (Retry-After) si le pool est saturé.
+    """
+    database_url = os.environ.get('DATABASE_URL')
     
-    # Fallback : créer une connexion directe si pas encore de connexion
-    if not conn:
+    if not database_url:
+        raise Exception("DATABASE_URL non définie")
+    
+    # Si le pool est disponible, l'utiliser (une erreur du pool est remontée :
+    # pas de repli silencieux sur une connexion directe qui masquerait une fuite)
+    pool = connection_pools.get(pool_name)
+    if pool:
+        debut = time.perf_counter()
+        try:
+            conn = pool.getconn()
+        except POOL_SATURATION_ERRORS as e:
+            raise _pool_sature(pool_name, e)
+        finally:
+            metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - debut, pool_name, "sync")
+        conn._leased_at = time.perf_counter()
+        if hasattr(pool, 'get_stats'):
+            # psycopg3 pool
+            conn._pool_type = 'psycopg3_pool'
+        else:
+            # psycopg2 pool
+            conn._pool_type = 'psycopg2_pool'
+        conn._pool_name = pool_name
+        return conn
+    
+    # Pas de pool : créer une connexion directe
+    try:
+        # Essayer psycopg3 d'abord
+        import psycopg
+        conn = psycopg.connect(database_url)
+        conn._pool_type = 'direct_psycopg3'
+    except ImportError:
         try:
-            # Essayer psycopg3 d'abord
-            import psycopg
-            conn = psycopg.connect(database_url)
-            conn._pool_type = 'direct_psycopg3'
+            # Fallback sur psycopg2
+            import psycopg2
+            conn = psycopg2.connect(database_url)
+            conn._pool_type = 'direct_psycopg2'
         except ImportError:
-            try:
-                # Fallback sur psycopg2
-                import psycopg2
-                conn = psycopg2.connect(database_url)
-                conn._pool_type = 'direct_psycopg2'
-            except ImportError:
-                raise Exception("Aucun module psycopg disponible")
+            raise Exception("Aucun module psycopg disponible")
     
     # ✅ SUPPRESSION COMPLÈTE : Plus aucune création automatique de tables
     # Les tables ne sont créées que manuellement via /admin/create-all-tables
@@ -108,21 +430,17 @@ def close_db_connection(conn):
     """Libérer une connexion selon son type (rétrocompatible)"""
     if not conn:
         return
-        
-    global connection_pool
     
-    # Récupérer le type depuis les métadonnées
+    # Récupérer le type et le pool d'origine depuis les métadonnées
     conn_type = getattr(conn, '_pool_type', 'unknown')
+    pool = connection_pools.get(getattr(conn, '_pool_name', None))
     
     try:
-        if conn_type == 'psycopg2_pool' and connection_pool:
-            # psycopg2 pool - remettre dans le pool
-            connection_pool.putconn(conn)
-            
-        elif conn_type == 'psycopg3_pool':
-            # psycopg3 pool - NE PAS FERMER ! Le pool gère automatiquement
-            # La connexion retourne au pool automatiquement grâce au context manager
-            pass
+        if conn_type in ('psycopg3_pool', 'psycopg2_pool') and pool:
+            metrics.POOL_USAGE_SECONDS.observe(time.perf_counter() - conn._leased_at, conn._pool_name, "sync")
+            # Remettre la connexion dans son pool (le pool psycopg3 annule
+            # lui-même une éventuelle transaction restée ouverte)
+            pool.putconn(conn)
             
         else:
             # Connexion directe - fermer normalement
@@ -135,7 +453,449 @@ def close_db_connection(conn):
         except:
             pass
 
-__all__ = ['get_db_connection', 'close_db_connection', 'ensure_chantiers_tables', 'ensure_etiquettes_grille_tables']
+@contextmanager
+def db_session(pool_name="write"):
+    """Emprunter une connexion au pool nommé et la rendre dans tous les cas
+
+    Valide la transaction en sortie normale, l'annule si une exception remonte,
+    puis restitue la connexion (même si le commit/rollback échoue).
+    """
+    with _session(get_db_connection(pool_name)) as conn:
+        yield conn
+
+@contextmanager
+def _session(conn):
+    """Encadrer une connexion déjà empruntée : commit / rollback puis restitution"""
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        close_db_connection(conn)
+
+def get_read_db():
+    """Dépendance FastAPI : connexion du pool des lectures interactives"""
+    with db_session("read") as conn:
+        yield conn
+
+def get_write_db():
+    """Dépendance FastAPI : connexion du pool des écritures"""
+    with db_session("write") as conn:
+        yield conn
+
+def get_admin_db():
+    """Dépendance FastAPI : connexion du pool des traitements lourds / admin"""
+    with db_session("admin") as conn:
+        yield conn
+
+# Rétrocompatibilité : get_db emprunte au pool des écritures
+get_db = get_write_db
+
+def _pipeline_supported(conn):
+    if not hasattr(conn, "pipeline"):
+        return False  # psycopg2
+    import psycopg
+    return psycopg.Pipeline.is_supported()
+
+def execute_pipeline(conn, statements):
+    """Envoyer plusieurs requêtes en un seul aller-retour réseau (mode pipeline psycopg3)
+
+    statements : liste de (sql, params). Retourne un curseur par requête, dans
+    le même ordre, avec ses résultats (fetchone/fetchall) et son rowcount.
+    Les requêtes s'exécutent dans la transaction courante : si l'une échoue,
+    l'exception remonte à la sortie du pipeline et les suivantes sont ignorées.
+    Sans support pipeline (psycopg2, libpq < 14), exécution séquentielle.
+    """
+    cursors = [conn.cursor() for _ in statements]
+    if _pipeline_supported(conn):
+        with conn.pipeline():
+            for cur, (sql, params) in zip(cursors, statements):
+                cur.execute(sql, params)
+    else:
+        for cur, (sql, params) in zip(cursors, statements):
+            cur.execute(sql, params)
+    return cursors
+
+def _champ_copy(valeur):
+    """Valeur au format texte de COPY (\\N pour NULL, séparateurs échappés)"""
+    if valeur is None:
+        return "\\N"
+    return (str(valeur).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def copy_lignes(conn, table, colonnes, lignes):
+    """Charger des lignes dans une table par COPY FROM STDIN (un seul flux)
+
+    Bien plus rapide qu'un INSERT par ligne (executemany) pour les gros
+    volumes : pas d'aller-retour ni de planification par ligne. Retourne le
+    nombre de lignes envoyées. Sous psycopg2, flux texte via copy_expert.
+    """
+    requete = f"COPY {table} ({', '.join(colonnes)}) FROM STDIN"
+    cur = conn.cursor()
+    if hasattr(cur, "copy"):
+        with cur.copy(requete) as copy:
+            for ligne in lignes:
+                copy.write_row(ligne)
+    else:
+        import io
+        flux = io.StringIO("".join("\t".join(_champ_copy(v) for v in ligne) + "\n" for ligne in lignes))
+        cur.copy_expert(requete, flux)
+    return len(lignes)
+
+# ========================================================================
+# LECTURES SUR RÉPLIQUE (DATABASE_REPLICA_URL)
+# ========================================================================
+
+# Retard de réplication en secondes (0 si la réplique a rejoué tout le WAL reçu,
+# ou si la base interrogée n'est pas en recovery)
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Dernière mesure partagée par toutes les requêtes (lag=None : réplique injoignable)
+_replica_lag_state = {"checked_at": None, "lag": None}
+
+def _lecture_primaire_demandee(request):
+    """Le client demande à relire ses propres écritures (X-Read-Your-Writes)"""
+    return request.headers.get(READ_YOUR_WRITES_HEADER, "").lower() in ("1", "true", "yes", "on")
+
+def _replica_lag_a_mesurer():
+    checked_at = _replica_lag_state["checked_at"]
+    return checked_at is None or time.monotonic() - checked_at >= DATABASE_REPLICA_LAG_CHECK_INTERVAL
+
+def _enregistrer_replica_lag(lag):
+    _replica_lag_state["lag"] = lag
+    _replica_lag_state["checked_at"] = time.monotonic()
+    if lag is not None and lag > DATABASE_REPLICA_MAX_LAG:
+        print(f"⚠️ Réplique en retard de {lag:.1f}s - lectures redirigées vers le primaire")
+
+def _replica_lag_acceptable():
+    lag = _replica_lag_state["lag"]
+    return lag is not None and lag <= DATABASE_REPLICA_MAX_LAG
+
+def _emprunter_replica(request):
+    """Connexion de la réplique si elle est utilisable pour cette requête, sinon None
+
+    Repli sur le primaire quand : pas de réplique, read-your-writes demandé,
+    réplique saturée ou injoignable, ou retard au-delà du seuil.
+    """
+    if "replica" not in connection_pools or _lecture_primaire_demandee(request):
+        return None
+    if not _replica_lag_a_mesurer() and not _replica_lag_acceptable():
+        return None
+    
+    try:
+        conn = get_db_connection("replica")
+    except HTTPException:
+        return None
+    
+    try:
+        if _replica_lag_a_mesurer():
+            cur = conn.cursor()
+            cur.execute(REPLICA_LAG_QUERY)
+            _enregistrer_replica_lag(float(cur.fetchone()[0]))
+            conn.rollback()
+        if _replica_lag_acceptable():
+            return conn
+    except Exception as e:
+        print(f"⚠️ Réplique indisponible: {e}")
+        _enregistrer_replica_lag(None)
+    
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+    close_db_connection(conn)
+    return None
+
+def get_readonly_db(request: Request, response: Response):
+    """Dépendance FastAPI des routes en lecture seule : réplique si à jour, sinon primaire"""
+    conn = _emprunter_replica(request)
+    if conn is not None:
+        response.headers[READ_SOURCE_HEADER] = "replica"
+        with _session(conn):
+            yield conn
+        return
+    
+    response.headers[READ_SOURCE_HEADER] = "primary"
+    with db_session("read") as conn:
+        yield conn
+
+@asynccontextmanager
+async def async_db_session(pool_name="write"):
+    """Équivalent asyncio de db_session() sur les AsyncConnectionPool nommés
+
+    Valide en sortie normale, annule si une exception remonte, et rend
+    toujours la connexion au pool. Sans pool, ouvre une connexion directe.
+    """
+    if pool_name in async_connection_pools:
+        conn = await _async_get_connection(pool_name)
+        async with _async_session(pool_name, conn):
+            yield conn
+        return
+    
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise Exception("DATABASE_URL non définie")
+    
+    import psycopg
+    async with await psycopg.AsyncConnection.connect(database_url, **_pool_connect_kwargs()) as conn:
+        yield conn
+
+async def _async_get_connection(pool_name):
+    debut = time.perf_counter()
+    try:
+        conn = await async_connection_pools[pool_name].getconn()
+    except POOL_SATURATION_ERRORS as e:
+        raise _pool_sature(pool_name, e)
+    finally:
+        metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - debut, pool_name, "async")
+    conn._leased_at = time.perf_counter()
+    return conn
+
+async def _async_putconn(pool_name, conn):
+    """Rendre une connexion au pool async en mesurant la durée d'emprunt"""
+    metrics.POOL_USAGE_SECONDS.observe(time.perf_counter() - conn._leased_at, pool_name, "async")
+    await async_connection_pools[pool_name].putconn(conn)
+
+@asynccontextmanager
+async def _async_session(pool_name, conn):
+    """Encadrer une connexion async déjà empruntée : commit / rollback puis restitution"""
+    try:
+        yield conn
+        await conn.commit()
+    except BaseException:
+        try:
+            await conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        await _async_putconn(pool_name, conn)
+
+async def get_async_read_db():
+    """Dépendance FastAPI async : pool des lectures interactives"""
+    async with async_db_session("read") as conn:
+        yield conn
+
+async def get_async_write_db():
+    """Dépendance FastAPI async : pool des écritures"""
+    async with async_db_session("write") as conn:
+        yield conn
+
+async def get_async_admin_db():
+    """Dépendance FastAPI async : pool des traitements lourds / admin"""
+    async with async_db_session("admin") as conn:
+        yield conn
+
+async def _emprunter_replica_async(request):
+    """Équivalent asyncio de _emprunter_replica()"""
+    if "replica" not in async_connection_pools or _lecture_primaire_demandee(request):
+        return None
+    if not _replica_lag_a_mesurer() and not _replica_lag_acceptable():
+        return None
+    
+    try:
+        conn = await _async_get_connection("replica")
+    except HTTPException:
+        return None
+    
+    try:
+        if _replica_lag_a_mesurer():
+            cur = conn.cursor()
+            await cur.execute(REPLICA_LAG_QUERY)
+            _enregistrer_replica_lag(float((await cur.fetchone())[0]))
+            await conn.rollback()
+        if _replica_lag_acceptable():
+            return conn
+    except Exception as e:
+        print(f"⚠️ Réplique indisponible: {e}")
+        _enregistrer_replica_lag(None)
+    
+    try:
+        await conn.rollback()
+    except Exception:
+        pass
+    await _async_putconn("replica", conn)
+    return None
+
+async def get_async_readonly_db(request: Request, response: Response):
+    """Dépendance FastAPI async des routes en lecture seule : réplique si à jour, sinon primaire"""
+    conn = await _emprunter_replica_async(request)
+    if conn is not None:
+        response.headers[READ_SOURCE_HEADER] = "replica"
+        async with _async_session("replica", conn):
+            yield conn
+        return
+    
+    response.headers[READ_SOURCE_HEADER] = "primary"
+    async with async_db_session("read") as conn:
+        yield conn
+
+# ========================================================================
+# ETAG DES LISTES GET (If-None-Match -> 304)
+# ========================================================================
+
+def reponse_json(response, corps):
+    """Réponse d'un corps JSON déjà sérialisé (par PostgreSQL), sans repasser par jsonable_encoder
+
+    Les en-têtes posés sur la réponse de la dépendance (X-Read-Source, ETag...)
+    sont repris : FastAPI ne les fusionne pas dans une Response renvoyée telle quelle.
+    """
+    return Response(content=corps, media_type="application/json", headers=dict(response.headers))
+
+def reponse_contenu(response, contenu):
+    """Réponse d'un contenu Python sérialisé directement par JSON_RESPONSE_CLASS
+
+    Évite le parcours complet de jsonable_encoder sur les grosses listes ;
+    en-têtes de la dépendance `response` repris comme dans reponse_json().
+    """
+    return JSON_RESPONSE_CLASS(content=contenu, headers=dict(response.headers))
+
+def _etag_depuis_versions(tables, rows):
+    """ETag fort à partir des versions des tables lues (None si une table n'est pas versionnée)"""
+    versions = dict(rows)
+    if any(table not in versions for table in tables):
+        return None
+    empreinte = ";".join(f"{table}:{versions[table]}" for table in tables)
+    return '"' + hashlib.sha1(empreinte.encode()).hexdigest()[:32] + '"'
+
+def _reponse_etag(request, response, etag):
+    """304 si If-None-Match correspond à l'ETag, sinon None (ETag posé sur la réponse)"""
+    if etag is None:
+        return None
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidats = [valeur.strip().removeprefix("W/") for valeur in if_none_match.split(",")]
+        if etag in candidats or "*" in candidats:
+            headers = dict(response.headers)
+            headers["ETag"] = etag
+            return Response(status_code=304, headers=headers)
+    response.headers["ETag"] = etag
+    return None
+
+def verifier_etag(request, response, conn, tables):
+    """Lire les versions des tables d'une liste GET avant ses données
+
+    Retourne une réponse 304 à renvoyer telle quelle si le client a déjà cette
+    version, sinon None. Lue avant les données, une version ne peut pas être
+    plus récente que le contenu servi avec elle.
+    """
+    try:
+        cur = conn.cursor()
+        prepared_queries.execute(cur, "versions_tables", (list(tables),))
+        etag = _etag_depuis_versions(tables, cur.fetchall())
+    except QUERY_BUDGET_ERRORS:
+        raise
+    except Exception as e:
+        # Base sans versions (POST /admin/create-all-tables non relancé) : pas d'ETag
+        print(f"⚠️ Versions des tables indisponibles: {str(e).splitlines()[0]}")
+        conn.rollback()
+        return None
+    return _reponse_etag(request, response, etag)
+
+async def verifier_etag_async(request, response, conn, tables):
+    """Équivalent asyncio de verifier_etag()"""
+    try:
+        cur = conn.cursor()
+        await prepared_queries.execute_async(cur, "versions_tables", (list(tables),))
+        etag = _etag_depuis_versions(tables, await cur.fetchall())
+    except QUERY_BUDGET_ERRORS:
+        raise
+    except Exception as e:
+        print(f"⚠️ Versions des tables indisponibles: {str(e).splitlines()[0]}")
+        await conn.rollback()
+        return None
+    return _reponse_etag(request, response, etag)
+
+# ========================================================================
+# PROJECTION DES LISTES (?fields=)
+# ========================================================================
+
+def champs_demandes(fields, disponibles):
+    """Champs d'un paramètre ?fields= (répété ou séparé par des virgules)
+
+    Renvoie None sans paramètre, sinon les champs retenus dans l'ordre de
+    `disponibles` (celui de la réponse complète), id toujours en tête.
+    Lève HTTPException 400 pour un champ inconnu.
+    """
+    if not fields:
+        return None
+    demandes = {champ.strip() for valeur in fields for champ in valeur.split(",") if champ.strip()}
+    inconnus = demandes - set(disponibles)
+    if inconnus:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Champ(s) inconnu(s) : {', '.join(sorted(inconnus))} (disponibles : {', '.join(disponibles)})"
+        )
+    return tuple(champ for champ in disponibles if champ == "id" or champ in demandes)
+
+# ========================================================================
+# EXPORTS NDJSON (CURSEURS CÔTÉ SERVEUR)
+# ========================================================================
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Pool des exports : "export" par défaut (pool dédié, bail borné par
+# idle_in_transaction_session_timeout : un client qui ne lit plus rien voit son
+# export interrompu), ou "replica" / "read" via NDJSON_POOL. Un pool non
+# configuré (réplique absente) retombe sur "export".
+NDJSON_POOL = os.environ.get("NDJSON_POOL", "export")
+
+def _pool_ndjson():
+    """Pool effectivement utilisé par reponse_ndjson()"""
+    return NDJSON_POOL if NDJSON_POOL in connection_pools else "export"
+
+def _lots_ndjson(lignes, taille_lot):
+    """Regrouper les lignes par lot de fetchmany : un envoi par lot plutôt qu'un par ligne"""
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille_lot:
+            yield b"".join(lot)
+            lot = []
+    if lot:
+        yield b"".join(lot)
+
+def reponse_ndjson(requete, params=None, convertir=None, nom=None):
+    """StreamingResponse NDJSON (un objet JSON par ligne) lue par curseur côté serveur
+
+    Sans convertir, la première colonne de chaque ligne est déjà un texte JSON
+    compact (construit par PostgreSQL) ; sinon convertir(row) donne l'objet à
+    sérialiser. La connexion est empruntée pour la durée du flux et rendue à
+    sa fin : la mémoire reste bornée par DB_ITER_BATCH_SIZE lignes.
+
+    Le premier lot est lu avant de renvoyer la réponse : une erreur de la
+    requête (table absente, pool saturé, budget dépassé) remonte encore au
+    handler avec son code HTTP, et le premier octet part sans attendre la fin.
+    """
+    taille_lot = database_config.ITER_BATCH_SIZE
+    rows = database_config.execute_query(requete, params, fetch="iter", pool_name=_pool_ndjson(),
+                                         name=nom, batch_size=taille_lot)
+    if convertir is None:
+        lignes = (row[0].encode("utf-8") + b"\n" for row in rows)
+    else:
+        lignes = (serialiser_json(convertir(row)) + b"\n" for row in rows)
+    lots = _lots_ndjson(lignes, taille_lot)
+    premier = next(lots, b"")
+    return StreamingResponse(itertools.chain((premier,), lots), media_type=NDJSON_MEDIA_TYPE)
+
+__all__ = ['get_db_connection', 'close_db_connection', 'db_session', 'get_db', 'execute_pipeline', 'copy_lignes',
+           'get_read_db', 'get_write_db', 'get_admin_db', 'get_readonly_db',
+           'async_db_session', 'get_async_read_db', 'get_async_write_db', 'get_async_admin_db',
+           'get_async_readonly_db', 'verifier_etag', 'verifier_etag_async', 'reponse_json', 'reponse_contenu',
+           'reponse_ndjson', 'champs_demandes',
+           'DB_ASYNC_ENABLED', 'DB_JSON_SQL_ENABLED', 'CHANGE_TOKEN_HEADER', 'NEXT_CURSOR_HEADER', 'QUERY_BUDGET_ERRORS', 'ensure_chantiers_tables', 'ensure_etiquettes_grille_tables',
+           'ensure_versions_tables', 'VERSIONED_TABLES']
 
 
 # Import conditionnel des routers pour éviter les erreurs de déploiement
@@ -255,6 +1015,12 @@ def ensure_etiquettes_grille_tables(conn):
             WHERE texte IS NOT NULL AND texte != ''
         """)
         
+        # Tri de GET /etiquettes-grille/stream (premières lignes sans tri complet)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_etiquettes_created_at 
+            ON etiquettes_grille (created_at DESC)
+        """)
+        
         cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_planif_etiquettes_date 
             ON planifications_etiquettes (date_jour)
@@ -444,11 +1210,15 @@ def ensure_chantiers_tables(conn):
                 FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
         """)
         
+        # Une mise à jour qui ne touche que change_xid (écriture d'une table
+        # enfant, voir chantiers_marquer_enfant) ne change pas updated_at
         cur.execute("""
             DROP TRIGGER IF EXISTS update_chantiers_updated_at ON chantiers;
             CREATE TRIGGER update_chantiers_updated_at 
                 BEFORE UPDATE ON chantiers 
-                FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+                FOR EACH ROW
+                WHEN ((to_jsonb(OLD) - 'change_xid') IS DISTINCT FROM (to_jsonb(NEW) - 'change_xid'))
+                EXECUTE FUNCTION update_updated_at_column();
         """)
         
         cur.execute("""
@@ -458,6 +1228,254 @@ def ensure_chantiers_tables(conn):
                 FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
         """)
         
+        # ========================================================================
+        # 3. SUIVI DES CHANGEMENTS (GET /chantiers?since=<jeton>)
+        # ========================================================================
+        
+        # updated_at sur les tables enfants, maintenu comme sur les tables principales
+        for table in ('planifications', 'soldes', 'verrous_planification'):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP")
+            cur.execute(f"""
+                DROP TRIGGER IF EXISTS update_{table}_updated_at ON {table};
+                CREATE TRIGGER update_{table}_updated_at 
+                    BEFORE UPDATE ON {table} 
+                    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+            """)
+        
+        # Transaction (xid8, croissant) de la dernière modification d'un chantier
+        # ou de ses planifications / soldes / verrous
+        cur.execute("ALTER TABLE chantiers ADD COLUMN IF NOT EXISTS change_xid xid8")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chantiers_change_xid ON chantiers (change_xid)")
+        
+        # Pierres tombales : chantiers supprimés, pour les clients en synchronisation delta
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS chantiers_supprimes (
+                id VARCHAR(255) PRIMARY KEY,
+                change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+                deleted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chantiers_supprimes_change_xid ON chantiers_supprimes (change_xid)")
+        
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION chantiers_marquer_changement()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO chantiers_supprimes (id) VALUES (OLD.id)
+                    ON CONFLICT (id) DO UPDATE
+                    SET change_xid = pg_current_xact_id(), deleted_at = CURRENT_TIMESTAMP;
+                    RETURN OLD;
+                END IF;
+                IF TG_OP = 'INSERT' THEN
+                    DELETE FROM chantiers_supprimes WHERE id = NEW.id;
+                END IF;
+                NEW.change_xid = pg_current_xact_id();
+                RETURN NEW;
+            END;
+            $$ language 'plpgsql';
+        """)
+        
+        # Une modification d'une table enfant marque son chantier (une seule fois
+        # par transaction, même pour une planification de 104 semaines). Triggers
+        # par instruction (tables de transition) : une mise à jour de chantiers par
+        # écriture, quel que soit le nombre de lignes (PUT /planification/bulk)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION chantiers_marquer_enfant()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE chantiers SET change_xid = pg_current_xact_id()
+                    WHERE id IN (SELECT chantier_id FROM nouvelles)
+                      AND change_xid IS DISTINCT FROM pg_current_xact_id();
+                ELSIF TG_OP = 'UPDATE' THEN
+                    UPDATE chantiers SET change_xid = pg_current_xact_id()
+                    WHERE id IN (SELECT chantier_id FROM nouvelles UNION SELECT chantier_id FROM anciennes)
+                      AND change_xid IS DISTINCT FROM pg_current_xact_id();
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE chantiers SET change_xid = pg_current_xact_id()
+                    WHERE id IN (SELECT chantier_id FROM anciennes)
+                      AND change_xid IS DISTINCT FROM pg_current_xact_id();
+                ELSE
+                    UPDATE chantiers SET change_xid = pg_current_xact_id()
+                    WHERE change_xid IS DISTINCT FROM pg_current_xact_id();
+                END IF;
+                RETURN NULL;
+            END;
+            $$ language 'plpgsql';
+        """)
+        
+        cur.execute("""
+            DROP TRIGGER IF EXISTS chantiers_suivi_changements ON chantiers;
+            CREATE TRIGGER chantiers_suivi_changements 
+                BEFORE INSERT OR UPDATE OR DELETE ON chantiers 
+                FOR EACH ROW EXECUTE FUNCTION chantiers_marquer_changement();
+        """)
+        for table in ('planifications', 'soldes', 'verrous_planification'):
+            cur.execute(f"""
+                DROP TRIGGER IF EXISTS {table}_suivi_changements ON {table};
+                DROP TRIGGER IF EXISTS {table}_suivi_insert ON {table};
+                CREATE TRIGGER {table}_suivi_insert 
+                    AFTER INSERT ON {table} REFERENCING NEW TABLE AS nouvelles 
+                    FOR EACH STATEMENT EXECUTE FUNCTION chantiers_marquer_enfant();
+                DROP TRIGGER IF EXISTS {table}_suivi_update ON {table};
+                CREATE TRIGGER {table}_suivi_update 
+                    AFTER UPDATE ON {table} REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles 
+                    FOR EACH STATEMENT EXECUTE FUNCTION chantiers_marquer_enfant();
+                DROP TRIGGER IF EXISTS {table}_suivi_delete ON {table};
+                CREATE TRIGGER {table}_suivi_delete 
+                    AFTER DELETE ON {table} REFERENCING OLD TABLE AS anciennes 
+                    FOR EACH STATEMENT EXECUTE FUNCTION chantiers_marquer_enfant();
+                DROP TRIGGER IF EXISTS {table}_suivi_truncate ON {table};
+                CREATE TRIGGER {table}_suivi_truncate 
+                    AFTER TRUNCATE ON {table} 
+                    FOR EACH STATEMENT EXECUTE FUNCTION chantiers_marquer_enfant();
+            """)
+        
+        # ========================================================================
+        # 4. DOCUMENTS DES CHANTIERS (lecture de GET /chantiers sans agrégation)
+        # ========================================================================
+        
+        # Document JSON complet de chaque chantier, au format de la réponse de GET /chantiers.
+        # Texte compact (sans espaces), identique à la sérialisation FastAPI : les
+        # documents se concatènent tels quels dans le corps de la réponse.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS chantier_documents (
+                chantier_id VARCHAR(255) PRIMARY KEY
+                    REFERENCES chantiers(id) ON DELETE CASCADE ON UPDATE CASCADE,
+                document JSON NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Recalcul des documents d'une liste de chantiers. Le verrou sur les
+        # chantiers bloque la seconde transaction concurrente sur un même
+        # chantier jusqu'au commit de la première : elle recalcule ensuite en
+        # voyant ses lignes. FOR NO KEY UPDATE et non FOR UPDATE : chaque
+        # écriture d'une table enfant prend déjà FOR KEY SHARE sur le chantier
+        # (contrôle de clé étrangère), compatible avec NO KEY UPDATE mais pas
+        # avec FOR UPDATE (deux écritures enfants concurrentes s'attendraient
+        # mutuellement : deadlock 40P01).
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION rafraichir_documents_chantiers(ids VARCHAR[])
+            RETURNS VOID AS $$
+            BEGIN
+                IF cardinality(ids) = 0 THEN
+                    RETURN;
+                END IF;
+                PERFORM 1 FROM chantiers WHERE id = ANY(ids) ORDER BY id FOR NO KEY UPDATE;
+                INSERT INTO chantier_documents (chantier_id, document, updated_at)
+                SELECT c.id,
+                       (
+                           '{"id":' || to_json(c.id)::text ||
+                           ',"label":' || to_json(COALESCE(c.label, ''))::text ||
+                           ',"status":' || to_json(COALESCE(NULLIF(c.status, ''), 'Nouveau'))::text ||
+                           ',"prepTime":' || COALESCE(c.prepTime, 0) ||
+                           ',"endDate":' || to_json(COALESCE(c.endDate, ''))::text ||
+                           ',"preparateur":' || COALESCE(to_json(NULLIF(c.preparateur_nom, ''))::text, 'null') ||
+                           ',"ChargeRestante":' || COALESCE(c.ChargeRestante, 0) ||
+                           ',"planification":' || COALESCE((
+                               SELECT '{' || string_agg(to_json(p.semaine)::text || ':' || p.minutes, ',' ORDER BY p.semaine) || '}'
+                               FROM planifications p WHERE p.chantier_id = c.id), '{}') ||
+                           ',"soldes":' || COALESCE((
+                               SELECT '{' || string_agg(to_json(s.semaine)::text || ':' || s.minutes, ',' ORDER BY s.semaine) || '}'
+                               FROM soldes s WHERE s.chantier_id = c.id), '{}') ||
+                           ',"forcedPlanningLock":' || COALESCE((
+                               SELECT '{' || string_agg(
+                                          to_json(v.semaine)::text || ':{"preparateur":' || to_json(v.preparateur_nom)::text ||
+                                          ',"minutes":' || v.minutes || '}',
+                                          ',' ORDER BY v.semaine) || '}'
+                               FROM verrous_planification v WHERE v.chantier_id = c.id), '{}') ||
+                           '}'
+                       )::json,
+                       CURRENT_TIMESTAMP
+                FROM chantiers c
+                WHERE c.id = ANY(ids)
+                ON CONFLICT (chantier_id) DO UPDATE
+                SET document = EXCLUDED.document, updated_at = EXCLUDED.updated_at;
+            END;
+            $$ language 'plpgsql';
+        """)
+        
+        # Triggers par instruction (tables de transition) : un recalcul par
+        # chantier touché, quel que soit le nombre de lignes écrites
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION documents_chantiers_enfants()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM rafraichir_documents_chantiers(ARRAY(SELECT DISTINCT chantier_id FROM nouvelles));
+                ELSIF TG_OP = 'UPDATE' THEN
+                    PERFORM rafraichir_documents_chantiers(ARRAY(
+                        SELECT chantier_id FROM nouvelles UNION SELECT chantier_id FROM anciennes
+                    ));
+                ELSIF TG_OP = 'DELETE' THEN
+                    PERFORM rafraichir_documents_chantiers(ARRAY(SELECT DISTINCT chantier_id FROM anciennes));
+                ELSE
+                    PERFORM rafraichir_documents_chantiers(ARRAY(SELECT id FROM chantiers));
+                END IF;
+                RETURN NULL;
+            END;
+            $$ language 'plpgsql';
+        """)
+        
+        # Sur chantiers, seules les colonnes du document déclenchent un recalcul
+        # (pas updated_at ni change_xid, marqué à chaque écriture d'une table enfant)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION documents_chantiers_maj()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM rafraichir_documents_chantiers(ARRAY(SELECT id FROM nouvelles));
+                ELSE
+                    PERFORM rafraichir_documents_chantiers(ARRAY(
+                        SELECT n.id
+                        FROM nouvelles n
+                        LEFT JOIN anciennes o ON o.id = n.id
+                        WHERE o.id IS NULL
+                           OR (n.label, n.status, n.prepTime, n.endDate, n.preparateur_nom, n.ChargeRestante)
+                              IS DISTINCT FROM
+                              (o.label, o.status, o.prepTime, o.endDate, o.preparateur_nom, o.ChargeRestante)
+                    ));
+                END IF;
+                RETURN NULL;
+            END;
+            $$ language 'plpgsql';
+        """)
+        
+        cur.execute("""
+            DROP TRIGGER IF EXISTS chantiers_documents_insert ON chantiers;
+            CREATE TRIGGER chantiers_documents_insert 
+                AFTER INSERT ON chantiers REFERENCING NEW TABLE AS nouvelles 
+                FOR EACH STATEMENT EXECUTE FUNCTION documents_chantiers_maj();
+            DROP TRIGGER IF EXISTS chantiers_documents_update ON chantiers;
+            CREATE TRIGGER chantiers_documents_update 
+                AFTER UPDATE ON chantiers REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles 
+                FOR EACH STATEMENT EXECUTE FUNCTION documents_chantiers_maj();
+        """)
+        for table in ('planifications', 'soldes', 'verrous_planification'):
+            cur.execute(f"""
+                DROP TRIGGER IF EXISTS {table}_documents_insert ON {table};
+                CREATE TRIGGER {table}_documents_insert 
+                    AFTER INSERT ON {table} REFERENCING NEW TABLE AS nouvelles 
+                    FOR EACH STATEMENT EXECUTE FUNCTION documents_chantiers_enfants();
+                DROP TRIGGER IF EXISTS {table}_documents_update ON {table};
+                CREATE TRIGGER {table}_documents_update 
+                    AFTER UPDATE ON {table} REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles 
+                    FOR EACH STATEMENT EXECUTE FUNCTION documents_chantiers_enfants();
+                DROP TRIGGER IF EXISTS {table}_documents_delete ON {table};
+                CREATE TRIGGER {table}_documents_delete 
+                    AFTER DELETE ON {table} REFERENCING OLD TABLE AS anciennes 
+                    FOR EACH STATEMENT EXECUTE FUNCTION documents_chantiers_enfants();
+                DROP TRIGGER IF EXISTS {table}_documents_truncate ON {table};
+                CREATE TRIGGER {table}_documents_truncate 
+                    AFTER TRUNCATE ON {table} 
+                    FOR EACH STATEMENT EXECUTE FUNCTION documents_chantiers_enfants();
+            """)
+        
+        # Reconstruction complète : documents des chantiers écrits avant les triggers
+        cur.execute("SELECT rafraichir_documents_chantiers(ARRAY(SELECT id FROM chantiers))")
+        
         conn.commit()
         print("✅ Tables créées/vérifiées avec succès")
         
@@ -466,44 +1484,349 @@ def ensure_chantiers_tables(conn):
         conn.rollback()
         raise
 
+def ensure_versions_tables(conn):
+    """Versions des tables pour les ETag des listes GET (à appeler après les autres ensure_*)
 
-from contextlib import asynccontextmanager
+    La version d'une table est l'identifiant (xid8) de la dernière transaction
+    qui l'a modifiée : croissante, et sans collision si les tables sont
+    supprimées puis recréées. Seules les tables existantes reçoivent leur
+    trigger ; une table sans ligne de version ne produit jamais d'ETag.
+
+    Les triggers par instruction ne font que noter la table modifiée dans
+    versions_tables_en_attente (une fois par transaction, rien si l'instruction
+    ne touche aucune ligne). La ligne de versions_tables n'est écrite qu'au
+    commit, par un trigger différé, toutes tables de la transaction dans
+    l'ordre alphabétique : le verrou de ligne n'est tenu que le temps du
+    commit, et deux transactions le prennent toujours dans le même ordre.
+    """
+    try:
+        cur = conn.cursor()
+        
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS versions_tables (
+                table_name VARCHAR(63) PRIMARY KEY,
+                version xid8 NOT NULL DEFAULT pg_current_xact_id(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Tables modifiées par les transactions en cours (vidée au commit de chacune)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS versions_tables_en_attente (
+                xid xid8 NOT NULL,
+                table_name VARCHAR(63) NOT NULL
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_versions_en_attente_xid ON versions_tables_en_attente (xid)")
+        
+        # Une seule ligne en attente par table et par transaction (drapeau local
+        # à la transaction), aucune si l'instruction ne touche aucune ligne
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION incrementer_version_table()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                -- versions_tables supprimée (DROP /admin/drop-all-tables) : écriture non bloquée
+                IF to_regclass('versions_tables_en_attente') IS NULL THEN
+                    RETURN NULL;
+                END IF;
+                IF current_setting('versions_tables.' || TG_TABLE_NAME, true) = pg_current_xact_id()::text THEN
+                    RETURN NULL;
+                END IF;
+                IF TG_OP = 'INSERT' THEN
+                    IF NOT EXISTS (SELECT 1 FROM nouvelles) THEN
+                        RETURN NULL;
+                    END IF;
+                ELSIF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    IF NOT EXISTS (SELECT 1 FROM anciennes) THEN
+                        RETURN NULL;
+                    END IF;
+                END IF;
+                PERFORM set_config('versions_tables.' || TG_TABLE_NAME, pg_current_xact_id()::text, true);
+                INSERT INTO versions_tables_en_attente (xid, table_name)
+                VALUES (pg_current_xact_id(), TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ language 'plpgsql';
+        """)
+        
+        # Au commit : toutes les tables en attente de la transaction, dans un
+        # ordre fixe (le premier déclenchement traite tout, les suivants rien)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION appliquer_versions_tables()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                WITH en_attente AS (
+                    DELETE FROM versions_tables_en_attente
+                    WHERE xid = pg_current_xact_id()
+                    RETURNING table_name
+                )
+                INSERT INTO versions_tables (table_name)
+                SELECT DISTINCT table_name FROM en_attente ORDER BY table_name
+                ON CONFLICT (table_name) DO UPDATE
+                SET version = pg_current_xact_id(), updated_at = CURRENT_TIMESTAMP;
+                RETURN NULL;
+            END;
+            $$ language 'plpgsql';
+        """)
+        cur.execute("""
+            DROP TRIGGER IF EXISTS versions_tables_appliquer ON versions_tables_en_attente;
+            CREATE CONSTRAINT TRIGGER versions_tables_appliquer
+                AFTER INSERT ON versions_tables_en_attente
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW EXECUTE FUNCTION appliquer_versions_tables();
+        """)
+        
+        for table in VERSIONED_TABLES:
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            if cur.fetchone()[0] is None:
+                continue
+            # Un trigger par opération : tables de transition pour ignorer les
+            # instructions sans effet (remplace l'ancien {table}_version)
+            cur.execute(f"""
+                DROP TRIGGER IF EXISTS {table}_version ON {table};
+                DROP TRIGGER IF EXISTS {table}_version_insert ON {table};
+                CREATE TRIGGER {table}_version_insert 
+                    AFTER INSERT ON {table} REFERENCING NEW TABLE AS nouvelles 
+                    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_table();
+                DROP TRIGGER IF EXISTS {table}_version_update ON {table};
+                CREATE TRIGGER {table}_version_update 
+                    AFTER UPDATE ON {table} REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles 
+                    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_table();
+                DROP TRIGGER IF EXISTS {table}_version_delete ON {table};
+                CREATE TRIGGER {table}_version_delete 
+                    AFTER DELETE ON {table} REFERENCING OLD TABLE AS anciennes 
+                    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_table();
+                DROP TRIGGER IF EXISTS {table}_version_truncate ON {table};
+                CREATE TRIGGER {table}_version_truncate 
+                    AFTER TRUNCATE ON {table} 
+                    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_table();
+            """)
+            # Nouvelle version : la table a pu être recréée sans trigger entre-temps
+            cur.execute("""
+                INSERT INTO versions_tables (table_name) VALUES (%s)
+                ON CONFLICT (table_name) DO UPDATE
+                SET version = pg_current_xact_id(), updated_at = CURRENT_TIMESTAMP
+            """, (table,))
+        
+        conn.commit()
+        print("✅ Versions des tables créées/vérifiées")
+        
+    except Exception as e:
+        print(f"🚨 Erreur lors de la création des versions de tables: {e}")
+        conn.rollback()
+        raise
+
+
+# ========================================================================
+# WARM-UP AU DÉMARRAGE
+# ========================================================================
+
+# Après un redémarrage / réveil Render, les premiers utilisateurs paieraient le
+# remplissage des pools, le TLS, la planification des requêtes chaudes et les
+# caches de catalogue Postgres. Le warm-up ouvre min_size connexions par pool,
+# y exécute chaque requête de lecture du registre (préparée sur chaque
+# connexion) puis lit les tables de référence.
+DB_WARMUP_ENABLED = os.environ.get("DB_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+DB_WARMUP_TIMEOUT = _env_float("DB_WARMUP_TIMEOUT", 30)
+DB_WARMUP_PRELOAD = os.environ.get("DB_WARMUP_PRELOAD", "true").lower() in ("1", "true", "yes", "on")
+WARMUP_REFERENCE_TABLES = ("preparateurs", "horaires_preparateurs", "text_templates")
+
+_warmup_state = {"ready": False, "duree_ms": None, "pools": {}, "references": {}}
+_warmup_task = None
+
+def _warmup_pool(name, pool):
+    """Ouvrir les min_size connexions d'un pool sync et y préparer les requêtes chaudes"""
+    if hasattr(pool, "wait"):
+        pool.wait(timeout=DB_WARMUP_TIMEOUT)  # psycopg3 : min_size connexions ouvertes
+    conns = []
+    try:
+        # Emprunter les connexions ensemble pour que chacune soit préparée
+        for _ in range(POOL_SETTINGS[name]["min_size"]):
+            conns.append(pool.getconn())
+        requetes = [prepared_queries.warmup(conn) for conn in conns]
+    finally:
+        for conn in conns:
+            pool.putconn(conn)
+    return {"connexions": len(conns), "requetes": requetes[0] if requetes else {}}
+
+async def _warmup_async_pool(name, pool):
+    """Équivalent asyncio de _warmup_pool()"""
+    await pool.wait(timeout=DB_WARMUP_TIMEOUT)
+    conns = []
+    try:
+        for _ in range(POOL_SETTINGS[name]["min_size"]):
+            conns.append(await pool.getconn())
+        requetes = [await prepared_queries.warmup_async(conn) for conn in conns]
+    finally:
+        for conn in conns:
+            await pool.putconn(conn)
+    return {"connexions": len(conns), "requetes": requetes[0] if requetes else {}}
+
+def _precharger_references():
+    """Lire les tables de référence : pages en cache Postgres, catalogue chaud"""
+    resultats = {}
+    with db_session("read") as conn:
+        cur = conn.cursor()
+        for table in WARMUP_REFERENCE_TABLES:
+            try:
+                cur.execute(f"SELECT * FROM {table}")
+                resultats[table] = len(cur.fetchall())
+            except Exception as e:
+                conn.rollback()
+                resultats[table] = str(e).splitlines()[0]
+    return resultats
+
+async def _etape_warmup(cle, etape):
+    """Noter le résultat d'une étape du warm-up sans bloquer les suivantes"""
+    try:
+        _warmup_state["pools"][cle] = await etape
+    except Exception as e:
+        _warmup_state["pools"][cle] = {"erreur": str(e)}
+        print(f"⚠️ Warm-up du pool '{cle}' incomplet: {e}")
+
+async def warmup():
+    """Phase de warm-up : pools sync, pools async puis tables de référence
+
+    L'application est déclarée prête à la fin, même si une étape a échoué
+    (l'erreur est visible dans GET /ready).
+    """
+    debut = time.perf_counter()
+    for name, pool in list(connection_pools.items()):
+        await _etape_warmup(name, asyncio.to_thread(_warmup_pool, name, pool))
+    for name, pool in list(async_connection_pools.items()):
+        await _etape_warmup(f"async_{name}", _warmup_async_pool(name, pool))
+    if DB_WARMUP_PRELOAD and connection_pools:
+        try:
+            _warmup_state["references"] = await asyncio.to_thread(_precharger_references)
+        except Exception as e:
+            _warmup_state["references"] = {"erreur": str(e)}
+            print(f"⚠️ Préchargement des tables de référence impossible: {e}")
+    _warmup_state["duree_ms"] = round((time.perf_counter() - debut) * 1000, 1)
+    _warmup_state["ready"] = True
+    print(f"🔥 Warm-up terminé en {_warmup_state['duree_ms']} ms")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gestion du cycle de vie de l'application"""
+    global _warmup_task
     # 🚀 STARTUP
     init_connection_pool()
+    if DB_ASYNC_ENABLED:
+        try:
+            await init_async_connection_pools()
+        except Exception as e:
+            print(f"⚠️ Pool async indisponible: {e}")
     print("🚀 Application démarrée avec pool de connexions")
     
-    yield  # ← App tourne ici (toutes tes routes sync)
+    # Warm-up en tâche de fond : /health répond tout de suite, /ready après le warm-up
+    if DB_WARMUP_ENABLED and (connection_pools or async_connection_pools):
+        _warmup_task = asyncio.create_task(warmup())
+    else:
+        _warmup_state["ready"] = True
+    
+    yield  # ← App tourne ici (routes sync + routes async chaudes)
     
     # 🛑 SHUTDOWN
-    global connection_pool
-    if connection_pool:
-        try:
-            if hasattr(connection_pool, 'closeall'):
-                connection_pool.closeall()
-            elif hasattr(connection_pool, 'close'):
-                connection_pool.close()
-            print("✅ Pool de connexions fermé proprement")
-        except Exception as e:
-            print(f"⚠️ Erreur lors de la fermeture du pool: {e}")
+    if _warmup_task and not _warmup_task.done():
+        _warmup_task.cancel()
+    await close_async_connection_pools()
+    close_connection_pools()
+
+# ========================================================================
+# SÉRIALISATION JSON DES RÉPONSES
+# ========================================================================
+
+# Classe de réponse par défaut de tous les routers. JSON_SERIALIZER=auto
+# utilise orjson s'il est installé, sinon le module json standard ;
+# orjson / standard forcent le choix.
+JSON_SERIALIZER = os.environ.get("JSON_SERIALIZER", "auto").lower()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_defaut(obj):
+    """Types hors JSON convertis comme jsonable_encoder : isoformat() pour les dates et heures"""
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+def _dumps_standard(content) -> bytes:
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None,
+        separators=(",", ":"), default=_json_defaut
+    ).encode("utf-8")
+
+def _dumps_orjson(content) -> bytes:
+    return orjson.dumps(
+        content, default=_json_defaut,
+        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    )
+
+class ReponseJSONStandard(JSONResponse):
+    """JSONResponse de FastAPI, capable aussi de sérialiser un contenu non passé par jsonable_encoder"""
+    def render(self, content) -> bytes:
+        return _dumps_standard(content)
+
+class ReponseORJSON(JSONResponse):
+    """Réponse sérialisée par orjson, octet pour octet identique à JSONResponse pour nos contenus
+
+    Dates et heures passent par _json_defaut (isoformat()) et non par le
+    format RFC 3339 d'orjson.
+    """
+    def render(self, content) -> bytes:
+        return _dumps_orjson(content)
+
+def _classe_reponse_json():
+    if JSON_SERIALIZER in ("auto", "orjson") and orjson is not None:
+        return ReponseORJSON
+    if JSON_SERIALIZER == "orjson":
+        print("⚠️ orjson non installé - sérialisation JSON standard")
+    return ReponseJSONStandard
+
+JSON_RESPONSE_CLASS = _classe_reponse_json()
+
+# Octets JSON d'un objet, identiques au corps de JSON_RESPONSE_CLASS (lignes NDJSON)
+serialiser_json = _dumps_orjson if JSON_RESPONSE_CLASS is ReponseORJSON else _dumps_standard
 
 app = FastAPI(
     title="API de Planification",
     description="API pour la gestion des chantiers et des étiquettes de planification",
     version="2.0.0",
+    default_response_class=JSON_RESPONSE_CLASS,
     lifespan=lifespan  # ← Remplace les @app.on_event()
 )
 
 
 
+@app.exception_handler(HTTPException)
+async def budget_http_exception_handler(request: Request, exc: HTTPException):
+    """HTTPException levée suite à une requête annulée hors budget -> 504 / 503"""
+    cause = _erreur_budget(exc)
+    if cause is not None:
+        return _budget_depasse(request, cause)
+    return await http_exception_handler(request, exc)
+
+async def budget_exception_handler(request: Request, exc: Exception):
+    """Erreur de budget remontée telle quelle par une route"""
+    return _budget_depasse(request, exc)
+
+for _budget_error in QUERY_BUDGET_ERRORS:
+    app.add_exception_handler(_budget_error, budget_exception_handler)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[READ_SOURCE_HEADER, NEXT_CURSOR_HEADER, CHANGE_TOKEN_HEADER, "ETag"],  # Lisibles par le JS du navigateur
 )
 
 # Inclure les routers seulement s'ils sont disponibles
@@ -529,26 +1852,23 @@ def read_root():
         "texte_etiquette": "✅ Disponible" if TEXTE_ETIQUETTE_AVAILABLE else "❌ Non disponible"
     }
     
-    pool_status = "✅ Actif" if connection_pool else "❌ Désactivé"
+    pool_status = "✅ Actif" if connection_pools else "❌ Désactivé"
     
     # ✅ AJOUT : Vérifier les tables spécifiques
     tables_status = {}
     if TEXTE_ETIQUETTE_AVAILABLE:
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            # Vérifier table text_templates
-            cur.execute("SELECT COUNT(*) FROM text_templates")
-            templates_count = cur.fetchone()[0]
-            tables_status["text_templates"] = f"✅ {templates_count} template(s)"
-            
-            # Vérifier colonne texte dans etiquettes
-            cur.execute("SELECT COUNT(*) FROM etiquettes_grille WHERE texte IS NOT NULL AND texte != ''")
-            etiquettes_with_text = cur.fetchone()[0]
-            tables_status["etiquettes_with_text"] = f"✅ {etiquettes_with_text} étiquette(s) avec texte"
-            
-            close_db_connection(conn)
+            with db_session("read") as conn:
+                # Vérifier table text_templates et colonne texte des étiquettes (un seul aller-retour)
+                templates_cur, etiquettes_cur = execute_pipeline(conn, [
+                    ("SELECT COUNT(*) FROM text_templates", None),
+                    ("SELECT COUNT(*) FROM etiquettes_grille WHERE texte IS NOT NULL AND texte != ''", None),
+                ])
+                templates_count = templates_cur.fetchone()[0]
+                tables_status["text_templates"] = f"✅ {templates_count} template(s)"
+                
+                etiquettes_with_text = etiquettes_cur.fetchone()[0]
+                tables_status["etiquettes_with_text"] = f"✅ {etiquettes_with_text} étiquette(s) avec texte"
         except Exception:
             tables_status["text_templates"] = "⚠️ Non vérifiable"
             tables_status["etiquettes_with_text"] = "⚠️ Non vérifiable"
@@ -569,34 +1889,61 @@ def read_root():
     }
 
 
+def _pool_info(name, pool):
+    """Statistiques d'un pool nommé pour /health"""
+    settings = POOL_SETTINGS[name]
+    if hasattr(pool, 'get_stats'):
+        # psycopg3 pool stats - c'est un DICTIONNAIRE !
+        stats = pool.get_stats()
+        return {
+            "pool_size": stats.get("pool_size", "N/A"),           
+            "pool_available": stats.get("pool_available", "N/A"), 
+            "requests_waiting": stats.get("requests_waiting", "N/A"), 
+            "requests_errors": stats.get("requests_errors", 0),   # Saturations (503)
+            "max_size": pool.max_size,
+            "max_waiting": pool.max_waiting,
+            "timeout": f"{pool.timeout:g} secondes",
+            "max_idle": f"{pool.max_idle:g} secondes",
+            "max_lifetime": f"{pool.max_lifetime:g} secondes"
+        }
+    # psycopg2 pool - info basique
+    return {
+        "pool": "active", 
+        "type": "psycopg2",
+        "note": "Stats limitées",
+        "max_size": settings["max_size"]
+    }
+
+
 @app.get("/health")
 def health_check():
     """Vérification de santé de l'API"""
     pool_info = {}
-    if connection_pool:
-        try:
-            if hasattr(connection_pool, 'get_stats'):
-                # psycopg3 pool stats - c'est un DICTIONNAIRE !
-                stats = connection_pool.get_stats()
-                pool_info = {
-                    "pool_size": stats.get("pool_size", "N/A"),           
-                    "pool_available": stats.get("pool_available", "N/A"), 
-                    "requests_waiting": stats.get("requests_waiting", "N/A"), 
-                    "max_idle": "10 secondes",
-                    "max_lifetime": "5 minutes"
-                }
-            else:
-                # psycopg2 pool - info basique
-                pool_info = {
-                    "pool": "active", 
-                    "type": "psycopg2",
-                    "note": "Stats limitées"
-                }
-        except Exception as e:
-            pool_info = {"pool_error": str(e)}
+    if connection_pools:
+        for name, pool in connection_pools.items():
+            try:
+                pool_info[name] = _pool_info(name, pool)
+            except Exception as e:
+                pool_info[name] = {"pool_error": str(e)}
     else:
         pool_info = {"pool": "disabled", "reason": "Pool non initialisé"}
     
+    if async_connection_pools:
+        pool_info["async"] = {name: _pool_info(name, pool) for name, pool in async_connection_pools.items()}
+    
+    if "replica" in connection_pools or "replica" in async_connection_pools:
+        lag = _replica_lag_state["lag"]
+        pool_info["replica_lag"] = {
+            "lag_secondes": round(lag, 3) if lag is not None else None,
+            "max_lag_secondes": DATABASE_REPLICA_MAX_LAG,
+            "lectures_sur_replique": _replica_lag_acceptable()
+        }
+    
+    pool_info["query_budgets"] = {
+        "limites_ms": {name: QUERY_BUDGETS[name] for name in connection_pools},
+        "depassements": query_budget_stats
+    }
+    
     return {
         "status": "healthy", 
         "service": "planning-api",
@@ -606,20 +1953,103 @@ def health_check():
 
 
 
-# ========================================================================
-# ENDPOINTS DE NETTOYAGE COMPLET DE LA BASE DE DONNÉES
-# ========================================================================
+# Compteurs cumulés de psycopg_pool (get_stats) -> compteurs Prometheus (*_ms en secondes).
+# usage_ms n'est pas repris : psycopg_pool ne le mesure que via pool.connection(),
+# la durée d'emprunt est l'histogramme db_pool_usage_seconds.
+POOL_STAT_COUNTERS = (
+    ("requests_num", "db_pool_requests_total", "Demandes de connexion reçues par le pool"),
+    ("requests_queued", "db_pool_requests_queued_total", "Demandes mises en attente faute de connexion libre"),
+    ("requests_errors", "db_pool_requests_errors_total", "Demandes en échec (timeout ou file d'attente pleine, réponses 503)"),
+    ("requests_wait_ms", "db_pool_requests_wait_seconds_total", "Temps d'attente cumulé des demandes mises en attente"),
+    ("returns_bad", "db_pool_returns_bad_total", "Connexions rendues dans un état inutilisable"),
+    ("connections_num", "db_pool_connections_total", "Connexions ouvertes par le pool (reconnexions comprises)"),
+    ("connections_ms", "db_pool_connect_seconds_total", "Temps cumulé d'ouverture des connexions"),
+    ("connections_errors", "db_pool_connection_errors_total", "Tentatives de connexion en échec"),
+    ("connections_lost", "db_pool_connections_lost_total", "Connexions perdues détectées (serveur redémarré, réseau)"),
+)
+
+# Configuration effective des pools psycopg_pool -> jauges Prometheus
+POOL_CONFIG_GAUGES = (
+    ("min_size", "db_pool_min_size", "Taille minimale configurée du pool"),
+    ("max_size", "db_pool_max_size", "Taille maximale configurée du pool"),
+    ("max_waiting", "db_pool_max_waiting", "Demandes en attente acceptées avant rejet immédiat (0 = illimité)"),
+    ("timeout", "db_pool_timeout_seconds", "Attente maximale d'une connexion avant 503"),
+    ("max_idle", "db_pool_max_idle_seconds", "Inactivité au-delà de laquelle une connexion excédentaire est fermée"),
+    ("max_lifetime", "db_pool_max_lifetime_seconds", "Durée de vie maximale d'une connexion"),
+)
+
+def _pools_psycopg3():
+    """(labels, pool) des pools sync et async qui exposent get_stats()"""
+    pools = [({"pool": name, "mode": "sync"}, pool) for name, pool in connection_pools.items()]
+    pools += [({"pool": name, "mode": "async"}, pool) for name, pool in async_connection_pools.items()]
+    return [(labels, pool) for labels, pool in pools if hasattr(pool, "get_stats")]
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Métriques des pools au format Prometheus (dimensionnement des pools et de l'instance)"""
+    pools = [(labels, pool, pool.get_stats()) for labels, pool in _pools_psycopg3()]
+    blocs = [
+        metrics.family("db_pool_size", "gauge", "Connexions ouvertes (empruntées + libres)",
+                       [(labels, stats.get("pool_size", 0)) for labels, pool, stats in pools]),
+        metrics.family("db_pool_idle", "gauge", "Connexions libres dans le pool",
+                       [(labels, stats.get("pool_available", 0)) for labels, pool, stats in pools]),
+        metrics.family("db_pool_in_use", "gauge", "Connexions empruntées",
+                       [(labels, stats.get("pool_size", 0) - stats.get("pool_available", 0)) for labels, pool, stats in pools]),
+        metrics.family("db_pool_requests_waiting", "gauge", "Demandes en attente d'une connexion",
+                       [(labels, stats.get("requests_waiting", 0)) for labels, pool, stats in pools]),
+    ]
+    for attribut, nom, description in POOL_CONFIG_GAUGES:
+        blocs.append(metrics.family(nom, "gauge", description,
+                                    [(labels, getattr(pool, attribut)) for labels, pool, stats in pools]))
+    for cle, nom, description in POOL_STAT_COUNTERS:
+        blocs.append(metrics.family(nom, "counter", description,
+                                    [(labels, stats.get(cle, 0) / 1000 if cle.endswith("_ms") else stats.get(cle, 0))
+                                     for labels, pool, stats in pools]))
+    blocs.append(metrics.family("db_pool_reconnect_failures_total", "counter",
+                                "Reconnexions abandonnées après reconnect_timeout",
+                                [({"pool": name}, count) for name, count in sorted(metrics.pool_reconnect_failures.items())]))
+    blocs += [metrics.POOL_WAIT_SECONDS.render(), metrics.POOL_USAGE_SECONDS.render()]
+    blocs.append(metrics.family("db_query_budget_exceeded_total", "counter",
+                                "Requêtes annulées par PostgreSQL pour dépassement de budget",
+                                [({"setting": setting, "route": route}, count)
+                                 for setting, routes in query_budget_stats.items()
+                                 for route, count in sorted(routes.items())]))
+    if _replica_lag_state["lag"] is not None:
+        blocs.append(metrics.family("db_replica_lag_seconds", "gauge", "Dernier retard de réplication mesuré",
+                                    [({}, float(_replica_lag_state["lag"]))]))
+    return PlainTextResponse(metrics.render(blocs), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    """Disponibilité pour le trafic : 503 tant que le warm-up n'est pas terminé"""
+    if not _warmup_state["ready"]:
+        response.status_code = 503
+        response.headers["Retry-After"] = str(DB_POOL_RETRY_AFTER)
+        return {"status": "warming_up"}
+    return {"status": "ready", "warmup": _warmup_state}
+
+
+@app.get("/admin/prepared-queries")
+def get_prepared_queries_stats():
+    """Compteurs du registre des requêtes préparées (préparations / réutilisations par requête)"""
+    return prepared_queries.get_stats()
+
+
+@app.get("/admin/query-stats")
+def get_query_stats():
+    """Durées cumulées par requête exécutée via database_config.execute_query()"""
+    return database_config.get_query_stats()
+
 
 # ========================================================================
 # ENDPOINTS DE NETTOYAGE COMPLET DE LA BASE DE DONNÉES
 # ========================================================================
 
 @app.delete("/admin/reset-database")
-def reset_complete_database():
+def reset_complete_database(conn=Depends(get_admin_db)):
     """DANGER: Vider complètement toute la base de données - À utiliser avec précaution!"""
-    conn = None
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Liste des tables principales de l'application
@@ -664,19 +2094,13 @@ def reset_complete_database():
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @app.delete("/admin/drop-all-tables") 
-def drop_all_tables():
+def drop_all_tables(conn=Depends(get_admin_db)):
     """DANGER EXTRÊME: Supprimer complètement toutes les tables - Structure ET données!"""
-    conn = None
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Lister toutes les tables existantes
@@ -686,7 +2110,9 @@ def drop_all_tables():
             WHERE schemaname = 'public' 
             AND tablename IN ('chantiers', 'planifications', 'soldes', 'preparateurs', 
                              'disponibilites', 'etiquettes_grille', 'planifications_etiquettes',
-                             'horaires_preparateurs', 'text_templates')
+                             'horaires_preparateurs', 'text_templates', 'chantiers_supprimes',
+                             'verrous_planification', 'chantier_documents', 'versions_tables',
+                             'versions_tables_en_attente')
         """)
         
         existing_tables = [row[0] for row in cur.fetchall()]
@@ -694,8 +2120,9 @@ def drop_all_tables():
         
         # Supprimer les tables dans le bon ordre (dépendances)
         drop_order = [
-            'planifications', 'planifications_etiquettes', 'soldes', 'disponibilites', 
-            'horaires_preparateurs', 'text_templates', 'chantiers', 'etiquettes_grille', 'preparateurs'
+            'planifications', 'planifications_etiquettes', 'soldes', 'verrous_planification', 'disponibilites', 
+            'horaires_preparateurs', 'text_templates', 'chantier_documents', 'chantiers', 'chantiers_supprimes', 'etiquettes_grille', 'preparateurs',
+            'versions_tables', 'versions_tables_en_attente'
         ]
         
         for table in drop_order:
@@ -718,20 +2145,13 @@ def drop_all_tables():
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression des tables: {str(e)}")
-    finally:
-        if conn:
-            close_db_connection(conn)
 
 @app.post("/admin/create-all-tables")
-def create_all_tables():
+def create_all_tables(conn=Depends(get_admin_db)):
     """Créer toutes les tables de l'application"""
-    conn = None
     try:
-        conn = get_db_connection()
-        
         # Créer les tables des chantiers et préparateurs
         ensure_chantiers_tables(conn)
         
@@ -750,6 +2170,9 @@ def create_all_tables():
         else:
             templates_table_created = False
         
+        # Versions des tables (ETag des listes GET), une fois toutes les tables créées
+        ensure_versions_tables(conn)
+        
         # Vérifier que les tables ont bien été créées
         cur = conn.cursor()
         cur.execute("""
@@ -758,7 +2181,8 @@ def create_all_tables():
             WHERE schemaname = 'public' 
             AND tablename IN ('preparateurs', 'chantiers', 'planifications', 'soldes', 
                              'disponibilites', 'horaires_preparateurs',
-                             'etiquettes_grille', 'planifications_etiquettes', 'text_templates')
+                             'etiquettes_grille', 'planifications_etiquettes', 'text_templates',
+                             'chantier_documents', 'versions_tables', 'versions_tables_en_attente')
             ORDER BY tablename
         """)
         
@@ -790,9 +2214,5 @@ def create_all_tables():
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur création des tables: {str(e)}")
-    finally:
-        if conn:
-           close_db_connection(conn)
@@ -0,0 +1,113 @@
+"""
+Métriques Prometheus (format texte d'exposition 0.0.4), sans dépendance externe
+
+Ce module contient :
+- Histogram : histogramme cumulatif thread-safe (buckets, somme, nombre) par
+  combinaison de labels
+- Les histogrammes des pools : attente d'une connexion et durée d'emprunt
+- Les compteurs d'événements de pool que psycopg_pool n'expose pas (échecs de
+  reconnexion)
+- family() / render() : sérialisation des métriques pour GET /metrics
+"""
+
+import math
+import threading
+
+
+class Histogram:
+    """Histogramme Prometheus à buckets fixes (bornes supérieures en secondes)"""
+
+    def __init__(self, name, documentation, buckets, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            serie = self._series.get(labelvalues)
+            if serie is None:
+                serie = self._series[labelvalues] = {"counts": [0] * len(self.buckets), "sum": 0.0}
+            for i, borne in enumerate(self.buckets):
+                if value <= borne:
+                    serie["counts"][i] += 1
+                    break
+            serie["sum"] += value
+
+    def render(self):
+        lignes = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: {"counts": list(s["counts"]), "sum": s["sum"]} for labels, s in self._series.items()}
+        for labelvalues, serie in sorted(series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumul = 0
+            for borne, count in zip(self.buckets, serie["counts"]):
+                cumul += count
+                le = "+Inf" if borne == math.inf else f"{borne:g}"
+                lignes.append(f"{self.name}_bucket{_labels({**labels, 'le': le})} {cumul}")
+            lignes.append(f"{self.name}_sum{_labels(labels)} {_valeur(serie['sum'])}")
+            lignes.append(f"{self.name}_count{_labels(labels)} {cumul}")
+        return "\n".join(lignes)
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{nom}="{_echapper(v)}"' for nom, v in labels.items()) + "}"
+
+
+def _valeur(valeur):
+    if isinstance(valeur, bool):
+        return "1" if valeur else "0"
+    if isinstance(valeur, float):
+        return "+Inf" if valeur == math.inf else repr(valeur)
+    return str(valeur)
+
+
+def family(name, metric_type, documentation, samples):
+    """Famille gauge / counter : samples = liste de (labels dict, valeur)"""
+    lignes = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    lignes += [f"{name}{_labels(labels)} {_valeur(valeur)}" for labels, valeur in samples]
+    return "\n".join(lignes)
+
+
+def render(blocs) -> str:
+    """Corps de la réponse /metrics (une ligne vide finale est attendue par Prometheus)"""
+    return "\n".join(blocs) + "\n"
+
+
+# ========================================================================
+# MÉTRIQUES DES POOLS DE CONNEXIONS
+# ========================================================================
+
+# Attente d'une connexion : de quelques dixièmes de ms (connexion libre) au
+# timeout du pool (10 s pour admin)
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds",
+    "Temps d'attente pour obtenir une connexion du pool",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ("pool", "mode")
+)
+
+# Durée d'emprunt : requête interactive (ms) jusqu'au recalcul admin (minutes)
+POOL_USAGE_SECONDS = Histogram(
+    "db_pool_usage_seconds",
+    "Durée pendant laquelle une connexion reste empruntée au pool",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+    ("pool", "mode")
+)
+
+# Échecs de reconnexion signalés par le callback reconnect_failed de psycopg_pool
+pool_reconnect_failures = {}
+_lock = threading.Lock()
+
+
+def record_reconnect_failure(pool_name):
+    with _lock:
+        pool_reconnect_failures[pool_name] = pool_reconnect_failures.get(pool_name, 0) + 1
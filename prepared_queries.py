@@ -0,0 +1,542 @@
+"""
+Registre central des requêtes chaudes, préparées côté serveur
+
+Ce module contient :
+- Le registre des requêtes nommées et paramétrées les plus fréquentes
+  (agrégation /chantiers, lectures du calcul des disponibilités,
+  vérifications d'existence des verrous de planification...)
+- L'exécution avec préparation serveur (psycopg3 prepare=True) : chaque requête
+  est parsée et planifiée une seule fois par connexion du pool, puis réutilisée
+- Les compteurs par requête (préparations / réutilisations) exposés par
+  GET /admin/prepared-queries
+- Le warm-up : exécution à vide des requêtes de lecture au démarrage, pour que
+  chaque connexion du pool soit déjà préparée avant le premier utilisateur
+
+DB_PREPARED_STATEMENTS=false désactive la préparation (ex: PgBouncer en mode
+transaction, où une connexion serveur n'est pas attachée au client).
+"""
+
+import os
+import threading
+from datetime import date
+from weakref import WeakKeyDictionary
+
+
+PREPARED_STATEMENTS_ENABLED = os.environ.get("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes", "on")
+
+# ========================================================================
+# REGISTRE DES REQUÊTES CHAUDES
+# ========================================================================
+
+QUERIES = {
+    # GET /chantiers : chaque table enfant est agrégée séparément (une ligne par
+    # chantier) avant la jointure. Joindre planifications, soldes et verrous
+    # ensemble produisait planifs x soldes x verrous lignes par chantier avant
+    # json_object_agg, avec des clés dupliquées dans chaque objet.
+    "chantiers_liste": """
+        WITH planifs AS (
+            SELECT chantier_id, json_object_agg(semaine, minutes ORDER BY semaine) AS planification
+            FROM planifications
+            GROUP BY chantier_id
+        ),
+        soldes_agg AS (
+            SELECT chantier_id, json_object_agg(semaine, minutes ORDER BY semaine) AS soldes
+            FROM soldes
+            GROUP BY chantier_id
+        ),
+        verrous AS (
+            SELECT chantier_id,
+                   json_object_agg(
+                       semaine,
+                       json_build_object('preparateur', preparateur_nom, 'minutes', minutes)
+                       ORDER BY semaine
+                   ) AS forcedPlanningLock
+            FROM verrous_planification
+            GROUP BY chantier_id
+        )
+        SELECT
+            c.id,
+            c.label,
+            c.status,
+            c.prepTime,
+            c.endDate,
+            c.preparateur_nom,
+            c.ChargeRestante,
+            COALESCE(p.planification, '{}'::json) as planification,
+            COALESCE(s.soldes, '{}'::json) as soldes,
+            COALESCE(v.forcedPlanningLock, '{}'::json) as forcedPlanningLock
+        FROM chantiers c
+        LEFT JOIN planifs p ON p.chantier_id = c.id
+        LEFT JOIN soldes_agg s ON s.chantier_id = c.id
+        LEFT JOIN verrous v ON v.chantier_id = c.id
+        ORDER BY c.id
+    """,
+
+    # GET /chantiers : documents tenus à jour par les triggers de
+    # ensure_chantiers_tables, lus sans agrégation. chantiers_liste reste la
+    # lecture de repli tant que la table n'est pas créée.
+    "chantiers_documents": """
+        SELECT chantier_id, document
+        FROM chantier_documents
+        ORDER BY chantier_id
+    """,
+
+    # Corps JSON complets construits par PostgreSQL (DB_JSON_SQL_ENABLED) : même
+    # texte compact, mêmes ordres de clés que la sérialisation FastAPI des dict
+    # construits par les routes. Les documents sont déjà compacts.
+    "chantiers_json": """
+        SELECT COALESCE(
+            '{' || string_agg(to_json(chantier_id)::text || ':' || document::text, ',' ORDER BY chantier_id) || '}',
+            '{}'
+        )
+        FROM chantier_documents
+    """,
+
+    "disponibilites_json": """
+        WITH par_preparateur AS (
+            SELECT preparateur_nom,
+                   '{' || string_agg(
+                       to_json(semaine)::text || ':{"minutes":' || minutes ||
+                       ',"updatedAt":' || COALESCE(to_json(updatedAt)::text, 'null') || '}',
+                       ',' ORDER BY semaine
+                   ) || '}' AS semaines
+            FROM disponibilites
+            GROUP BY preparateur_nom
+        )
+        SELECT '{"data":' || COALESCE(
+            '{' || string_agg(to_json(preparateur_nom)::text || ':' || semaines, ',' ORDER BY preparateur_nom) || '}',
+            '{}'
+        ) || '}'
+        FROM par_preparateur
+    """,
+
+    # Les 7 jours sont toujours présents ; heures au format str(datetime.time)
+    "horaires_json": """
+        WITH creneaux AS (
+            SELECT preparateur_nom, jour_semaine,
+                   '[' || string_agg(
+                       '{"debut":' || to_json(to_char(heure_debut, CASE WHEN mod(date_part('microseconds', heure_debut)::int, 1000000) = 0
+                                                                       THEN 'HH24:MI:SS' ELSE 'HH24:MI:SS.US' END))::text ||
+                       ',"fin":' || to_json(to_char(heure_fin, CASE WHEN mod(date_part('microseconds', heure_fin)::int, 1000000) = 0
+                                                                   THEN 'HH24:MI:SS' ELSE 'HH24:MI:SS.US' END))::text || '}',
+                       ',' ORDER BY heure_debut
+                   ) || ']' AS liste
+            FROM horaires_preparateurs
+            GROUP BY preparateur_nom, jour_semaine
+        ),
+        par_preparateur AS (
+            SELECT p.preparateur_nom,
+                   '{' || string_agg(to_json(j.jour)::text || ':' || COALESCE(c.liste, '[]'), ',' ORDER BY j.ordre) || '}' AS jours
+            FROM (SELECT DISTINCT preparateur_nom FROM horaires_preparateurs) p
+            CROSS JOIN (VALUES (1, 'lundi'), (2, 'mardi'), (3, 'mercredi'), (4, 'jeudi'),
+                               (5, 'vendredi'), (6, 'samedi'), (7, 'dimanche')) AS j(ordre, jour)
+            LEFT JOIN creneaux c ON c.preparateur_nom = p.preparateur_nom AND c.jour_semaine = j.jour
+            GROUP BY p.preparateur_nom
+        )
+        SELECT COALESCE(
+            '{' || string_agg(to_json(preparateur_nom)::text || ':' || jours, ',' ORDER BY preparateur_nom) || '}',
+            '{}'
+        )
+        FROM par_preparateur
+    """,
+
+    # Paramètre : libellé "status" de la réponse. Dates au format isoformat() Python.
+    "etiquettes_grille_json": """
+        WITH etiquettes AS (
+            SELECT
+                e.created_at,
+                '{"id":' || e.id ||
+                ',"type_activite":' || to_json(e.type_activite)::text ||
+                ',"description":' || COALESCE(to_json(e.description)::text, 'null') ||
+                ',"group_id":' || COALESCE(to_json(e.group_id)::text, 'null') ||
+                ',"texte":' || to_json(COALESCE(e.texte, ''))::text ||
+                ',"created_at":' || COALESCE(to_json(
+                    to_char(e.created_at, 'YYYY-MM-DD"T"HH24:MI:SS') ||
+                    CASE WHEN mod(date_part('microseconds', e.created_at)::int, 1000000) = 0 THEN '' ELSE to_char(e.created_at, '.US') END ||
+                    to_char(e.created_at, 'TZH:TZM'))::text, 'null') ||
+                ',"updated_at":' || COALESCE(to_json(
+                    to_char(e.updated_at, 'YYYY-MM-DD"T"HH24:MI:SS') ||
+                    CASE WHEN mod(date_part('microseconds', e.updated_at)::int, 1000000) = 0 THEN '' ELSE to_char(e.updated_at, '.US') END ||
+                    to_char(e.updated_at, 'TZH:TZM'))::text, 'null') ||
+                ',"planifications":' || COALESCE(
+                    '[' || string_agg(
+                        '{"id":' || p.id ||
+                        ',"date_jour":' || to_json(p.date_jour::text)::text ||
+                        ',"heure_debut":' || to_json(p.heure_debut::text)::text ||
+                        ',"heure_fin":' || to_json(p.heure_fin::text)::text ||
+                        ',"preparateurs":' || to_json(p.preparateurs)::text || '}',
+                        ',' ORDER BY p.date_jour ASC, p.heure_debut ASC
+                    ) || ']',
+                    '[]'
+                ) || '}' AS document
+            FROM etiquettes_grille e
+            LEFT JOIN planifications_etiquettes p ON e.id = p.etiquette_id
+            GROUP BY e.id
+        )
+        SELECT '{"status":' || to_json(%s::text)::text ||
+               ',"count":' || count(*) ||
+               ',"etiquettes":' || COALESCE('[' || string_agg(document, ',' ORDER BY created_at DESC) || ']', '[]') || '}'
+        FROM etiquettes
+    """,
+
+    # GET /chantiers?since=<jeton> : le jeton est le plus petit xid encore en
+    # cours au moment de la lecture. Toute transaction non visible par la lecture
+    # a un xid >= jeton : la synchronisation suivante la rattrapera.
+    "jeton_changements": "SELECT pg_snapshot_xmin(pg_current_snapshot())::text",
+
+    "chantiers_supprimes_depuis": """
+        SELECT id
+        FROM chantiers_supprimes
+        WHERE change_xid >= %s::xid8
+        ORDER BY id
+    """,
+
+    # ETag des listes GET : versions des tables lues (main.verifier_etag)
+    "versions_tables": """
+        SELECT table_name, version::text
+        FROM versions_tables
+        WHERE table_name = ANY(%s)
+    """,
+
+    # Vérification d'existence avant toute opération sur les verrous
+    "chantier_existe": "SELECT id FROM chantiers WHERE id = %s",
+
+    "verrous_chantier": """
+        SELECT semaine, preparateur_nom, minutes
+        FROM verrous_planification
+        WHERE chantier_id = %s
+        ORDER BY semaine
+    """,
+
+    "verrous_supprimer_chantier": "DELETE FROM verrous_planification WHERE chantier_id = %s",
+
+    # Remplacement des verrous d'un ou plusieurs chantiers en une instruction
+    # (tableaux unnest) : les semaines absentes sont supprimées, seules les
+    # semaines nouvelles ou modifiées sont écrites. Chantiers inconnus ignorés
+    # (vérifiés par chantier_existe ou chantiers_inconnus).
+    # Retourne (supprimés, insérés, mis à jour).
+    "verrous_synchroniser": """
+        WITH cibles AS (
+            SELECT DISTINCT d.chantier_id FROM unnest(%s::varchar[]) AS d(chantier_id)
+        ),
+        entree AS (
+            SELECT l.chantier_id, l.semaine, l.preparateur_nom, l.minutes
+            FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::integer[])
+                AS l(chantier_id, semaine, preparateur_nom, minutes)
+        ),
+        supprimes AS (
+            DELETE FROM verrous_planification v
+            USING cibles d
+            WHERE v.chantier_id = d.chantier_id
+            AND NOT EXISTS (
+                SELECT 1 FROM entree e
+                WHERE e.chantier_id = v.chantier_id AND e.semaine = v.semaine
+            )
+            RETURNING 1
+        ),
+        ecrits AS (
+            INSERT INTO verrous_planification (chantier_id, semaine, preparateur_nom, minutes)
+            SELECT e.chantier_id, e.semaine, e.preparateur_nom, e.minutes
+            FROM entree e
+            WHERE EXISTS (SELECT 1 FROM chantiers c WHERE c.id = e.chantier_id)
+            ON CONFLICT (chantier_id, semaine)
+            DO UPDATE SET preparateur_nom = EXCLUDED.preparateur_nom, minutes = EXCLUDED.minutes
+            WHERE (verrous_planification.preparateur_nom, verrous_planification.minutes)
+                IS DISTINCT FROM (EXCLUDED.preparateur_nom, EXCLUDED.minutes)
+            RETURNING (verrous_planification.xmax = 0) AS insere
+        )
+        SELECT
+            (SELECT count(*) FROM supprimes),
+            count(*) FILTER (WHERE insere),
+            count(*) FILTER (WHERE NOT insere)
+        FROM ecrits
+    """,
+
+    # PUT /chantiers/bulk : objets partiels en un seul document JSON. Un champ
+    # absent ou null conserve la valeur en base (même règle que
+    # PUT /chantiers/{id}). Les chantiers inconnus et ceux dont le préparateur
+    # n'existe pas sont ignorés sans faire échouer le lot : une ligne de
+    # résultat par chantier demandé, avec son résultat.
+    "chantiers_bulk_patch": """
+        WITH entree AS (
+            SELECT e.*
+            FROM jsonb_to_recordset(%s::jsonb) AS e(
+                id VARCHAR(255), label VARCHAR(500), status VARCHAR(100), "prepTime" INTEGER,
+                "endDate" VARCHAR(50), preparateur VARCHAR(255), "ChargeRestante" INTEGER
+            )
+        ),
+        modifies AS (
+            UPDATE chantiers c SET
+                label = COALESCE(e.label, c.label),
+                status = COALESCE(e.status, c.status),
+                prepTime = COALESCE(e."prepTime", c.prepTime),
+                endDate = COALESCE(e."endDate", c.endDate),
+                preparateur_nom = COALESCE(e.preparateur, c.preparateur_nom),
+                ChargeRestante = COALESCE(e."ChargeRestante", c.ChargeRestante),
+                updated_at = CURRENT_TIMESTAMP
+            FROM entree e
+            WHERE c.id = e.id
+            AND num_nonnulls(e.label, e.status, e."prepTime", e."endDate", e.preparateur, e."ChargeRestante") > 0
+            AND (e.preparateur IS NULL OR EXISTS (SELECT 1 FROM preparateurs p WHERE p.nom = e.preparateur))
+            RETURNING c.id, c.label, c.status
+        )
+        SELECT
+            e.id,
+            CASE
+                WHEN m.id IS NOT NULL THEN 'updated'
+                WHEN NOT EXISTS (SELECT 1 FROM chantiers c WHERE c.id = e.id) THEN 'not_found'
+                WHEN num_nonnulls(e.label, e.status, e."prepTime", e."endDate", e.preparateur, e."ChargeRestante") = 0 THEN 'no_changes'
+                ELSE 'unknown_preparateur'
+            END,
+            m.label,
+            m.status
+        FROM entree e
+        LEFT JOIN modifies m ON m.id = e.id
+    """,
+
+    # PUT /planification et PUT /planification/bulk : un tableau par colonne
+    # (unnest), même règle preserve_past pour tous les chantiers à la fois
+    "chantiers_inconnus": """
+        SELECT COALESCE(array_agg(i.id ORDER BY i.id), '{}')
+        FROM unnest(%s::varchar[]) AS i(id)
+        WHERE NOT EXISTS (SELECT 1 FROM chantiers c WHERE c.id = i.id)
+    """,
+
+    # Écriture différentielle en une instruction : seules les semaines absentes
+    # de la nouvelle carte sont supprimées (dans le périmètre preserve_past),
+    # seules les semaines nouvelles ou dont les minutes changent sont écrites.
+    # Les lignes inchangées ne produisent ni nouvelle version ni WAL.
+    # Suppression et upsert portent sur des semaines disjointes.
+    # Chantiers inconnus ignorés ici (pas d'erreur de clé étrangère qui
+    # masquerait le résultat de chantiers_inconnus dans le pipeline).
+    # Retourne (supprimées, insérées, mises à jour).
+    "planification_fusionner": """
+        WITH cibles AS (
+            SELECT d.chantier_id, d.preserve_past
+            FROM unnest(%s::varchar[], %s::boolean[]) AS d(chantier_id, preserve_past)
+        ),
+        entree AS (
+            SELECT l.chantier_id, l.semaine, l.minutes
+            FROM unnest(%s::varchar[], %s::varchar[], %s::integer[]) AS l(chantier_id, semaine, minutes)
+        ),
+        supprimees AS (
+            DELETE FROM planifications p
+            USING cibles d
+            WHERE p.chantier_id = d.chantier_id
+            AND (NOT d.preserve_past OR p.semaine >= %s)
+            AND NOT EXISTS (
+                SELECT 1 FROM entree e
+                WHERE e.chantier_id = p.chantier_id AND e.semaine = p.semaine
+            )
+            RETURNING 1
+        ),
+        ecrites AS (
+            INSERT INTO planifications (chantier_id, semaine, minutes)
+            SELECT e.chantier_id, e.semaine, e.minutes
+            FROM entree e
+            WHERE EXISTS (SELECT 1 FROM chantiers c WHERE c.id = e.chantier_id)
+            ON CONFLICT (chantier_id, semaine)
+            DO UPDATE SET minutes = EXCLUDED.minutes
+            WHERE planifications.minutes IS DISTINCT FROM EXCLUDED.minutes
+            RETURNING (planifications.xmax = 0) AS inseree
+        )
+        SELECT
+            (SELECT count(*) FROM supprimees),
+            count(*) FILTER (WHERE inseree),
+            count(*) FILTER (WHERE NOT inseree)
+        FROM ecrites
+    """,
+
+    # GET /disponibilites
+    "disponibilites_liste": """
+        SELECT preparateur_nom, semaine, minutes, updatedAt
+        FROM disponibilites
+        ORDER BY preparateur_nom, semaine
+    """,
+
+    # calculer_disponibilites_preparateur : horaires puis étiquettes de la semaine
+    "horaires_preparateur": """
+        SELECT jour_semaine, heure_debut, heure_fin
+        FROM horaires_preparateurs
+        WHERE preparateur_nom = %s
+        ORDER BY CASE jour_semaine
+                     WHEN 'lundi' THEN 1 WHEN 'mardi' THEN 2 WHEN 'mercredi' THEN 3
+                     WHEN 'jeudi' THEN 4 WHEN 'vendredi' THEN 5 WHEN 'samedi' THEN 6
+                     WHEN 'dimanche' THEN 7
+                 END,
+                 heure_debut
+    """,
+
+    "etiquettes_semaine_preparateur": """
+        SELECT p.date_jour, p.heure_debut, p.heure_fin, p.preparateurs,
+               e.type_activite, e.description
+        FROM planifications_etiquettes p
+        INNER JOIN etiquettes_grille e ON p.etiquette_id = e.id
+        WHERE p.date_jour BETWEEN %s AND %s
+        AND p.preparateurs LIKE %s
+    """,
+
+    # GET /etiquettes-grille : étiquettes + planifications agrégées en JSON
+    "etiquettes_grille_liste": """
+        SELECT
+            e.id,
+            e.type_activite,
+            e.description,
+            e.group_id,
+            e.texte,              -- ← AJOUT de la colonne texte
+            e.created_at,
+            e.updated_at,
+            -- Agrégation des planifications en JSON
+            COALESCE(
+                json_agg(
+                    json_build_object(
+                        'id', p.id,
+                        'date_jour', p.date_jour::text,
+                        'heure_debut', p.heure_debut::text,
+                        'heure_fin', p.heure_fin::text,
+                        'preparateurs', p.preparateurs
+                    ) ORDER BY p.date_jour ASC, p.heure_debut ASC
+                ) FILTER (WHERE p.id IS NOT NULL),
+                '[]'::json
+            ) as planifications_json
+        FROM etiquettes_grille e
+        LEFT JOIN planifications_etiquettes p ON e.id = p.etiquette_id
+        GROUP BY e.id, e.type_activite, e.description, e.group_id, e.texte, e.created_at, e.updated_at  -- ← AJOUT dans GROUP BY
+        ORDER BY e.created_at DESC
+    """,
+}
+
+# Paramètres neutres des requêtes de lecture exécutées au warm-up : seuls la
+# préparation et les caches comptent, pas le résultat. Les types doivent être
+# ceux des appels réels (la préparation psycopg3 dépend des types des paramètres).
+WARMUP_PARAMS = {
+    "chantiers_liste": None,
+    "chantiers_documents": None,
+    "chantiers_json": None,
+    "disponibilites_json": None,
+    "horaires_json": None,
+    "etiquettes_grille_json": ("",),
+    "jeton_changements": None,
+    "versions_tables": (["chantiers"],),
+    "chantier_existe": ("",),
+    "verrous_chantier": ("",),
+    "disponibilites_liste": None,
+    "horaires_preparateur": ("",),
+    "etiquettes_semaine_preparateur": (date(1970, 1, 5), date(1970, 1, 11), "%"),
+    "etiquettes_grille_liste": None,
+}
+
+# ========================================================================
+# SUIVI DES PRÉPARATIONS PAR CONNEXION
+# ========================================================================
+
+# Connexion -> noms des requêtes déjà préparées sur cette session serveur.
+# Les connexions fermées/recyclées par le pool disparaissent d'elles-mêmes.
+_prepared_by_conn = WeakKeyDictionary()
+_stats = {name: {"prepares": 0, "hits": 0, "unprepared": 0} for name in QUERIES}
+_lock = threading.Lock()
+
+
+def register(name: str, sql: str):
+    """Ajouter une requête chaude au registre"""
+    with _lock:
+        QUERIES[name] = sql
+        _stats.setdefault(name, {"prepares": 0, "hits": 0, "unprepared": 0})
+
+
+def sql(name: str) -> str:
+    """Texte SQL d'une requête du registre"""
+    return QUERIES[name]
+
+
+def _supports_prepare(cur) -> bool:
+    # psycopg3 uniquement : les curseurs psycopg2 n'ont pas d'argument prepare
+    return PREPARED_STATEMENTS_ENABLED and not type(cur).__module__.startswith("psycopg2")
+
+
+def _record(cur, name: str, prepare: bool):
+    """Compter une exécution : préparation sur cette connexion ou réutilisation"""
+    with _lock:
+        stats = _stats[name]
+        if not prepare:
+            stats["unprepared"] += 1
+            return
+        prepared = _prepared_by_conn.setdefault(cur.connection, set())
+        if name in prepared:
+            stats["hits"] += 1
+        else:
+            prepared.add(name)
+            stats["prepares"] += 1
+
+
+def execute(cur, name: str, params=None):
+    """Exécuter une requête du registre, préparée côté serveur une fois par connexion"""
+    prepare = _supports_prepare(cur)
+    if prepare:
+        cur.execute(QUERIES[name], params, prepare=True)
+    else:
+        cur.execute(QUERIES[name], params)
+    _record(cur, name, prepare)
+    return cur
+
+
+async def execute_async(cur, name: str, params=None):
+    """Équivalent asyncio de execute() (curseur psycopg3 AsyncCursor)"""
+    prepare = PREPARED_STATEMENTS_ENABLED
+    await cur.execute(QUERIES[name], params, prepare=prepare)
+    _record(cur, name, prepare)
+    return cur
+
+
+def warmup(conn) -> dict:
+    """Exécuter chaque requête de lecture du registre sur une connexion
+
+    Retourne {nom: "ok" | message d'erreur}. Une table absente (base neuve)
+    n'interrompt pas le warm-up : la transaction est annulée et on continue.
+    """
+    resultats = {}
+    cur = conn.cursor()
+    for name, params in WARMUP_PARAMS.items():
+        try:
+            execute(cur, name, params)
+            cur.fetchall()
+            resultats[name] = "ok"
+        except Exception as e:
+            conn.rollback()
+            resultats[name] = str(e).splitlines()[0]
+    conn.rollback()
+    return resultats
+
+
+async def warmup_async(conn) -> dict:
+    """Équivalent asyncio de warmup() (connexion psycopg3 AsyncConnection)"""
+    resultats = {}
+    cur = conn.cursor()
+    for name, params in WARMUP_PARAMS.items():
+        try:
+            await execute_async(cur, name, params)
+            await cur.fetchall()
+            resultats[name] = "ok"
+        except Exception as e:
+            await conn.rollback()
+            resultats[name] = str(e).splitlines()[0]
+    await conn.rollback()
+    return resultats
+
+
+def get_stats() -> dict:
+    """Compteurs par requête : préparations, réutilisations et taux de réutilisation"""
+    with _lock:
+        requetes = {}
+        for name, stats in _stats.items():
+            executions = stats["prepares"] + stats["hits"] + stats["unprepared"]
+            requetes[name] = {
+                **stats,
+                "executions": executions,
+                "hit_ratio": round(stats["hits"] / executions, 3) if executions else None
+            }
+        return {
+            "enabled": PREPARED_STATEMENTS_ENABLED,
+            "connections_tracked": len(_prepared_by_conn),
+            "queries": requetes
+        }
@@ -0,0 +1,106 @@
+"""Fixtures communes : l'API contre une vraie base PostgreSQL
+
+Les tests utilisent la base de DATABASE_URL (et DATABASE_SSLMODE, comme
+l'application) ; sans DATABASE_URL ils sont tous ignorés. Ils n'écrivent que
+des chantiers et préparateurs préfixés TEST-, supprimés après chaque test :
+utiliser une base de développement, jamais la production.
+
+Usage :
+    DATABASE_URL=postgresql://... python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PREFIXE = "TEST-"
+PREPARATEUR = PREFIXE + "Preparateur"
+
+# Semaines toujours avant / après la semaine courante (périmètre preserve_past)
+SEMAINE_PASSEE = "2001-W01"
+SEMAINE_FUTURE = "2999-W10"
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("DATABASE_URL"):
+        return
+    ignorer = pytest.mark.skip(reason="DATABASE_URL non définie : tests sur base PostgreSQL ignorés")
+    for item in items:
+        item.add_marker(ignorer)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Client HTTP de l'application : tables créées, warm-up terminé"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as c:
+        limite = time.monotonic() + 30
+        while c.get("/ready").status_code != 200:
+            if time.monotonic() > limite:
+                pytest.fail("Warm-up de l'application non terminé après 30 s")
+            time.sleep(0.1)
+        assert c.post("/admin/create-all-tables").status_code == 200
+        yield c
+
+
+@pytest.fixture(scope="session")
+def db(client):
+    """Connexion directe (autocommit) pour préparer et vérifier l'état de la base"""
+    import psycopg
+
+    with psycopg.connect(os.environ["DATABASE_URL"], sslmode=os.environ.get("DATABASE_SSLMODE", "require"),
+                         autocommit=True) as conn:
+        yield conn
+
+
+def _nettoyer(db):
+    # planifications, soldes et verrous suivent par ON DELETE CASCADE
+    db.execute("DELETE FROM chantiers WHERE id LIKE %s", (PREFIXE + "%",))
+    db.execute("DELETE FROM preparateurs WHERE nom LIKE %s", (PREFIXE + "%",))
+
+
+@pytest.fixture
+def chantiers(db):
+    """Trois chantiers de test vides : TEST-1, TEST-2, TEST-3"""
+    _nettoyer(db)
+    ids = [f"{PREFIXE}{i}" for i in range(1, 4)]
+    for chantier_id in ids:
+        db.execute(
+            "INSERT INTO chantiers (id, label, status, prepTime, ChargeRestante) VALUES (%s, %s, 'Nouveau', 60, 60)",
+            (chantier_id, f"Chantier {chantier_id}")
+        )
+    yield ids
+    _nettoyer(db)
+
+
+@pytest.fixture
+def planifications(db):
+    """Lire la planification d'un chantier : {semaine: minutes}"""
+    def lire(chantier_id):
+        return dict(db.execute(
+            "SELECT semaine, minutes FROM planifications WHERE chantier_id = %s", (chantier_id,)
+        ).fetchall())
+    return lire
+
+
+@pytest.fixture
+def preparateur(db, chantiers):
+    """Préparateur de test TEST-Preparateur (supprimé avec les chantiers de test)"""
+    db.execute("INSERT INTO preparateurs (nom, nni) VALUES (%s, 'TEST')", (PREPARATEUR,))
+    return PREPARATEUR
+
+
+@pytest.fixture
+def lire_chantier(db):
+    """Lire les colonnes modifiables d'un chantier (None s'il n'existe pas)"""
+    def lire(chantier_id):
+        return db.execute(
+            "SELECT label, status, prepTime, endDate, preparateur_nom, ChargeRestante FROM chantiers WHERE id = %s",
+            (chantier_id,)
+        ).fetchone()
+    return lire
@@ -0,0 +1,107 @@
+"""PUT /chantiers/bulk : mise à jour partielle de plusieurs chantiers (chantiers_bulk_patch)"""
+import pytest
+
+from conftest import PREFIXE
+
+
+def test_resultat_par_objet(client, chantiers, lire_chantier, preparateur):
+    avant = {i: lire_chantier(i) for i in chantiers}
+
+    r = client.put("/chantiers/bulk", json={"chantiers": [
+        {"id": chantiers[0], "label": "Modifié", "prepTime": 42},
+        {"id": PREFIXE + "INCONNU-1", "label": "x"},
+        {"id": chantiers[1], "status": "Terminé", "preparateur": preparateur},
+        {"id": chantiers[2], "preparateur": PREFIXE + "Fantome", "label": "Jamais écrit"},
+        {"id": PREFIXE + "INCONNU-2"},
+    ]})
+
+    assert r.status_code == 200, r.text
+    resultat = r.json()
+    assert resultat["updated"] == 2
+    assert resultat["not_found"] == [PREFIXE + "INCONNU-1", PREFIXE + "INCONNU-2"]
+    assert [x["result"] for x in resultat["results"]] == [
+        "updated", "not_found", "updated", "unknown_preparateur", "not_found"
+    ]
+    # Seuls les champs envoyés changent
+    assert lire_chantier(chantiers[0]) == ("Modifié", avant[chantiers[0]][1], 42) + avant[chantiers[0]][3:]
+    assert lire_chantier(chantiers[1]) == (
+        avant[chantiers[1]][0], "Terminé", *avant[chantiers[1]][2:4], preparateur, avant[chantiers[1]][5]
+    )
+    # Préparateur inconnu : l'objet entier est ignoré
+    assert lire_chantier(chantiers[2]) == avant[chantiers[2]]
+
+
+def test_objet_sans_champ(client, db, chantiers):
+    xmin = db.execute("SELECT xmin::text FROM chantiers WHERE id = %s", (chantiers[0],)).fetchone()[0]
+
+    r = client.put("/chantiers/bulk", json={"chantiers": [{"id": chantiers[0]}]})
+
+    assert r.status_code == 200, r.text
+    assert [x["result"] for x in r.json()["results"]] == ["no_changes"]
+    assert db.execute("SELECT xmin::text FROM chantiers WHERE id = %s", (chantiers[0],)).fetchone()[0] == xmin
+
+
+def test_id_en_double(client, chantiers, lire_chantier):
+    avant = lire_chantier(chantiers[0])
+
+    r = client.put("/chantiers/bulk", json={"chantiers": [
+        {"id": chantiers[0], "label": "a"}, {"id": chantiers[0], "label": "b"}
+    ]})
+
+    assert r.status_code == 400
+    assert lire_chantier(chantiers[0]) == avant
+
+
+@pytest.mark.parametrize("champ, valeur", [
+    # Types JSON
+    ("prepTime", "10"),
+    ("prepTime", True),
+    ("prepTime", 1.5),
+    ("ChargeRestante", [1]),
+    ("label", 3),
+    ("status", {"nom": "Terminé"}),
+    # Valeurs que les colonnes ne peuvent pas contenir (INTEGER, VARCHAR(n))
+    ("prepTime", 2**40),
+    ("ChargeRestante", -2**31 - 1),
+    ("label", "x" * 501),
+    ("status", "x" * 101),
+    ("endDate", "x" * 51),
+    ("preparateur", "x" * 256),
+])
+def test_champ_refuse_avant_la_base(client, chantiers, lire_chantier, champ, valeur):
+    avant = lire_chantier(chantiers[1])
+
+    r = client.put("/chantiers/bulk", json={"chantiers": [
+        {"id": chantiers[1], "label": "Jamais écrit"}, {"id": chantiers[0], champ: valeur}
+    ]})
+
+    assert r.status_code == 400, r.text
+    assert champ in r.json()["detail"]
+    assert lire_chantier(chantiers[1]) == avant
+
+
+def test_bornes_des_colonnes_acceptees(client, chantiers, lire_chantier):
+    r = client.put("/chantiers/bulk", json={"chantiers": [
+        {"id": chantiers[0], "label": "x" * 500, "prepTime": 2**31 - 1, "ChargeRestante": -2**31}
+    ]})
+
+    assert r.status_code == 200, r.text
+    label, _, prep_time, _, _, charge_restante = lire_chantier(chantiers[0])
+    assert (label, prep_time, charge_restante) == ("x" * 500, 2**31 - 1, -2**31)
+
+
+@pytest.mark.parametrize("objets", [
+    [],
+    [{"label": "sans id"}],
+    [{"id": {"id": "TEST-1"}}],
+    [{"id": "x" * 256, "label": "a"}],
+])
+def test_liste_ou_id_invalide(client, chantiers, objets):
+    assert client.put("/chantiers/bulk", json={"chantiers": objets}).status_code == 400
+
+
+def test_identique_a_l_appel_unitaire(client, chantiers, lire_chantier):
+    assert client.put(f"/chantiers/{chantiers[0]}", json={"label": "Même", "prepTime": 7}).status_code == 200
+    assert client.put("/chantiers/bulk", json={"chantiers": [{"id": chantiers[1], "label": "Même", "prepTime": 7}]}).status_code == 200
+
+    assert lire_chantier(chantiers[0]) == lire_chantier(chantiers[1])
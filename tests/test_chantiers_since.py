@@ -0,0 +1,33 @@
+"""GET /chantiers?since=<jeton> : écritures des tables enfants et updated_at du chantier"""
+from conftest import SEMAINE_FUTURE
+
+
+def _jeton(client):
+    r = client.get("/chantiers")
+    assert r.status_code == 200, r.text
+    return r.headers["X-Change-Token"]
+
+
+def _updated_at(db, chantier_id):
+    return db.execute("SELECT updated_at FROM chantiers WHERE id = %s", (chantier_id,)).fetchone()[0]
+
+
+def test_verrou_dans_le_delta_sans_toucher_updated_at(client, db, chantiers):
+    jeton = _jeton(client)
+    avant = _updated_at(db, chantiers[0])
+
+    r = client.put(f"/chantiers/{chantiers[0]}/forced-planning-lock",
+                   json={"forced_planning_lock": {SEMAINE_FUTURE: {"preparateur": "A", "minutes": 30}}})
+    assert r.status_code == 200, r.text
+
+    delta = client.get("/chantiers", params={"since": jeton}).json()
+    assert list(delta["chantiers"]) == [chantiers[0]]
+    assert _updated_at(db, chantiers[0]) == avant
+
+
+def test_modification_du_chantier_change_updated_at(client, db, chantiers):
+    avant = _updated_at(db, chantiers[0])
+
+    db.execute("UPDATE chantiers SET status = 'En cours' WHERE id = %s", (chantiers[0],))
+
+    assert _updated_at(db, chantiers[0]) > avant
@@ -0,0 +1,106 @@
+"""PUT /planification/bulk : plusieurs chantiers en une transaction"""
+import pytest
+
+from conftest import SEMAINE_FUTURE, SEMAINE_PASSEE
+
+
+def _initialiser(client, ids):
+    corps = {"chantiers": [
+        {"chantier_id": i, "planifications": {SEMAINE_PASSEE: 11, SEMAINE_FUTURE: 22}, "preserve_past": False}
+        for i in ids
+    ]}
+    r = client.put("/planification/bulk", json=corps)
+    assert r.status_code == 200, r.text
+
+
+def test_regle_preserve_past_par_chantier(client, chantiers, planifications):
+    _initialiser(client, chantiers)
+
+    r = client.put("/planification/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "planifications": {SEMAINE_FUTURE: 5}},
+        {"chantier_id": chantiers[1], "planifications": {"2999-W20": 7}, "preserve_past": False},
+        {"chantier_id": chantiers[2], "planifications": {}},
+    ]})
+
+    assert r.status_code == 200, r.text
+    assert (r.json()["chantiers"], r.json()["preservation"], r.json()["legacy"]) == (3, 2, 1)
+    # preserve_past : seules les semaines >= semaine courante sont remplacées
+    assert planifications(chantiers[0]) == {SEMAINE_PASSEE: 11, SEMAINE_FUTURE: 5}
+    assert planifications(chantiers[1]) == {"2999-W20": 7}
+    assert planifications(chantiers[2]) == {SEMAINE_PASSEE: 11}
+
+
+def test_identique_aux_appels_unitaires(client, chantiers, planifications):
+    corps = [
+        {"chantier_id": chantiers[0], "planifications": {SEMAINE_FUTURE: 5, "2999-W11": 0}},
+        {"chantier_id": chantiers[1], "planifications": {"2999-W20": 7}, "preserve_past": False},
+    ]
+    _initialiser(client, chantiers)
+    for planif in corps:
+        assert client.put("/planification", json=planif).status_code == 200
+    attendu = {i: planifications(i) for i in chantiers}
+
+    _initialiser(client, chantiers)
+    assert client.put("/planification/bulk", json={"chantiers": corps}).status_code == 200
+
+    assert {i: planifications(i) for i in chantiers} == attendu
+
+
+def test_chantier_inconnu_annule_tout_le_lot(client, chantiers, planifications):
+    _initialiser(client, chantiers)
+
+    r = client.put("/planification/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "planifications": {}, "preserve_past": False},
+        {"chantier_id": "TEST-INCONNU", "planifications": {SEMAINE_FUTURE: 1}},
+    ]})
+
+    assert r.status_code == 404
+    assert "TEST-INCONNU" in r.json()["detail"]
+    assert planifications(chantiers[0]) == {SEMAINE_PASSEE: 11, SEMAINE_FUTURE: 22}
+
+
+@pytest.mark.parametrize("minutes", ["10", None, {}, 1.5, True])
+def test_minutes_non_entieres(client, chantiers, minutes):
+    corps = {"chantiers": [{"chantier_id": chantiers[0], "planifications": {SEMAINE_FUTURE: minutes}}]}
+
+    assert client.put("/planification/bulk", json=corps).status_code == 400
+    assert client.put("/planification", json=corps["chantiers"][0]).status_code == 400
+
+
+@pytest.mark.parametrize("corps", [
+    {},
+    {"chantiers": []},
+    {"chantiers": {"TEST-1": {}}},
+    {"chantiers": ["TEST-1"]},
+    {"chantiers": [{"planifications": {}}]},
+    {"chantiers": [{"chantier_id": {"id": 1}}]},
+    {"chantiers": [{"chantier_id": "TEST-1", "planifications": []}]},
+])
+def test_liste_ou_element_mal_forme(client, chantiers, corps):
+    assert client.put("/planification/bulk", json=corps).status_code == 400
+
+
+def test_preserve_past_texte_refuse_pour_un_element(client, chantiers, planifications):
+    _initialiser(client, chantiers)
+
+    r = client.put("/planification/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "planifications": {SEMAINE_FUTURE: 1}, "preserve_past": False},
+        {"chantier_id": chantiers[1], "planifications": {SEMAINE_FUTURE: 1}, "preserve_past": "false"},
+    ]})
+
+    assert r.status_code == 400
+    assert chantiers[1] in r.json()["detail"]
+    assert planifications(chantiers[0]) == {SEMAINE_PASSEE: 11, SEMAINE_FUTURE: 22}
+    assert planifications(chantiers[1]) == {SEMAINE_PASSEE: 11, SEMAINE_FUTURE: 22}
+
+
+def test_chantier_en_double(client, chantiers, planifications):
+    _initialiser(client, chantiers)
+
+    r = client.put("/planification/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "planifications": {}},
+        {"chantier_id": chantiers[0], "planifications": {SEMAINE_FUTURE: 1}},
+    ]})
+
+    assert r.status_code == 400
+    assert planifications(chantiers[0]) == {SEMAINE_PASSEE: 11, SEMAINE_FUTURE: 22}
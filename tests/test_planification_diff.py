@@ -0,0 +1,113 @@
+"""PUT /planification : écriture différentielle (planification_fusionner)"""
+import pytest
+
+from conftest import SEMAINE_FUTURE, SEMAINE_PASSEE
+
+AUTRE_SEMAINE = "2999-W11"
+
+
+def _versions_lignes(db, chantier_id):
+    """xmin par semaine : change si et seulement si la ligne a été réécrite"""
+    return dict(db.execute(
+        "SELECT semaine, xmin::text FROM planifications WHERE chantier_id = %s", (chantier_id,)
+    ).fetchall())
+
+
+def _mettre_a_jour(client, chantier_id, planifs, preserve_past=True):
+    r = client.put("/planification", json={
+        "chantier_id": chantier_id, "planifications": planifs, "preserve_past": preserve_past
+    })
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _comptes(resultat):
+    return {cle: resultat[cle] for cle in ("inserted_new", "updated", "unchanged", "deleted_future")}
+
+
+def test_comptes_insertion_mise_a_jour_suppression(client, chantiers, planifications):
+    chantier_id = chantiers[0]
+    resultat = _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 10, AUTRE_SEMAINE: 20})
+    assert _comptes(resultat) == {"inserted_new": 2, "updated": 0, "unchanged": 0, "deleted_future": 0}
+
+    resultat = _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 10, "2999-W12": 30})
+
+    assert _comptes(resultat) == {"inserted_new": 1, "updated": 0, "unchanged": 1, "deleted_future": 1}
+    assert planifications(chantier_id) == {SEMAINE_FUTURE: 10, "2999-W12": 30}
+
+    resultat = _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 15, "2999-W12": 0})
+
+    assert _comptes(resultat) == {"inserted_new": 0, "updated": 1, "unchanged": 0, "deleted_future": 1}
+    assert planifications(chantier_id) == {SEMAINE_FUTURE: 15}
+
+
+def test_semaines_inchangees_non_reecrites(client, db, chantiers):
+    chantier_id = chantiers[0]
+    _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 10, AUTRE_SEMAINE: 20})
+    avant = _versions_lignes(db, chantier_id)
+
+    _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 10, AUTRE_SEMAINE: 25})
+
+    apres = _versions_lignes(db, chantier_id)
+    assert apres[SEMAINE_FUTURE] == avant[SEMAINE_FUTURE]
+    assert apres[AUTRE_SEMAINE] != avant[AUTRE_SEMAINE]
+
+
+def test_renvoi_identique_sans_ecriture(client, db, chantiers):
+    chantier_id = chantiers[0]
+    planifs = {SEMAINE_PASSEE: 5, SEMAINE_FUTURE: 10}
+    _mettre_a_jour(client, chantier_id, planifs, preserve_past=False)
+    avant = _versions_lignes(db, chantier_id)
+
+    resultat = _mettre_a_jour(client, chantier_id, planifs, preserve_past=False)
+
+    assert _comptes(resultat) == {"inserted_new": 0, "updated": 0, "unchanged": 2, "deleted_future": 0}
+    assert _versions_lignes(db, chantier_id) == avant
+
+
+def test_perimetre_preserve_past(client, chantiers, planifications):
+    chantier_id = chantiers[0]
+    _mettre_a_jour(client, chantier_id, {SEMAINE_PASSEE: 5, SEMAINE_FUTURE: 10}, preserve_past=False)
+
+    # preserve_past : une semaine passée absente du corps est conservée
+    resultat = _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 10})
+    assert resultat["mode"] == "preservation" and resultat["deleted_future"] == 0
+    assert planifications(chantier_id) == {SEMAINE_PASSEE: 5, SEMAINE_FUTURE: 10}
+
+    # legacy : tout l'historique est remplacé
+    resultat = _mettre_a_jour(client, chantier_id, {SEMAINE_FUTURE: 10}, preserve_past=False)
+    assert resultat["mode"] == "legacy" and resultat["deleted_future"] == 1
+    assert planifications(chantier_id) == {SEMAINE_FUTURE: 10}
+
+
+def test_chantier_inconnu(client, chantiers):
+    r = client.put("/planification", json={"chantier_id": "TEST-INCONNU", "planifications": {SEMAINE_FUTURE: 1}})
+
+    assert r.status_code == 404
+
+
+@pytest.mark.parametrize("corps", [
+    {"chantier_id": "TEST-1", "planifications": [[SEMAINE_FUTURE, 10]]},
+    {"chantier_id": "TEST-1", "planifications": None},
+    {"chantier_id": {"id": "TEST-1"}, "planifications": {SEMAINE_FUTURE: 10}},
+    {"chantier_id": "", "planifications": {SEMAINE_FUTURE: 10}},
+    {"planifications": {SEMAINE_FUTURE: 10}},
+])
+def test_forme_du_corps(client, chantiers, planifications, corps):
+    r = client.put("/planification", json=corps)
+
+    assert r.status_code == 400, r.text
+    assert planifications(chantiers[0]) == {}
+
+
+@pytest.mark.parametrize("preserve_past", ["false", 0, None, "true"])
+def test_preserve_past_non_booleen_refuse(client, chantiers, planifications, preserve_past):
+    _mettre_a_jour(client, chantiers[0], {SEMAINE_PASSEE: 5, SEMAINE_FUTURE: 10}, preserve_past=False)
+
+    r = client.put("/planification", json={
+        "chantier_id": chantiers[0], "planifications": {SEMAINE_FUTURE: 1}, "preserve_past": preserve_past
+    })
+
+    # "false" n'est pas False : pas de bascule silencieuse en mode preservation
+    assert r.status_code == 400, r.text
+    assert planifications(chantiers[0]) == {SEMAINE_PASSEE: 5, SEMAINE_FUTURE: 10}
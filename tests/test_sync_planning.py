@@ -0,0 +1,125 @@
+"""PUT /sync-planning : synchronisation complète via tables de staging (COPY)"""
+import pytest
+
+from conftest import PREFIXE, PREPARATEUR, SEMAINE_FUTURE
+
+
+@pytest.fixture
+def disponible(db, preparateur):
+    """Le préparateur de test, avec une disponibilité déjà en base"""
+    db.execute(
+        "INSERT INTO disponibilites (preparateur_nom, semaine, minutes, updatedAt) VALUES (%s, '2999-W01', 99, 'avant')",
+        (preparateur,)
+    )
+    return preparateur
+
+
+def _disponibilites(db, nom):
+    return {semaine: (minutes, maj) for semaine, minutes, maj in db.execute(
+        "SELECT semaine, minutes, updatedAt FROM disponibilites WHERE preparateur_nom = %s", (nom,)
+    ).fetchall()}
+
+
+def _synchroniser(client, corps):
+    r = client.put("/sync-planning", json=corps)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_champs_et_planifications_des_chantiers_envoyes(client, db, lire_chantier, chantiers, preparateur, planifications):
+    db.execute("INSERT INTO planifications (chantier_id, semaine, minutes) VALUES (%s, %s, 40)", (chantiers[1], SEMAINE_FUTURE))
+    db.execute("INSERT INTO planifications (chantier_id, semaine, minutes) VALUES (%s, %s, 50)", (chantiers[2], SEMAINE_FUTURE))
+
+    resultat = _synchroniser(client, {"chantiers": {
+        chantiers[0]: {"label": "Tab\t et \\ et\nligne", "status": "En cours", "prepTime": 120, "endDate": "2999-01-01",
+                       "preparateur": preparateur, "ChargeRestante": 30,
+                       "planification": {SEMAINE_FUTURE: 10, "2999-W11": 0}},
+        chantiers[1]: {"label": "Sans planification", "planification": {SEMAINE_FUTURE: 0}},
+    }})
+
+    assert resultat["chantiers_updated"] == 2
+    assert resultat["planifications_inserted"] == 1
+    # Les caractères spéciaux du format COPY passent tels quels
+    assert lire_chantier(chantiers[0]) == ("Tab\t et \\ et\nligne", "En cours", 120, "2999-01-01", preparateur, 30)
+    assert planifications(chantiers[0]) == {SEMAINE_FUTURE: 10}
+    # Chantier sans minute > 0 envoyée, ou absent du corps : planification conservée
+    assert planifications(chantiers[1]) == {SEMAINE_FUTURE: 40}
+    assert planifications(chantiers[2]) == {SEMAINE_FUTURE: 50}
+
+
+def test_chantier_inconnu_ignore(client, lire_chantier, chantiers, planifications):
+    _synchroniser(client, {"chantiers": {
+        chantiers[0]: {"label": "Connu", "planification": {SEMAINE_FUTURE: 5}},
+        PREFIXE + "INCONNU": {"label": "Inconnu"},
+    }})
+
+    assert lire_chantier(chantiers[0])[0] == "Connu"
+    assert planifications(chantiers[0]) == {SEMAINE_FUTURE: 5}
+    assert lire_chantier(PREFIXE + "INCONNU") is None
+
+
+def test_disponibilites_remplacees_par_preparateur(client, db, disponible):
+    resultat = _synchroniser(client, {"data": {disponible: {
+        SEMAINE_FUTURE: {"minutes": 30, "updatedAt": "apres"},
+        "2999-W11": 15,
+        "2999-W12": {"minutes": 0, "updatedAt": "apres"},
+    }}})
+
+    assert resultat["disponibilites_inserted"] == 2
+    assert _disponibilites(db, disponible) == {SEMAINE_FUTURE: (30, "apres"), "2999-W11": (15, "")}
+
+
+@pytest.mark.parametrize("inconnu", [
+    {"chantiers": {PREFIXE + "INCONNU": {"planification": {SEMAINE_FUTURE: 5}}}},
+    {"data": {PREFIXE + "INCONNU": {SEMAINE_FUTURE: 5}}},
+])
+def test_echec_annule_toute_la_synchronisation(client, db, lire_chantier, chantiers, disponible, planifications, inconnu):
+    # Planification ou disponibilité sans chantier / préparateur : clé étrangère violée
+    avant = (lire_chantier(chantiers[0]), _disponibilites(db, disponible))
+    corps = {
+        "chantiers": {chantiers[0]: {"label": "Jamais écrit", "planification": {SEMAINE_FUTURE: 5}}},
+        "data": {disponible: {SEMAINE_FUTURE: 5}},
+    }
+    for cle, valeurs in inconnu.items():
+        corps[cle].update(valeurs)
+
+    r = client.put("/sync-planning", json=corps)
+
+    assert r.status_code == 500
+    assert (lire_chantier(chantiers[0]), _disponibilites(db, disponible)) == avant
+    assert planifications(chantiers[0]) == {}
+
+
+def test_corps_vide(client, chantiers):
+    resultat = _synchroniser(client, {})
+
+    assert (resultat["chantiers_updated"], resultat["planifications_inserted"], resultat["disponibilites_inserted"]) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("corps", [
+    {"chantiers": ["TEST-1"]},
+    {"data": None},
+    {"chantiers": {"TEST-1": "Chantier"}},
+    {"chantiers": {"TEST-1": {"label": None}}},
+    {"chantiers": {"TEST-1": {"prepTime": "60"}}},
+    {"chantiers": {"TEST-1": {"ChargeRestante": 2**40}}},
+    {"chantiers": {"TEST-1": {"status": "x" * 101}}},
+    {"chantiers": {"TEST-1": {"planification": [SEMAINE_FUTURE]}}},
+    {"chantiers": {"TEST-1": {"planification": {SEMAINE_FUTURE: "10"}}}},
+    {"chantiers": {"TEST-1": {"planification": {SEMAINE_FUTURE: None}}}},
+    {"chantiers": {"TEST-1": {"planification": {SEMAINE_FUTURE: 1.5}}}},
+    {"data": {PREPARATEUR: [5]}},
+    {"data": {PREPARATEUR: {SEMAINE_FUTURE: "5"}}},
+    {"data": {PREPARATEUR: {SEMAINE_FUTURE: {"minutes": None}}}},
+    {"data": {PREPARATEUR: {SEMAINE_FUTURE: {"minutes": 5, "updatedAt": 2026}}}},
+])
+def test_types_refuses_avant_le_staging(client, db, lire_chantier, chantiers, disponible, planifications, corps):
+    avant = (lire_chantier(chantiers[0]), _disponibilites(db, disponible))
+    # Un chantier valide dans le même corps n'est pas écrit non plus
+    corps = {"chantiers": {chantiers[1]: {"label": "Jamais écrit", "planification": {SEMAINE_FUTURE: 5}}}, **corps}
+
+    r = client.put("/sync-planning", json=corps)
+
+    assert r.status_code == 400, r.text
+    assert (lire_chantier(chantiers[0]), _disponibilites(db, disponible)) == avant
+    assert planifications(chantiers[1]) == {}
@@ -0,0 +1,129 @@
+"""PUT /forced-planning-lock/bulk : verrous de plusieurs chantiers (verrous_synchroniser)"""
+import pytest
+
+from conftest import SEMAINE_FUTURE
+
+VERROUS = {
+    SEMAINE_FUTURE: {"preparateur": "A", "minutes": 60},
+    "2999-W11": 30,
+    "2999-W12": {"preparateur": "B", "minutes": 0},
+}
+
+
+def _verrous(client, chantier_id):
+    r = client.get(f"/chantiers/{chantier_id}/forced-planning-lock")
+    assert r.status_code == 200, r.text
+    return r.json()["forced_planning_lock"]
+
+
+def _verrouiller(client, chantiers):
+    r = client.put("/forced-planning-lock/bulk", json={"chantiers": chantiers})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_comptes_et_contenu(client, chantiers):
+    resultat = _verrouiller(client, [{"chantier_id": chantiers[0], "forced_planning_lock": VERROUS}])
+    assert (resultat["verrous"], resultat["inserted"], resultat["unchanged"], resultat["deleted"]) == (2, 2, 0, 0)
+    # Minutes à 0 ignorées, entier seul = verrou sans préparateur
+    assert _verrous(client, chantiers[0]) == {
+        SEMAINE_FUTURE: {"preparateur": "A", "minutes": 60},
+        "2999-W11": {"preparateur": "", "minutes": 30},
+    }
+
+    resultat = _verrouiller(client, [
+        {"chantier_id": chantiers[0], "forced_planning_lock": {SEMAINE_FUTURE: {"preparateur": "A", "minutes": 60}, "2999-W13": 10}},
+        {"chantier_id": chantiers[1], "forced_planning_lock": {"2999-W14": {"preparateur": "C", "minutes": 15}}},
+        {"chantier_id": chantiers[2], "forced_planning_lock": {}},
+    ])
+
+    assert (resultat["verrous"], resultat["inserted"], resultat["unchanged"], resultat["deleted"]) == (3, 2, 1, 1)
+    assert _verrous(client, chantiers[0]) == {
+        SEMAINE_FUTURE: {"preparateur": "A", "minutes": 60},
+        "2999-W13": {"preparateur": "", "minutes": 10},
+    }
+    assert _verrous(client, chantiers[1]) == {"2999-W14": {"preparateur": "C", "minutes": 15}}
+    assert _verrous(client, chantiers[2]) == {}
+
+
+def test_identique_aux_appels_unitaires(client, chantiers):
+    r = client.put("/forced-planning-lock", json={"chantier_id": chantiers[0], "forced_planning_lock": VERROUS})
+    assert r.status_code == 200, r.text
+    _verrouiller(client, [{"chantier_id": chantiers[1], "forced_planning_lock": VERROUS}])
+
+    assert _verrous(client, chantiers[0]) == _verrous(client, chantiers[1])
+
+
+def test_chantiers_inconnus_annulent_tout_le_lot(client, chantiers):
+    _verrouiller(client, [{"chantier_id": chantiers[0], "forced_planning_lock": VERROUS}])
+    avant = _verrous(client, chantiers[0])
+
+    r = client.put("/forced-planning-lock/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "forced_planning_lock": {}},
+        {"chantier_id": "TEST-INCONNU-1"},
+        {"chantier_id": "TEST-INCONNU-2"},
+    ]})
+
+    assert r.status_code == 404
+    assert "TEST-INCONNU-1, TEST-INCONNU-2" in r.json()["detail"]
+    assert _verrous(client, chantiers[0]) == avant
+
+
+def test_chantier_en_double(client, chantiers):
+    _verrouiller(client, [{"chantier_id": chantiers[0], "forced_planning_lock": VERROUS}])
+    avant = _verrous(client, chantiers[0])
+
+    r = client.put("/forced-planning-lock/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "forced_planning_lock": {}},
+        {"chantier_id": chantiers[0], "forced_planning_lock": {SEMAINE_FUTURE: 5}},
+    ]})
+
+    assert r.status_code == 400
+    assert _verrous(client, chantiers[0]) == avant
+
+
+@pytest.mark.parametrize("element", [
+    {"chantier_id": {"id": "TEST-1"}},
+    {"chantier_id": ["TEST-1"]},
+    {"chantier_id": ""},
+    {"chantier_id": "TEST-2", "forced_planning_lock": [SEMAINE_FUTURE]},
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: {"preparateur": "A", "minutes": "10"}}},
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: "10"}},
+    # 1.7 serait arrondi à 2 par PostgreSQL
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: {"preparateur": "A", "minutes": 1.7}}},
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: True}},
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: 2**40}},
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: {"preparateur": None, "minutes": 10}}},
+    {"chantier_id": "TEST-2", "forced_planning_lock": {SEMAINE_FUTURE: {"preparateur": 7, "minutes": 10}}},
+])
+def test_element_invalide_400_sans_ecriture(client, chantiers, element):
+    _verrouiller(client, [{"chantier_id": chantiers[0], "forced_planning_lock": VERROUS}])
+    avant = _verrous(client, chantiers[0])
+
+    r = client.put("/forced-planning-lock/bulk", json={"chantiers": [
+        {"chantier_id": chantiers[0], "forced_planning_lock": {}}, element
+    ]})
+
+    assert r.status_code == 400, r.text
+    assert _verrous(client, chantiers[0]) == avant
+    assert _verrous(client, chantiers[1]) == {}
+
+
+@pytest.mark.parametrize("forced_planning_lock", [
+    [SEMAINE_FUTURE],
+    {SEMAINE_FUTURE: {"preparateur": "A", "minutes": "10"}},
+    {SEMAINE_FUTURE: {"preparateur": None, "minutes": 10}},
+])
+def test_routes_unitaires_memes_regles(client, chantiers, forced_planning_lock):
+    corps = {"chantier_id": chantiers[0], "forced_planning_lock": forced_planning_lock}
+
+    assert client.put("/forced-planning-lock", json=corps).status_code == 400
+    assert client.post("/forced-planning-lock", json=corps).status_code == 400
+    assert client.put(f"/chantiers/{chantiers[0]}/forced-planning-lock", json=corps).status_code == 400
+    assert client.put("/forced-planning-lock", json={**corps, "chantier_id": {"id": 1}}).status_code == 400
+    assert _verrous(client, chantiers[0]) == {}
+
+
+@pytest.mark.parametrize("corps", [{}, {"chantiers": []}, {"chantiers": {"TEST-1": {}}}])
+def test_liste_absente_ou_vide(client, chantiers, corps):
+    assert client.put("/forced-planning-lock/bulk", json=corps).status_code == 400
@@ -7,10 +7,12 @@ Ce module contient toutes les routes relatives à :
 - L'intégration avec le système d'étiquettes existant
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from typing import Dict, Optional, Any, List
 from datetime import datetime
-from main import get_db_connection, close_db_connection
+from database_config import execute_query
+from main import verifier_etag, get_read_db, get_readonly_db, get_write_db, get_admin_db
+from grille_semaine_routes import fields_etiquettes, requete_etiquettes_projetees, etiquettes_projetees
 
 # Créer le router pour les routes de texte d'étiquettes
 router = APIRouter(
@@ -107,23 +109,21 @@ def ensure_etiquettes_texte_column(conn):
 # ========================================================================
 
 @router.get("/text-templates")
-def get_all_templates():
+def get_all_templates(request: Request, response: Response, conn=Depends(get_readonly_db)):
     """Récupérer tous les templates de texte disponibles"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
+        non_modifie = verifier_etag(request, response, conn, ("text_templates",))
+        if non_modifie:
+            return non_modifie
         
-        cursor = conn.cursor()
-        cursor.execute("""
+        rows = execute_query("""
             SELECT id, name, content, description, created_at, updated_at 
             FROM text_templates 
             ORDER BY name
-        """)
+        """, fetch="all", conn=conn)
         
         templates = []
-        for row in cursor.fetchall():
+        for row in rows:
             templates.append({
                 'id': row[0],
                 'name': row[1],
@@ -139,26 +139,17 @@ def get_all_templates():
     except Exception as e:
         print(f"❌ Erreur lors de la récupération de tous les templates: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.get("/text-templates/{template_id}")
-def get_template_by_id(template_id: int):
+def get_template_by_id(template_id: int, conn=Depends(get_readonly_db)):
     """Récupérer un template spécifique par son ID"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
-        
-        cursor = conn.cursor()
-        cursor.execute("""
+        row = execute_query("""
             SELECT id, name, content, description, created_at, updated_at 
             FROM text_templates 
             WHERE id = %s
-        """, (template_id,))
-        
-        row = cursor.fetchone()
+        """, (template_id,), fetch="one", conn=conn)
+
         if not row:
             raise HTTPException(status_code=404, detail="Template non trouvé")
         
@@ -177,24 +168,16 @@ def get_template_by_id(template_id: int):
     except Exception as e:
         print(f"❌ Erreur lors de la récupération du template {template_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.post("/text-templates")
-def create_template(template_data: Dict[str, Any]):
+def create_template(template_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Créer un nouveau template de texte"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     # Validation des données
     if not template_data.get('name') or not template_data.get('content'):
         raise HTTPException(status_code=400, detail="Le nom et le contenu sont obligatoires")
     
     try:
-        
-        cursor = conn.cursor()
-        cursor.execute("""
+        template_id = execute_query("""
             INSERT INTO text_templates (name, content, description, updated_at) 
             VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
             RETURNING id
@@ -202,10 +185,7 @@ def create_template(template_data: Dict[str, Any]):
             template_data['name'],
             template_data['content'],
             template_data.get('description', '')
-        ))
-        
-        template_id = cursor.fetchone()[0]
-        conn.commit()
+        ), fetch="scalar", conn=conn, commit=True)
         
         print(f"Template '{template_data['name']}' créé avec l'ID {template_id}")
         return {
@@ -215,33 +195,22 @@ def create_template(template_data: Dict[str, Any]):
         }
         
     except Exception as e:
-        conn.rollback()
         print(f"❌ Erreur lors de la création du template: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.put("/text-templates/{template_id}")
-def update_template(template_id: int, template_data: Dict[str, Any]):
+def update_template(template_id: int, template_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour un template existant"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     # Validation des données
     if not template_data.get('name') or not template_data.get('content'):
         raise HTTPException(status_code=400, detail="Le nom et le contenu sont obligatoires")
     
     try:
-       
-        cursor = conn.cursor()
-        
         # Vérifier que le template existe
-        cursor.execute("SELECT id FROM text_templates WHERE id = %s", (template_id,))
-        if not cursor.fetchone():
+        if not execute_query("SELECT id FROM text_templates WHERE id = %s", (template_id,), fetch="one", conn=conn):
             raise HTTPException(status_code=404, detail="Template non trouvé")
         
-        cursor.execute("""
+        execute_query("""
             UPDATE text_templates 
             SET name = %s, content = %s, description = %s, updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
@@ -250,66 +219,41 @@ def update_template(template_id: int, template_data: Dict[str, Any]):
             template_data['content'],
             template_data.get('description', ''),
             template_id
-        ))
-        
-        conn.commit()
+        ), conn=conn, commit=True)
         
         print(f"Template {template_id} mis à jour")
         return {"success": True, "message": "Template mis à jour avec succès"}
         
     except Exception as e:
-        conn.rollback()
         print(f"❌ Erreur lors de la mise à jour du template: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.delete("/text-templates/{template_id}")
-def delete_template(template_id: int):
+def delete_template(template_id: int, conn=Depends(get_write_db)):
     """Supprimer un template"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
-        
-        cursor = conn.cursor()
-        
         # Vérifier que le template existe
-        cursor.execute("SELECT id FROM text_templates WHERE id = %s", (template_id,))
-        if not cursor.fetchone():
+        if not execute_query("SELECT id FROM text_templates WHERE id = %s", (template_id,), fetch="one", conn=conn):
             raise HTTPException(status_code=404, detail="Template non trouvé")
         
-        cursor.execute("DELETE FROM text_templates WHERE id = %s", (template_id,))
-        conn.commit()
+        execute_query("DELETE FROM text_templates WHERE id = %s", (template_id,), conn=conn, commit=True)
         
         print(f"Template {template_id} supprimé")
         return {"success": True, "message": "Template supprimé avec succès"}
         
     except Exception as e:
-        conn.rollback()
         print(f"❌ Erreur lors de la suppression du template: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 # ========================================================================
 #  GESTION DU TEXTE DES ÉTIQUETTES
 # ========================================================================
 
 @router.get("/etiquettes-grille/{etiquette_id}/texte")
-def get_etiquette_texte(etiquette_id: int):
+def get_etiquette_texte(etiquette_id: int, conn=Depends(get_read_db)):
     """Récupérer le contenu textuel d'une étiquette de grille"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT texte FROM etiquettes_grille WHERE id = %s", (etiquette_id,))
-        
-        row = cursor.fetchone()
+        row = execute_query("SELECT texte FROM etiquettes_grille WHERE id = %s", (etiquette_id,), fetch="one", conn=conn)
         if not row:
             raise HTTPException(status_code=404, detail="Étiquette non trouvée")
         
@@ -319,52 +263,32 @@ def get_etiquette_texte(etiquette_id: int):
     except Exception as e:
         print(f"❌ Erreur lors de la récupération du texte de l'étiquette {etiquette_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.put("/etiquettes-grille/{etiquette_id}/texte")
-def update_etiquette_texte(etiquette_id: int, texte_data: Dict[str, Any]):
+def update_etiquette_texte(etiquette_id: int, texte_data: Dict[str, Any], conn=Depends(get_write_db)):
     """Mettre à jour le contenu textuel d'une étiquette de grille"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
-        
-        cursor = conn.cursor()
-        
         # Vérifier que l'étiquette existe
-        cursor.execute("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,))
-        if not cursor.fetchone():
+        if not execute_query("SELECT id FROM etiquettes_grille WHERE id = %s", (etiquette_id,), fetch="one", conn=conn):
             raise HTTPException(status_code=404, detail="Étiquette non trouvée")
         
-        cursor.execute("""
+        execute_query("""
             UPDATE etiquettes_grille 
             SET texte = %s, updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (texte_data.get('texte', ''), etiquette_id))
-        
-        conn.commit()
+        """, (texte_data.get('texte', ''), etiquette_id), conn=conn, commit=True)
         
         print(f"Texte de l'étiquette {etiquette_id} mis à jour")
         return {"success": True, "message": "Texte de l'étiquette mis à jour avec succès"}
         
     except Exception as e:
-        conn.rollback()
         print(f"❌ Erreur lors de la mise à jour du texte de l'étiquette: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.post("/etiquettes-grille/{etiquette_id}/apply-template/{template_id}")
-def apply_template_to_etiquette(etiquette_id: int, template_id: int):
+def apply_template_to_etiquette(etiquette_id: int, template_id: int, conn=Depends(get_write_db)):
     """Appliquer un template à une étiquette de grille (remplace le texte existant)"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
-        
         cursor = conn.cursor()
         
         # Vérifier que l'étiquette existe
@@ -398,23 +322,29 @@ def apply_template_to_etiquette(etiquette_id: int, template_id: int):
         conn.rollback()
         print(f"❌ Erreur lors de l'application du template: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 # ========================================================================
 #  ENDPOINTS UTILITAIRES
 # ========================================================================
 
 @router.get("/etiquettes-grille-with-text")
-def get_etiquettes_with_text():
-    """Récupérer toutes les étiquettes de grille avec leur contenu textuel et planifications (OPTIMISÉ)"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
+def get_etiquettes_with_text(champs=Depends(fields_etiquettes), conn=Depends(get_read_db)):
+    """Récupérer toutes les étiquettes de grille avec leur contenu textuel et planifications (OPTIMISÉ)
+
+    `fields` restreint chaque étiquette aux champs demandés (projection SQL
+    partagée avec GET /etiquettes-grille).
+    """
     try:
-        
         cursor = conn.cursor()
+        if champs is not None:
+            cursor.execute(requete_etiquettes_projetees(champs))
+            etiquettes = etiquettes_projetees(champs, cursor.fetchall())
+            return {
+                "success": True,
+                "count": len(etiquettes),
+                "data": etiquettes
+            }
+        
         # ✅ OPTIMISATION : Requête unique avec agrégation JSON (comme grille_semaine_routes.py)
         cursor.execute("""
             SELECT 
@@ -467,20 +397,14 @@ def get_etiquettes_with_text():
     except Exception as e:
         print(f"❌ Erreur lors de la récupération des étiquettes avec texte: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 # ========================================================================
 #  GESTION INDÉPENDANTE DES TEMPLATES (ADMIN)
 # ========================================================================
 
 @router.post("/admin/init-templates-table")
-def init_templates_table():
+def init_templates_table(conn=Depends(get_admin_db)):
     """ADMIN: Créer/initialiser UNIQUEMENT la table des templates"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
         ensure_text_templates_table(conn)
         
@@ -503,16 +427,10 @@ def init_templates_table():
     except Exception as e:
         print(f"❌ Erreur lors de la création de la table des templates: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.get("/admin/templates-status")
-def get_templates_status():
+def get_templates_status(conn=Depends(get_admin_db)):
     """ADMIN: Vérifier UNIQUEMENT le statut des templates"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
         cursor = conn.cursor()
         
@@ -548,20 +466,14 @@ def get_templates_status():
     except Exception as e:
         print(f"❌ Erreur lors de la vérification du statut des templates: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 # ========================================================================
 #  GESTION INDÉPENDANTE DU TEXTE D'ÉTIQUETTES (ADMIN)
 # ========================================================================
 
 @router.post("/admin/init-etiquettes-texte-column")
-def init_etiquettes_texte_column():
+def init_etiquettes_texte_column(conn=Depends(get_admin_db)):
     """ADMIN: Ajouter UNIQUEMENT la colonne texte aux étiquettes"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
         ensure_etiquettes_texte_column(conn)
         
@@ -587,16 +499,10 @@ def init_etiquettes_texte_column():
     except Exception as e:
         print(f"❌ Erreur lors de l'ajout de la colonne texte aux étiquettes: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)
 
 @router.get("/admin/etiquettes-texte-status")
-def get_etiquettes_texte_status():
+def get_etiquettes_texte_status(conn=Depends(get_admin_db)):
     """ADMIN: Vérifier UNIQUEMENT le statut du texte des étiquettes"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Erreur de connexion à la base de données")
-    
     try:
         cursor = conn.cursor()
         
@@ -638,5 +544,3 @@ def get_etiquettes_texte_status():
     except Exception as e:
         print(f"❌ Erreur lors de la vérification du statut texte étiquettes: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-    finally:
-        close_db_connection(conn)